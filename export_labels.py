@@ -0,0 +1,7 @@
+# export_labels.py
+
+import sys
+from src.batch_export import main
+
+if __name__ == '__main__':
+    sys.exit(main())
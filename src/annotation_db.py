@@ -0,0 +1,176 @@
+import json
+import sqlite3
+import threading
+import time
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    video_path TEXT PRIMARY KEY,
+    video_hash TEXT,
+    version INTEGER NOT NULL,
+    updated REAL NOT NULL,
+    longest REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS annotations (
+    video_path TEXT NOT NULL,
+    id TEXT NOT NULL,
+    start_time REAL NOT NULL,
+    end_time REAL NOT NULL,
+    record TEXT NOT NULL,
+    PRIMARY KEY (video_path, id)
+);
+CREATE INDEX IF NOT EXISTS annotations_start ON annotations (video_path, start_time);
+"""
+
+
+class AnnotationDatabase:
+    """
+    SQLite storage of annotation sessions, one row per annotation.
+
+    Rows hold the start/end times (indexed per video by start) and the
+    record as JSON text. The database runs in WAL mode and every write is a
+    single transaction that upserts the changed records and deletes the
+    removed ones, so a crash loses at most the write in progress. Sessions
+    of all videos stay queryable without loading them into memory: each
+    session keeps an upper bound on its longest annotation, which limits the
+    index range that point and overlap queries scan even when rows overlap.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(_SCHEMA)
+        columns = [row[1] for row in self._connection.execute("PRAGMA table_info(sessions)")]
+        if "longest" not in columns:
+            with self._connection:
+                self._connection.execute("ALTER TABLE sessions ADD COLUMN longest REAL NOT NULL DEFAULT 0")
+                self._connection.execute(
+                    "UPDATE sessions SET longest = COALESCE((SELECT MAX(end_time - start_time) FROM annotations "
+                    "WHERE annotations.video_path = sessions.video_path), 0)")
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def write(self, video_path, records, video_hash=0, version=2, changes=None):
+        """
+        Store records as the session of video_path in one transaction.
+
+        changes is the list of journal operations from the last written
+        records to these; without it (first write of a session) the stored
+        rows are replaced.
+        """
+        with self._lock, self._connection:
+            connection = self._connection
+            connection.execute(
+                "INSERT INTO sessions (video_path, video_hash, version, updated) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(video_path) DO UPDATE SET video_hash=excluded.video_hash, "
+                "version=excluded.version, updated=excluded.updated",
+                (video_path, json.dumps(video_hash), version, time.time()))
+            if changes is None:
+                connection.execute("DELETE FROM annotations WHERE video_path = ?", (video_path,))
+                upserts = records
+                deletes = ()
+            else:
+                by_id = {record["id"]: record for record in records}
+                upserts = {}
+                deletes = []
+                for op in changes:
+                    if op["op"] == "delete":
+                        deletes.append(op["id"])
+                    else:
+                        annotation_id = op["record"]["id"] if "record" in op else op["id"]
+                        upserts[annotation_id] = by_id[annotation_id]
+                upserts = upserts.values()
+            connection.executemany("DELETE FROM annotations WHERE video_path = ? AND id = ?",
+                                   [(video_path, annotation_id) for annotation_id in deletes])
+            rows = self._rows(video_path, upserts)
+            connection.executemany("INSERT OR REPLACE INTO annotations (video_path, id, start_time, end_time, record) "
+                                   "VALUES (?, ?, ?, ?, ?)", rows)
+            # Deletes leave the bound as it is: it only has to be large enough
+            longest = max((row[3] - row[2] for row in rows), default=0)
+            connection.execute("UPDATE sessions SET longest = MAX(longest, ?) WHERE video_path = ?" if changes is not None
+                               else "UPDATE sessions SET longest = ? WHERE video_path = ?", (longest, video_path))
+
+    @staticmethod
+    def _rows(video_path, records):
+        return [(video_path, record["id"], record["range"]["start"], record["range"]["end"], json.dumps(record))
+                for record in records]
+
+    def delete(self, video_path):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM annotations WHERE video_path = ?", (video_path,))
+            self._connection.execute("DELETE FROM sessions WHERE video_path = ?", (video_path,))
+
+    def session(self, video_path):
+        """(video_hash, version) of a stored session, or None"""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT video_hash, version FROM sessions WHERE video_path = ?", (video_path,)).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def iter_records(self, video_path, batch_size=1000):
+        """Records of a session in start order, fetched in batches"""
+        for record in self._iter_record_texts(video_path, batch_size):
+            yield json.loads(record)
+
+    def _iter_record_texts(self, video_path, batch_size=1000):
+        last_start, last_id = float("-inf"), ""
+        while True:
+            with self._lock:
+                rows = self._connection.execute(
+                    "SELECT start_time, id, record FROM annotations WHERE video_path = ? "
+                    "AND (start_time > ? OR (start_time = ? AND id > ?)) ORDER BY start_time, id LIMIT ?",
+                    (video_path, last_start, last_start, last_id, batch_size)).fetchall()
+            for _, _, record in rows:
+                yield record
+            if len(rows) < batch_size:
+                return
+            last_start, last_id = rows[-1][0], rows[-1][1]
+
+    def load(self, video_path):
+        """Session data in the form returned by AutosaveManager.check_for_autosave, or None"""
+        session = self.session(video_path)
+        if session is None:
+            return None
+        video_hash, version = session
+        return {
+            "version": version,
+            "annotations": list(self.iter_records(video_path)),
+            "videoHash": video_hash,
+            "video_path": video_path
+        }
+
+    # A row containing a time starts at most the session's longest duration
+    # before it, so both queries scan only that part of the start index.
+    def annotation_at(self, video_path, time_point):
+        """Record of the earliest-starting annotation containing time_point, or None"""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT record FROM annotations WHERE video_path = ? AND start_time <= ? "
+                "AND start_time >= ? - (SELECT longest FROM sessions WHERE video_path = ?) AND end_time >= ? "
+                "ORDER BY start_time, id LIMIT 1",
+                (video_path, time_point, time_point, video_path, time_point)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def overlapping(self, video_path, start_time, end_time):
+        """Records of the annotations overlapping (start_time, end_time), in start order"""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT record FROM annotations WHERE video_path = ? AND start_time < ? "
+                "AND start_time >= ? - (SELECT longest FROM sessions WHERE video_path = ?) AND end_time > ? "
+                "ORDER BY start_time, id",
+                (video_path, end_time, start_time, video_path, start_time)).fetchall()
+        return [json.loads(record) for (record,) in rows]
+
+    def write_labels_json(self, video_path, f):
+        """Stream the session as a labels.json document into the binary file object f"""
+        session = self.session(video_path)
+        video_hash, version = session if session else (0, 2)
+        f.write(b'{"version": ' + json.dumps(version).encode('utf-8') + b', "annotations": [')
+        for i, record in enumerate(self._iter_record_texts(video_path)):
+            f.write((", " if i else "").encode('utf-8') + record.encode('utf-8'))
+        f.write(b'], "videoHash": ' + json.dumps(video_hash).encode('utf-8') + b'}')
@@ -0,0 +1,187 @@
+import io
+import json
+import os
+from numbers import Real
+from src.annotation_store import AnnotationStore
+from src.models import TimelineAnnotation
+from src.session_format import SESSION_MAGIC, decode_session
+
+CHUNK_SIZE = 1 << 20
+# A single record larger than this is treated as a syntax error rather than read to the end
+MAX_RECORD_SIZE = 64 << 20
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+
+
+class LoadResult:
+    """Outcome of load_annotations: the annotations, the other top-level keys and skipped records"""
+
+    def __init__(self, annotations, header, errors):
+        self.annotations = annotations
+        self.header = header
+        self.errors = errors
+
+
+class _Reader:
+    """Text buffer over a file that is refilled in chunks as values are decoded"""
+
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Next non-whitespace character, or '' at the end of the file"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer) or not self.fill():
+                return self.buffer[self.pos:self.pos + 1]
+
+    def expect(self, chars):
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(f"Expected {' or '.join(repr(c) for c in chars)} but found {char or 'end of file'!r}")
+        self.pos += 1
+        return char
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except ValueError:
+                if len(self.buffer) - self.pos > MAX_RECORD_SIZE or not self.fill():
+                    raise
+                continue
+            # A number may continue in the next chunk
+            if end == len(self.buffer) and not isinstance(value, (dict, list, str)) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_json_records(f, header, chunk_size=CHUNK_SIZE):
+    """
+    Yield the records of the "annotations" array of a labels.json text file.
+
+    The file is parsed in chunks, one record at a time. The other top-level
+    keys are stored in header as they are met. Syntax errors raise
+    ValueError; records already yielded stay valid.
+    """
+    reader = _Reader(f, chunk_size)
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+    while True:
+        key = reader.value()
+        reader.expect(":")
+        if key == "annotations" and reader.peek() == "[":
+            reader.expect("[")
+            if reader.peek() == "]":
+                reader.pos += 1
+            else:
+                while True:
+                    yield reader.value()
+                    if reader.expect(",]") == "]":
+                        break
+        else:
+            header[key] = reader.value()
+        if reader.expect(",}") == "}":
+            return
+
+
+def validate_record(record):
+    """Reason a saved record cannot be loaded, or None if it is usable"""
+    if not isinstance(record, dict):
+        return "record is not an object"
+    if not isinstance(record.get("id"), str):
+        return "missing id"
+    time_range = record.get("range")
+    if not isinstance(time_range, dict):
+        return "missing range"
+    start, end = time_range.get("start"), time_range.get("end")
+    if not isinstance(start, Real) or not isinstance(end, Real) or isinstance(start, bool) or isinstance(end, bool):
+        return "range start and end must be numbers"
+    if start > end:
+        return "range ends before it starts"
+    if "shape" in record and record["shape"] is not None and not isinstance(record["shape"], dict):
+        return "shape is not an object"
+    comments = record.get("comments", [])
+    if not isinstance(comments, list):
+        return "comments is not a list"
+    for comment in comments:
+        if not isinstance(comment, dict):
+            return "comment is not an object"
+        if "labels" in comment:
+            if not isinstance(comment["labels"], dict):
+                return "comment labels is not an object"
+        elif not isinstance(comment.get("body"), str):
+            return "comment has no body or labels"
+    return None
+
+
+def load_annotations(path, progress=None, chunk_size=CHUNK_SIZE):
+    """
+    Load a labels.json or binary session file record by record.
+
+    Invalid records are skipped and listed in LoadResult.errors as
+    (index, reason); a syntax error ends the load and is reported the same
+    way, keeping the records read before it. progress, if given, is called
+    with the fraction of the file read so far. The annotations are returned
+    in an AnnotationStore, ready to be swapped in.
+    """
+    with open(path, 'rb') as f:
+        return read_annotations(f, os.path.getsize(path), progress, chunk_size)
+
+
+def read_annotations(f, size, progress=None, chunk_size=CHUNK_SIZE):
+    """load_annotations for a binary file object of size bytes, such as a ZIP member"""
+    size = size or 1
+    header = {}
+    annotations = []
+    errors = []
+    binary = f.read(len(SESSION_MAGIC)) == SESSION_MAGIC
+    f.seek(0)
+    if binary:
+        data = decode_session(f.read())
+        records = data.pop("annotations", [])
+        header.update(data)
+    else:
+        text = io.TextIOWrapper(f, encoding='utf-8')
+        records = iter_json_records(text, header, chunk_size)
+    index = -1
+    try:
+        for index, record in enumerate(records):
+            reason = validate_record(record)
+            if reason is None:
+                try:
+                    annotations.append(TimelineAnnotation.from_record(record))
+                except Exception as e:
+                    reason = str(e)
+            if reason is not None:
+                errors.append((index, reason))
+            if progress is not None and index % 1000 == 0:
+                progress(min(f.tell() / size, 1.0))
+    except ValueError as e:
+        errors.append((index + 1, f"file is not valid JSON: {str(e)}"))
+    if not binary:
+        # Leave f open for the caller
+        text.detach()
+    if progress is not None:
+        progress(1.0)
+    return LoadResult(AnnotationStore(annotations), header, errors)
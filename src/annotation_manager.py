@@ -2,8 +2,9 @@ from PyQt6.QtWidgets import QMessageBox
 from PyQt6.QtCore import QTimer
 from src.dialogs import AnnotationDialog
 from src.models import TimelineAnnotation
+from src.annotation_store import as_store
+from src.vocabulary import get_vocabulary
 import random
-import json
 from src.utils import autosave
 
 class AnnotationManager:
@@ -22,7 +23,12 @@ class AnnotationManager:
     def get_posture_color(self, posture):
         if posture is None or posture == "":
              return "#808080"
-        if posture not in self.posture_colors:
+        return self.get_posture_color_by_code(get_vocabulary().encode("POSTURE", posture))
+
+    def get_posture_color_by_code(self, posture_code):
+        if not posture_code:
+             return "#808080"
+        if posture_code not in self.posture_colors:
             while True:
                 r = random.randint(100, 230)
                 g = random.randint(100, 230)
@@ -31,50 +37,25 @@ class AnnotationManager:
                     color = f"#{r:02x}{g:02x}{b:02x}"
                     if color not in self.posture_colors.values():
                         break
-            self.posture_colors[posture] = color
-        return self.posture_colors[posture]
+            self.posture_colors[posture_code] = color
+        return self.posture_colors[posture_code]
+
+    def _store(self):
+        """The app's annotations as a sorted AnnotationStore"""
+        store = as_store(self.app.annotations)
+        if store is not self.app.annotations:
+            self.app.annotations = store
+        return store
 
     def check_overlap(self, start_time, end_time, exclude_annotation=None):
-        tolerance = 0.001
-        for annotation in self.app.annotations:
-            if annotation == exclude_annotation:
-                continue
-            if (start_time < (annotation.end_time - tolerance) and
-                    end_time > (annotation.start_time + tolerance)):
-                return True
-        return False
-
-    def get_current_annotation_index(self, sorted_annotations=None):
+        return self._store().overlaps(start_time, end_time, exclude=exclude_annotation, tolerance=0.001)
+
+    def get_current_annotation_index(self):
         current_time = self.app.media_player['_position'] / 1000.0
-        if sorted_annotations is None:
-            sorted_annotations = sorted(self.app.annotations, key=lambda x: x.start_time)
-
-        for i, annotation in enumerate(sorted_annotations):
-            tolerance = 0.001
-            if (annotation.start_time - tolerance) <= current_time <= (annotation.end_time + tolerance):
-                return i
-        return -1
-
-    def _get_labels_from_annotation(self, annotation):
-        if not annotation or not annotation.comments:
-            return {"POSTURE": None, "HIGH LEVEL BEHAVIOR": [], "PA TYPE": None}
-        try:
-            body_data = json.loads(annotation.comments[0].get("body", "[]"))
-            data_map = {item.get("category"): item.get("selectedValue") for item in body_data}
-            return {
-                "POSTURE": data_map.get("POSTURE"),
-                "HIGH LEVEL BEHAVIOR": sorted(data_map.get("HIGH LEVEL BEHAVIOR", [])),
-                "PA TYPE": data_map.get("PA TYPE")
-            }
-        except json.JSONDecodeError:
-            return {"POSTURE": None, "HIGH LEVEL BEHAVIOR": [], "PA TYPE": None}
+        return self._store().index_at(current_time, tolerance=0.001)
 
     def _annotations_have_different_labels(self, ann1, ann2):
-        labels1 = self._get_labels_from_annotation(ann1)
-        labels2 = self._get_labels_from_annotation(ann2)
-        return (labels1["POSTURE"] != labels2["POSTURE"] or
-                labels1["HIGH LEVEL BEHAVIOR"] != labels2["HIGH LEVEL BEHAVIOR"] or
-                labels1["PA TYPE"] != labels2["PA TYPE"])
+        return ann1.labels.merge_key != ann2.labels.merge_key
 
 
     @autosave
@@ -108,24 +89,11 @@ class AnnotationManager:
 
             self.app.current_annotation.end_time = current_time
 
-            try:
-                if self.app.current_annotation.comments:
-                    body_data = json.loads(self.app.current_annotation.comments[0].get("body", "[]"))
-                    data_map = {item.get("category"): item.get("selectedValue") for item in body_data}
-                    self.last_used_labels = {
-                        "posture": data_map.get("POSTURE", ""),
-                        "hlb": data_map.get("HIGH LEVEL BEHAVIOR", []),
-                        "pa_type": data_map.get("PA TYPE", ""),
-                        "behavioral_params": data_map.get("Behavioral Parameters", []),
-                        "exp_situation": data_map.get("Experimental situation", ""),
-                        "special_notes": ""
-                    }
-            except json.JSONDecodeError as e:
-                print(f"Error decoding comment body for storing last labels: {e}")
-
-
-            self.app.annotations.append(self.app.current_annotation)
-            self.app.annotations.sort(key=lambda x: x.start_time)
+            self.last_used_labels = self.app.current_annotation.labels.as_dict()
+            self.last_used_labels["special_notes"] = ""
+
+
+            self._store().append(self.app.current_annotation)
             print(f"Finished annotation: {start_time:.3f}s - {current_time:.3f}s")
             self.app.current_annotation = None
             self.app.updateAnnotationTimeline()
@@ -133,8 +101,8 @@ class AnnotationManager:
 
     @autosave
     def editAnnotation(self):
-        sorted_annotations = sorted(self.app.annotations, key=lambda x: x.start_time)
-        current_idx = self.get_current_annotation_index(sorted_annotations)
+        sorted_annotations = self._store()
+        current_idx = self.get_current_annotation_index()
 
         target_annotation = None
         is_editing = False
@@ -182,8 +150,8 @@ class AnnotationManager:
 
     @autosave
     def deleteCurrentLabel(self):
-        sorted_annotations = sorted(self.app.annotations, key=lambda x: x.start_time)
-        current_idx = self.get_current_annotation_index(sorted_annotations)
+        sorted_annotations = self._store()
+        current_idx = self.get_current_annotation_index()
 
         if current_idx != -1:
             annotation_to_delete = sorted_annotations[current_idx]
@@ -194,13 +162,11 @@ class AnnotationManager:
 
             if confirm == QMessageBox.StandardButton.Yes:
                 annotation_id_to_delete = annotation_to_delete.id
-                initial_length = len(self.app.annotations)
-                self.app.annotations = [ann for ann in self.app.annotations if ann.id != annotation_id_to_delete]
-
-                if len(self.app.annotations) < initial_length:
+                try:
+                    sorted_annotations.remove(annotation_to_delete)
                     self.app.updateAnnotationTimeline()
                     print(f"Deleted annotation: {annotation_to_delete.start_time:.2f}s - {annotation_to_delete.end_time:.2f}s (ID: {annotation_id_to_delete})")
-                else:
+                except ValueError:
                     print(f"Error: Annotation with ID {annotation_id_to_delete} not found in main list for deletion.")
 
         else:
@@ -210,46 +176,26 @@ class AnnotationManager:
     def moveToPreviousLabel(self):
         if not self.app.annotations:
             return
-        boundary_points = sorted(list(set(
-            p for ann in self.app.annotations for p in (ann.start_time, ann.end_time)
-        )))
-
         current_time = self.app.media_player['_position'] / 1000.0
-        target_time = -1
-        tolerance = 0.05
-
-        for point in reversed(boundary_points):
-            if point < current_time - tolerance:
-                target_time = point
-                break
-        else:
+        target_time = self._store().previous_boundary(current_time, tolerance=0.05)
+        if target_time is None:
             target_time = 0
 
-        if target_time != -1:
-            self.app.setPosition(int(target_time * 1000))
+        self.app.setPosition(int(target_time * 1000))
 
     def moveToNextLabel(self):
         if not self.app.annotations:
             return
-        boundary_points = sorted(list(set(
-            p for ann in self.app.annotations for p in (ann.start_time, ann.end_time)
-        )))
-
         current_time = self.app.media_player['_position'] / 1000.0
-        target_time = -1
-        tolerance = 0.05
-        for point in boundary_points:
-            if point > current_time + tolerance:
-                target_time = point
-                break
-
-        if target_time != -1:
+        target_time = self._store().next_boundary(current_time, tolerance=0.05)
+
+        if target_time is not None:
             self.app.setPosition(int(target_time * 1000))
 
     @autosave
     def mergeWithPrevious(self):
-        sorted_annotations = sorted(self.app.annotations, key=lambda x: x.start_time)
-        current_idx = self.get_current_annotation_index(sorted_annotations)
+        sorted_annotations = self._store()
+        current_idx = self.get_current_annotation_index()
         print("Current index of annotation being merged:", current_idx, sorted_annotations[current_idx] if current_idx != -1 else None)
         if current_idx == -1:
             QMessageBox.information(self.app, "Merge Failed", "Cannot merge: No annotation at the current position.")
@@ -285,22 +231,20 @@ class AnnotationManager:
             merged_annotation.copy_comments_from(prev_annotation)
 
         try:
-            annotations_to_remove_ids = {current_annotation.id, prev_annotation.id}
-            self.app.annotations = [ann for ann in self.app.annotations if ann.id not in annotations_to_remove_ids]
-
+            sorted_annotations.remove(current_annotation)
+            sorted_annotations.remove(prev_annotation)
         except ValueError:
              print("Error: Could not remove original annotations during merge.")
              return
 
-        self.app.annotations.append(merged_annotation)
-        self.app.annotations.sort(key=lambda x: x.start_time)
+        sorted_annotations.append(merged_annotation)
         print(f"Merged annotations into: {merged_annotation.start_time:.3f}s - {merged_annotation.end_time:.3f}s")
         self.app.updateAnnotationTimeline()
 
     @autosave
     def mergeWithNext(self):
-        sorted_annotations = sorted(self.app.annotations, key=lambda x: x.start_time)
-        current_idx = self.get_current_annotation_index(sorted_annotations)
+        sorted_annotations = self._store()
+        current_idx = self.get_current_annotation_index()
         if current_idx == -1 or current_idx >= len(sorted_annotations) - 1:
             QMessageBox.information(self.app, "Merge Failed", "Cannot merge: No annotation at current position or no next annotation exists.")
             return
@@ -334,22 +278,21 @@ class AnnotationManager:
             merged_annotation.copy_comments_from(next_annotation)
 
         try:
-            annotations_to_remove_ids = {current_annotation.id, next_annotation.id}
-            self.app.annotations = [ann for ann in self.app.annotations if ann.id not in annotations_to_remove_ids]
+            sorted_annotations.remove(current_annotation)
+            sorted_annotations.remove(next_annotation)
         except ValueError:
              print("Error: Could not remove original annotations during merge.")
              return
 
-        self.app.annotations.append(merged_annotation)
-        self.app.annotations.sort(key=lambda x: x.start_time)
+        sorted_annotations.append(merged_annotation)
         print(f"Merged annotations into: {merged_annotation.start_time:.3f}s - {merged_annotation.end_time:.3f}s")
         self.app.updateAnnotationTimeline()
 
     @autosave
     def splitCurrentLabel(self):
         current_time = round(self.app.media_player['_position'] / 1000.0)
-        sorted_annotations = sorted(self.app.annotations, key=lambda x: x.start_time)
-        current_idx = self.get_current_annotation_index(sorted_annotations)
+        sorted_annotations = self._store()
+        current_idx = self.get_current_annotation_index()
 
         if current_idx == -1:
             QMessageBox.information(self.app, "Split Failed", "Cannot split: Playhead is not inside an annotation.")
@@ -372,7 +315,6 @@ class AnnotationManager:
         new_annotation.copy_comments_from(annotation_to_split)
         original_end_time = annotation_to_split.end_time
         annotation_to_split.end_time = current_time
-        self.app.annotations.append(new_annotation)
-        self.app.annotations.sort(key=lambda x: x.start_time)
+        sorted_annotations.append(new_annotation)
         print(f"Split annotation {annotation_to_split.start_time:.3f}s-{original_end_time:.3f}s at {current_time:.3f}s")
         self.app.updateAnnotationTimeline()
@@ -0,0 +1,318 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+
+
+class AnnotationStore:
+    """
+    Annotations kept sorted by start time, with parallel start/end arrays so
+    point and overlap queries are answered by bisection.
+
+    The manager and the timeline keep annotations from overlapping, but
+    loaded sessions may contain overlaps. The store counts overlapping
+    neighbours; while there are none, end times are sorted and backward scans
+    stop at the first earlier end, otherwise they use a running maximum of the
+    end times (built on demand). Attached TimelineAnnotations report changes
+    to their start/end times back to the store, which keeps the order valid
+    while edges are dragged. A separate sorted array of every start and end
+    time (shared edges appear twice) backs label boundary navigation.
+
+    The label-code column, the id -> row map, the running maximum end and the
+    record snapshot are derived lazily and dropped whenever rows move or annotations change.
+    Every change also bumps generation, so callers can tell whether the
+    state moved on since they last looked.
+    """
+    TOLERANCE = 0.001
+
+    def __init__(self, annotations=()):
+        self._items = sorted(annotations, key=lambda x: x.start_time)
+        self._starts = array('d', (x.start_time for x in self._items))
+        self._ends = array('d', (x.end_time for x in self._items))
+        self._boundaries = array('d', sorted(self._starts + self._ends))
+        self._overlapping = sum(map(self._overlaps_next, range(len(self._items) - 1)))
+        self._max_ends = None
+        self._rows = None
+        self._codes = None
+        self._label_table = None
+        self._snapshot = None
+        self._generation = 0
+        for annotation in self._items:
+            annotation._store = self
+
+    # --- list-like interface ---
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __reversed__(self):
+        return reversed(self._items)
+
+    def __getitem__(self, index):
+        return self._items[index]
+
+    def __contains__(self, annotation):
+        return self.index_of(annotation) != -1
+
+    def __repr__(self):
+        return f"AnnotationStore({self._items!r})"
+
+    def append(self, annotation):
+        """Insert an annotation at its sorted position"""
+        row = bisect_right(self._starts, annotation.start_time)
+        self._overlapping -= self._overlaps_next(row - 1)
+        self._items.insert(row, annotation)
+        self._starts.insert(row, annotation.start_time)
+        self._ends.insert(row, annotation.end_time)
+        self._overlapping += self._overlaps_next(row - 1) + self._overlaps_next(row)
+        self._add_boundary(annotation.start_time)
+        self._add_boundary(annotation.end_time)
+        self._invalidate()
+        annotation._store = self
+
+    def extend(self, annotations):
+        for annotation in annotations:
+            self.append(annotation)
+
+    def remove(self, annotation):
+        row = self.index_of(annotation)
+        if row == -1:
+            raise ValueError(f"{annotation} is not in the store")
+        self._pop_row(row)
+
+    def clear(self):
+        for annotation in self._items:
+            if getattr(annotation, '_store', None) is self:
+                annotation._store = None
+        self._items = []
+        self._starts = array('d')
+        self._ends = array('d')
+        self._boundaries = array('d')
+        self._overlapping = 0
+        self._invalidate()
+
+    def sort(self, key=None, reverse=False):
+        """Kept for list compatibility; the store is always sorted by start time"""
+
+    @property
+    def generation(self):
+        """Counter bumped by every change to the stored annotations"""
+        return self._generation
+
+    # --- queries ---
+    def index_of(self, annotation):
+        """Row of the given annotation object, or -1"""
+        row = bisect_left(self._starts, annotation.start_time)
+        while row < len(self._items) and self._starts[row] == annotation.start_time:
+            if self._items[row] is annotation:
+                return row
+            row += 1
+        return -1
+
+    def index_at(self, time, tolerance=TOLERANCE):
+        """Row of the first annotation containing time (inclusive, with tolerance), or -1"""
+        row = bisect_right(self._starts, time + tolerance) - 1
+        reach = self._reach()
+        found = -1
+        while row >= 0 and reach[row] >= time - tolerance:
+            if self._ends[row] >= time - tolerance:
+                found = row
+            row -= 1
+        return found
+
+    def annotation_at(self, time, tolerance=TOLERANCE):
+        row = self.index_at(time, tolerance)
+        return self._items[row] if row != -1 else None
+
+    def overlaps(self, start_time, end_time, exclude=None, tolerance=TOLERANCE):
+        """True if [start_time, end_time] overlaps any annotation other than exclude"""
+        row = bisect_left(self._starts, end_time - tolerance) - 1
+        reach = self._reach()
+        while row >= 0 and reach[row] - tolerance > start_time:
+            if self._ends[row] - tolerance > start_time and self._items[row] is not exclude:
+                return True
+            row -= 1
+        return False
+
+    def rows_between(self, start_time, end_time):
+        """
+        (first, stop) rows of the annotations overlapping [start_time, end_time], as a slice range.
+
+        When annotations overlap, the range may also hold rows nested inside
+        an earlier, longer one that end before start_time.
+        """
+        first = bisect_left(self._reach(), start_time)
+        return first, max(first, bisect_right(self._starts, end_time))
+
+    def previous_boundary(self, time, tolerance=TOLERANCE):
+        """Latest start/end time strictly before time - tolerance, or None"""
+        i = bisect_left(self._boundaries, time - tolerance)
+        return self._boundaries[i - 1] if i > 0 else None
+
+    def next_boundary(self, time, tolerance=TOLERANCE):
+        """Earliest start/end time strictly after time + tolerance, or None"""
+        i = bisect_right(self._boundaries, time + tolerance)
+        return self._boundaries[i] if i < len(self._boundaries) else None
+
+    def row_of_id(self, annotation_id):
+        """Row of the annotation with the given id, or -1"""
+        if self._rows is None:
+            self._rows = {annotation.id: row for row, annotation in enumerate(self._items)}
+        return self._rows.get(annotation_id, -1)
+
+    def get(self, annotation_id):
+        row = self.row_of_id(annotation_id)
+        return self._items[row] if row != -1 else None
+
+    def neighbors(self, annotation):
+        """(previous, next) annotations around the given one; None where absent"""
+        row = self.index_of(annotation)
+        if row == -1:
+            return None, None
+        prev_annotation = self._items[row - 1] if row > 0 else None
+        next_annotation = self._items[row + 1] if row + 1 < len(self._items) else None
+        return prev_annotation, next_annotation
+
+    # --- columns ---
+    def start_times(self):
+        """Copy of the start time column, in row order"""
+        return array('d', self._starts)
+
+    def end_times(self):
+        """Copy of the end time column, in row order"""
+        return array('d', self._ends)
+
+    def label_codes(self):
+        """Copy of the per-row label codes; equal labels share a code in label_table()"""
+        self._build_label_codes()
+        return array('I', self._codes)
+
+    def label_table(self):
+        """Distinct AnnotationLabels, indexed by label code"""
+        self._build_label_codes()
+        return list(self._label_table)
+
+    def snapshot(self):
+        """
+        Tuple of the saved records of all rows, for serializing off the GUI thread.
+
+        Records are cached per annotation, so after an edit only the changed
+        annotations are rebuilt; without edits the same tuple is returned.
+        """
+        if self._snapshot is None:
+            self._snapshot = tuple(annotation.to_record() for annotation in self._items)
+        return self._snapshot
+
+    def _build_label_codes(self):
+        if self._codes is not None:
+            return
+        table = {}
+        codes = array('I')
+        for annotation in self._items:
+            codes.append(table.setdefault(annotation.labels, len(table)))
+        self._codes = codes
+        self._label_table = list(table)
+
+    # --- maintenance ---
+    def _invalidate(self):
+        self._generation += 1
+        self._max_ends = None
+        self._rows = None
+        self._codes = None
+        self._label_table = None
+        self._snapshot = None
+
+    def _overlaps_next(self, row):
+        """1 if the annotation at row ends after the next one starts, else 0"""
+        return int(0 <= row < len(self._items) - 1 and self._ends[row] > self._starts[row + 1])
+
+    def _reach(self):
+        """Latest end time of the rows up to each row; the end times themselves when nothing overlaps"""
+        if not self._overlapping:
+            return self._ends
+        if self._max_ends is None:
+            self._max_ends = array('d', accumulate(self._ends, max))
+        return self._max_ends
+
+    def _add_boundary(self, time):
+        self._boundaries.insert(bisect_right(self._boundaries, time), time)
+
+    def _remove_boundary(self, time):
+        i = bisect_left(self._boundaries, time)
+        if i < len(self._boundaries) and self._boundaries[i] == time:
+            del self._boundaries[i]
+
+    def _pop_row(self, row):
+        self._overlapping -= self._overlaps_next(row - 1) + self._overlaps_next(row)
+        annotation = self._items.pop(row)
+        self._remove_boundary(self._starts.pop(row))
+        self._remove_boundary(self._ends.pop(row))
+        self._overlapping += self._overlaps_next(row - 1)
+        self._invalidate()
+        if getattr(annotation, '_store', None) is self:
+            annotation._store = None
+        return annotation
+
+    def _find_row(self, annotation, start_time):
+        row = bisect_left(self._starts, start_time)
+        while row < len(self._items) and self._starts[row] == start_time:
+            if self._items[row] is annotation:
+                return row
+            row += 1
+        for row, item in enumerate(self._items):
+            if item is annotation:
+                return row
+        return -1
+
+    def _annotation_changed(self, annotation):
+        """Called by an attached annotation after its id or shape changed"""
+        self._generation += 1
+        self._rows = None
+        self._snapshot = None
+
+    def _labels_changed(self, annotation):
+        """Called by an attached annotation after its labels changed"""
+        self._generation += 1
+        self._codes = None
+        self._label_table = None
+        self._snapshot = None
+
+    def _times_changed(self, annotation, old_start):
+        """Called by an attached annotation after its start or end time changed"""
+        row = self._find_row(annotation, old_start)
+        if row == -1:
+            annotation._store = None
+            return
+        start_time = annotation.start_time
+        if self._starts[row] == start_time and self._ends[row] == annotation.end_time:
+            return
+        self._generation += 1
+        self._snapshot = None
+        self._max_ends = None
+        if self._ends[row] != annotation.end_time:
+            self._remove_boundary(self._ends[row])
+            self._add_boundary(annotation.end_time)
+            self._overlapping -= self._overlaps_next(row)
+            self._ends[row] = annotation.end_time
+            self._overlapping += self._overlaps_next(row)
+        if self._starts[row] == start_time:
+            return
+        in_order = ((row == 0 or self._starts[row - 1] <= start_time) and
+                    (row == len(self._items) - 1 or start_time <= self._starts[row + 1]))
+        if in_order:
+            self._remove_boundary(self._starts[row])
+            self._add_boundary(start_time)
+            self._overlapping -= self._overlaps_next(row - 1)
+            self._starts[row] = start_time
+            self._overlapping += self._overlaps_next(row - 1)
+        else:
+            self._pop_row(row)
+            self.append(annotation)
+
+
+def as_store(annotations):
+    """Return annotations as an AnnotationStore, wrapping plain sequences"""
+    if isinstance(annotations, AnnotationStore):
+        return annotations
+    return AnnotationStore(annotations)
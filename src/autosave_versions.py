@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from src.session_format import load_session
+
+
+class AutosaveVersions:
+    """
+    Rolling, content-addressed history of autosave snapshots.
+
+    Each snapshot is stored once under the SHA-256 of its bytes, so saving
+    unchanged annotations again only adds a manifest entry. Per video the
+    newest keep_last versions are kept, plus the newest version of each of
+    the last keep_hourly hours and keep_daily days that have one. When the
+    stored objects exceed max_total_size, the least recently used objects
+    are evicted across all videos.
+
+    manifest.json lists every version (video, time, digest, size, count), so
+    versions can be listed without opening the snapshots themselves.
+    """
+    keep_last = 10
+    keep_hourly = 24
+    keep_daily = 30
+    max_total_size = 200 * 1024 * 1024
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, 'manifest.json')
+        self._lock = threading.RLock()
+        self._manifest = None
+
+    def _load(self):
+        if self._manifest is None:
+            try:
+                with open(self.manifest_path, 'r') as f:
+                    manifest = json.load(f)
+                if not isinstance(manifest, dict):
+                    raise ValueError("manifest is not an object")
+                manifest.setdefault("versions", [])
+                manifest.setdefault("objects", {})
+            except (OSError, ValueError):
+                manifest = {"versions": [], "objects": {}}
+            self._manifest = manifest
+        return self._manifest
+
+    def _save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = self.manifest_path + ".tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(self._manifest, f)
+        os.replace(temp_path, self.manifest_path)
+
+    def object_path(self, digest):
+        return os.path.join(self.directory, digest)
+
+    def add(self, video_path, content, count=0, created=None):
+        """Store serialized snapshot bytes as a new version of video_path; returns the digest"""
+        created = time.time() if created is None else created
+        digest = hashlib.sha256(content).hexdigest()
+        with self._lock:
+            manifest = self._load()
+            objects = manifest["objects"]
+            if digest not in objects or not os.path.exists(self.object_path(digest)):
+                os.makedirs(self.directory, exist_ok=True)
+                temp_path = self.object_path(digest) + ".tmp"
+                with open(temp_path, 'wb') as f:
+                    f.write(content)
+                os.replace(temp_path, self.object_path(digest))
+            objects[digest] = {"size": len(content), "used": created}
+            manifest["versions"].append({
+                "video_path": video_path,
+                "created": created,
+                "digest": digest,
+                "size": len(content),
+                "count": count
+            })
+            self._prune(video_path, created)
+            self._evict(protect=digest)
+            self._save()
+        return digest
+
+    def list(self, video_path):
+        """Versions of video_path from the manifest, newest first"""
+        with self._lock:
+            versions = [dict(version) for version in self._load()["versions"]
+                        if version["video_path"] == video_path]
+        return sorted(versions, key=lambda version: version["created"], reverse=True)
+
+    def load(self, digest):
+        """Parsed snapshot stored under digest; marks it as recently used"""
+        data = load_session(self.object_path(digest))
+        with self._lock:
+            entry = self._load()["objects"].get(digest)
+            if entry is not None:
+                entry["used"] = time.time()
+                self._save()
+        return data
+
+    def _prune(self, video_path, now):
+        """Drop versions of video_path that the retention policy does not keep"""
+        manifest = self._manifest
+        versions = sorted((version for version in manifest["versions"] if version["video_path"] == video_path),
+                          key=lambda version: version["created"], reverse=True)
+        kept = set(id(version) for version in versions[:self.keep_last])
+        for bucket_size, limit in ((3600, self.keep_hourly), (86400, self.keep_daily)):
+            buckets = set()
+            for version in versions:
+                bucket = int(version["created"] // bucket_size)
+                if bucket not in buckets:
+                    if len(buckets) == limit:
+                        break
+                    buckets.add(bucket)
+                    kept.add(id(version))
+        manifest["versions"] = [version for version in manifest["versions"]
+                                if version["video_path"] != video_path or id(version) in kept]
+        self._drop_unreferenced()
+
+    def _evict(self, protect=None):
+        """Evict least recently used objects until the total size fits max_total_size"""
+        manifest = self._manifest
+        objects = manifest["objects"]
+        total = sum(entry["size"] for entry in objects.values())
+        for digest in sorted(objects, key=lambda digest: objects[digest]["used"]):
+            if total <= self.max_total_size:
+                break
+            if digest == protect:
+                continue
+            total -= objects[digest]["size"]
+            manifest["versions"] = [version for version in manifest["versions"] if version["digest"] != digest]
+        self._drop_unreferenced()
+
+    def _drop_unreferenced(self):
+        manifest = self._manifest
+        referenced = set(version["digest"] for version in manifest["versions"])
+        for digest in list(manifest["objects"]):
+            if digest not in referenced:
+                del manifest["objects"][digest]
+                try:
+                    os.remove(self.object_path(digest))
+                except OSError:
+                    pass
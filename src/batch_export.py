@@ -0,0 +1,232 @@
+import argparse
+import fnmatch
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from src.annotation_loader import LoadResult, load_annotations, validate_record
+from src.annotation_store import AnnotationStore
+from src.bundle import export_bundle, import_bundle, video_date_of
+from src.columnar import COLUMNAR_EXTENSION, write_columns
+from src.models import LABELS_SCHEMA_VERSION, TimelineAnnotation
+from src.utils import read_journal, replay_journal, resource_path
+
+DEFAULT_PATTERNS = ("labels.json", "*_autosave.json", "*.paaws")
+# Exports are stale when the label vocabulary or mapping changes
+DEPENDENCIES = ('data/categories/categories.csv', 'data/mapping/mapping.json')
+
+
+def find_inputs(paths, patterns=DEFAULT_PATTERNS):
+    """Session files named by paths, searching directories recursively for patterns"""
+    inputs = []
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, subdirectories, names in os.walk(path):
+                subdirectories.sort()
+                for name in sorted(names):
+                    if any(fnmatch.fnmatch(name, pattern) for pattern in patterns):
+                        inputs.append(os.path.join(directory, name))
+        else:
+            inputs.append(path)
+    return inputs
+
+
+def output_path_for(input_path, output_dir=None):
+    """Export ZIP of input_path: named after its folder for labels.json, after the video for autosaves"""
+    directory, name = os.path.split(os.path.abspath(input_path))
+    stem = os.path.splitext(name)[0]
+    if stem == "labels":
+        stem = os.path.basename(directory) or stem
+    elif stem.endswith("_autosave"):
+        stem = stem[:-len("_autosave")]
+    return os.path.join(output_dir or directory, stem + ".zip")
+
+
+def _journal_path(input_path):
+    return os.path.splitext(input_path)[0] + ".journal"
+
+
+def load_input(path):
+    """
+    Annotations of a session file, export ZIP or autosave as a LoadResult.
+
+    Autosave snapshots have their journal replayed, so the export matches
+    what the app would restore.
+    """
+    if path.lower().endswith('.zip'):
+        return import_bundle(path)
+    result = load_annotations(path)
+    journal_id = result.header.get("journal")
+    if journal_id:
+        ops = read_journal(_journal_path(path), journal_id)
+        if ops:
+            records = replay_journal([annotation.to_record() for annotation in result.annotations], ops)
+            annotations = []
+            for record in records:
+                reason = validate_record(record)
+                if reason is None:
+                    annotations.append(TimelineAnnotation.from_record(record))
+                else:
+                    result.errors.append((-1, f"journal record {record.get('id')!r}: {reason}"))
+            result = LoadResult(AnnotationStore(annotations), result.header, result.errors)
+    return result
+
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def is_up_to_date(input_path, output_path):
+    """True if output_path is newer than the input, its journal and the label vocabulary"""
+    output_time = _mtime(output_path)
+    if output_time is None:
+        return False
+    sources = [input_path, _journal_path(input_path)] + [resource_path(path) for path in DEPENDENCIES]
+    return all(source_time is None or source_time <= output_time for source_time in map(_mtime, sources))
+
+
+def _columnar_path(output_path):
+    return os.path.splitext(output_path)[0] + COLUMNAR_EXTENSION
+
+
+def export_file(input_path, output_path, force=False, version=LABELS_SCHEMA_VERSION, binary=False, columnar=False):
+    """
+    Export one session file to a ZIP bundle; runs in a worker process.
+
+    With columnar, a columnar .npz (see columnar.write_columns) is written
+    next to the ZIP as well.
+
+    Returns a result dict with the input, output, status ("exported",
+    "up to date" or "failed"), annotation count, skipped records, elapsed
+    seconds and an error message for failures.
+    """
+    started = time.perf_counter()
+    result = {"input": input_path, "output": output_path, "status": "exported",
+              "annotations": 0, "skipped": [], "seconds": 0.0, "error": None}
+    try:
+        if not force and is_up_to_date(input_path, output_path) and (
+                not columnar or is_up_to_date(input_path, _columnar_path(output_path))):
+            result["status"] = "up to date"
+        else:
+            loaded = load_input(input_path)
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            export_bundle(output_path, loaded.annotations, loaded.header.get("videoHash", 0),
+                          video_date_of(loaded.header.get("video_path")), version=version, binary=binary)
+            if columnar:
+                columnar_path = _columnar_path(output_path)
+                write_columns(columnar_path + ".tmp", loaded.annotations, loaded.header.get("videoHash", 0))
+                os.replace(columnar_path + ".tmp", columnar_path)
+            result["annotations"] = len(loaded.annotations)
+            result["skipped"] = [f"record {index + 1}: {reason}" if index >= 0 else reason
+                                 for index, reason in loaded.errors]
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = str(e)
+    result["seconds"] = time.perf_counter() - started
+    return result
+
+
+def export_batch(inputs, output_dir=None, jobs=None, force=False, version=LABELS_SCHEMA_VERSION, binary=False,
+                 progress=None, columnar=False):
+    """
+    Export many session files across a pool of jobs worker processes.
+
+    Outputs that are newer than their inputs are skipped unless force is
+    set, so an interrupted batch resumes where it stopped. Two inputs that
+    would write the same ZIP are reported as failed instead of overwriting
+    each other. progress, if given, is called with each result as it
+    completes; columnar is passed on to export_file. Returns the results in
+    input order.
+    """
+    results = {}
+    tasks = []
+    claimed = {}
+    for index, input_path in enumerate(inputs):
+        output_path = output_path_for(input_path, output_dir)
+        if output_path in claimed:
+            results[index] = {"input": input_path, "output": output_path, "status": "failed", "annotations": 0,
+                              "skipped": [], "seconds": 0.0,
+                              "error": f"same output as {inputs[claimed[output_path]]}"}
+            if progress is not None:
+                progress(results[index])
+            continue
+        claimed[output_path] = index
+        tasks.append((index, input_path, output_path))
+
+    if jobs == 1 or len(tasks) <= 1:
+        for index, input_path, output_path in tasks:
+            results[index] = export_file(input_path, output_path, force, version, binary, columnar)
+            if progress is not None:
+                progress(results[index])
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {pool.submit(export_file, input_path, output_path, force, version, binary, columnar): index
+                       for index, input_path, output_path in tasks}
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+                if progress is not None:
+                    progress(results[futures[future]])
+    return [results[index] for index in sorted(results)]
+
+
+def summarize(results, elapsed=None):
+    """Human-readable summary of export_batch results"""
+    counts = {}
+    for result in results:
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+    lines = [f"{len(results)} file(s): " + ", ".join(f"{count} {status}" for status, count in sorted(counts.items()))]
+    annotations = sum(result["annotations"] for result in results)
+    skipped = sum(len(result["skipped"]) for result in results)
+    lines.append(f"{annotations} annotation(s) exported, {skipped} record(s) skipped")
+    if elapsed is not None:
+        lines.append(f"Finished in {elapsed:.1f} s")
+    for result in results:
+        if result["status"] == "failed":
+            lines.append(f"FAILED {result['input']}: {result['error']}")
+        elif result["skipped"]:
+            lines.append(f"{result['input']}: {len(result['skipped'])} record(s) skipped, first: {result['skipped'][0]}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Export PAAWS labels.json files, autosaves and binary sessions to ZIP bundles of CSVs.")
+    parser.add_argument("inputs", nargs="+", help="session files or directories to search")
+    parser.add_argument("-o", "--output-dir", help="directory for the ZIP files (default: next to each input)")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument("-f", "--force", action="store_true", help="export even if the ZIP is up to date")
+    parser.add_argument("--pattern", action="append", help=f"file name pattern to search directories for "
+                                                           f"(default: {', '.join(DEFAULT_PATTERNS)})")
+    parser.add_argument("--legacy", action="store_true", help="write v1 labels.json")
+    parser.add_argument("--binary", action="store_true", help="write labels.paaws instead of labels.json")
+    parser.add_argument("--columnar", action="store_true",
+                        help=f"also write memory-mappable columns ({COLUMNAR_EXTENSION}) next to each ZIP")
+    parser.add_argument("--report", help="write the per-file results as JSON to this path")
+    args = parser.parse_args(argv)
+
+    inputs = find_inputs(args.inputs, tuple(args.pattern) if args.pattern else DEFAULT_PATTERNS)
+    if not inputs:
+        print("No session files found", file=sys.stderr)
+        return 1
+
+    done = 0
+
+    def report(result):
+        nonlocal done
+        done += 1
+        detail = result["error"] if result["status"] == "failed" else f"{result['annotations']} annotations"
+        print(f"[{done}/{len(inputs)}] {result['status']}: {result['input']} ({detail})")
+
+    started = time.perf_counter()
+    results = export_batch(inputs, args.output_dir, args.jobs, args.force,
+                           version=1 if args.legacy else LABELS_SCHEMA_VERSION, binary=args.binary, progress=report,
+                           columnar=args.columnar)
+    print(summarize(results, time.perf_counter() - started))
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(results, f, indent=4)
+    return 1 if any(result["status"] == "failed" for result in results) else 0
@@ -0,0 +1,299 @@
+import csv
+import io
+import os
+from datetime import datetime
+from zipfile import ZIP_DEFLATED, ZipFile
+import numpy as np
+from src.annotation_loader import LoadResult, read_annotations
+from src.annotation_store import AnnotationStore, as_store
+from src.label_arrays import LABEL_SEPARATOR, category_codes
+from src.models import LABEL_CATEGORIES, LABELS_SCHEMA_VERSION, TimelineAnnotation
+from src.session_format import SESSION_EXTENSION, dumps_session
+from src.utils import zip_member
+
+CSV_HEADER = ['START_TIME', 'STOP_TIME', 'PREDICTION', 'SOURCE', 'LABELSET', 'VIDEO_START_TIME', 'VIDEO_END_TIME']
+LABELSETS = {
+    "POSTURE": "Posture",
+    "HIGH LEVEL BEHAVIOR": "High Level Behavior",
+    "PA TYPE": "PA Type",
+    "Behavioral Parameters": "Behavioral Parameters",
+    "Experimental situation": "Experimental Situation",
+    "Special Notes": "Special Notes"
+}
+LABELS_MEMBERS = ('labels.json', 'labels.paaws')
+EXPORT_CHUNK_SIZE = 10000
+
+
+def video_date_of(video_path):
+    """Date the CSV START_TIME/STOP_TIME columns count from: the video's mtime, or now"""
+    if video_path and os.path.exists(video_path):
+        return datetime.fromtimestamp(os.path.getmtime(video_path))
+    return datetime.now()
+
+
+def _format_times(base, seconds):
+    """"%Y-%m-%d %H:%M:%S" strings of base + seconds, truncated to the second like strftime"""
+    offsets = np.round(np.asarray(seconds, dtype=np.float64) * 1e6).astype('timedelta64[us]')
+    times = np.datetime_as_string((np.datetime64(base, 'us') + offsets).astype('datetime64[s]'))
+    if times.dtype != np.dtype('<U19'):
+        return np.char.replace(times, 'T', ' ').tolist()
+    # Swap the ISO 'T' for a space in place, on the UCS-4 code points
+    times.view(np.uint32).reshape(-1, 19)[:, 10] = ord(' ')
+    return times.tolist()
+
+
+def category_rows(annotations):
+    """
+    Rows of each category CSV, in one pass over the annotations.
+
+    Returns {category: (rows, predictions)}: the store rows that have a
+    prediction in that category and the prediction of each. Predictions are
+    decoded once per distinct set of labels, then fanned out to the
+    categories by label code.
+    """
+    _, _, columns = category_codes(annotations)
+    result = {}
+    for category, (codes, values) in columns.items():
+        rows = np.flatnonzero(codes)
+        if len(rows):
+            result[category] = (rows, [values[code] for code in codes[rows].tolist()])
+    return result
+
+
+def write_category_csvs(zipf, annotations, video_date, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Write the per-category CSVs of annotations into the open ZipFile zipf.
+
+    Each member is streamed through ZipFile.open(..., 'w'), so it is
+    compressed as it is written and never held in memory whole. Timestamps
+    are formatted in vectorized chunks of chunk_size rows: START_TIME and
+    STOP_TIME count from video_date, the VIDEO_ columns from its midnight.
+    Categories without predictions get no CSV.
+    """
+    store = as_store(annotations)
+    starts = np.frombuffer(store.start_times(), dtype=np.float64)
+    ends = np.frombuffer(store.end_times(), dtype=np.float64)
+    date_only = video_date.replace(hour=0, minute=0, second=0, microsecond=0)
+    for category, (rows, predictions) in category_rows(store).items():
+        labelset = LABELSETS[category]
+        with zipf.open(zip_member(zipf, f"{category}.csv"), 'w') as member, \
+                io.TextIOWrapper(member, encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(CSV_HEADER)
+            for offset in range(0, len(rows), chunk_size):
+                chunk = rows[offset:offset + chunk_size]
+                chunk_starts, chunk_ends = starts[chunk], ends[chunk]
+                writer.writerows(zip(
+                    _format_times(video_date, chunk_starts), _format_times(video_date, chunk_ends),
+                    predictions[offset:offset + chunk_size], ('Expert',) * len(chunk), (labelset,) * len(chunk),
+                    _format_times(date_only, chunk_starts), _format_times(date_only, chunk_ends)))
+
+
+def write_labels(zipf, annotations, video_hash=0, version=LABELS_SCHEMA_VERSION, binary=False, fragments=None):
+    """
+    Write the labels.json member (labels.paaws if binary) of a bundle.
+
+    version 1 writes the legacy layout without a version key, for tools that
+    expect the labels as a JSON string body. fragments is an optional
+    FragmentCache for the v2 JSON text.
+    """
+    if version == 1:
+        data = {
+            "annotations": [annotation.to_record(version=1) for annotation in annotations],
+            "videoHash": video_hash
+        }
+        fragments = None
+    else:
+        data = {
+            "version": LABELS_SCHEMA_VERSION,
+            "annotations": list(as_store(annotations).snapshot()),
+            "videoHash": video_hash
+        }
+    if binary:
+        zipf.writestr('labels' + SESSION_EXTENSION, dumps_session(data, binary=True))
+    else:
+        zipf.writestr('labels.json', dumps_session(data, indent=4, fragments=fragments))
+
+
+def export_bundle(path, annotations, video_hash=0, video_date=None, version=LABELS_SCHEMA_VERSION, binary=False):
+    """
+    Write a complete export ZIP: the labels member and the category CSVs.
+
+    The ZIP is written next to path and moved into place when complete, so
+    an interrupted export never leaves a partial bundle behind.
+    """
+    temp_path = path + ".tmp"
+    try:
+        with ZipFile(temp_path, 'w', compression=ZIP_DEFLATED) as zipf:
+            write_labels(zipf, annotations, video_hash, version=version, binary=binary)
+            write_category_csvs(zipf, annotations, video_date or datetime.now())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _parse_times(values):
+    """Seconds since the epoch of "%Y-%m-%d %H:%M:%S" strings, and a mask of unparsable ones"""
+    try:
+        times = np.array(values, dtype='datetime64[s]')
+    except ValueError:
+        times = np.empty(len(values), dtype='datetime64[s]')
+        for i, value in enumerate(values):
+            try:
+                times[i] = np.datetime64(value, 's')
+            except ValueError:
+                times[i] = np.datetime64('NaT')
+    return times.astype(np.int64), np.isnat(times)
+
+
+def read_category_csv(f, name):
+    """
+    Intervals of one exported category CSV from the text file object f.
+
+    Returns (starts, stops, predictions, errors): times in seconds since the
+    epoch as int64 arrays, the PREDICTION strings, and (row, reason) for
+    rows that were skipped. The VIDEO_START_TIME/VIDEO_END_TIME columns are
+    used when present, START_TIME/STOP_TIME otherwise.
+    """
+    reader = csv.reader(f)
+    header = next(reader, None) or []
+    columns = {column.strip().upper(): i for i, column in enumerate(header)}
+    if "VIDEO_START_TIME" in columns and "VIDEO_END_TIME" in columns:
+        start_column, stop_column = columns["VIDEO_START_TIME"], columns["VIDEO_END_TIME"]
+    elif "START_TIME" in columns and "STOP_TIME" in columns:
+        start_column, stop_column = columns["START_TIME"], columns["STOP_TIME"]
+    else:
+        return np.empty(0, np.int64), np.empty(0, np.int64), [], [(0, f"{name}: missing time columns")]
+    if "PREDICTION" not in columns:
+        return np.empty(0, np.int64), np.empty(0, np.int64), [], [(0, f"{name}: missing PREDICTION column")]
+    prediction_column = columns["PREDICTION"]
+    width = max(start_column, stop_column, prediction_column) + 1
+
+    rows = []
+    errors = []
+    for row_number, row in enumerate(reader, start=1):
+        if len(row) < width:
+            if any(row):
+                errors.append((row_number, f"{name}: row has {len(row)} columns"))
+            continue
+        rows.append((row_number, row[start_column], row[stop_column], row[prediction_column]))
+    if not rows:
+        return np.empty(0, np.int64), np.empty(0, np.int64), [], errors
+
+    row_numbers, start_texts, stop_texts, predictions = zip(*rows)
+    starts, bad_starts = _parse_times(start_texts)
+    stops, bad_stops = _parse_times(stop_texts)
+    invalid = bad_starts | bad_stops
+    empty = ~invalid & (stops <= starts)
+    for i in np.flatnonzero(invalid | empty):
+        reason = "unreadable time" if invalid[i] else "interval is shorter than one second"
+        errors.append((row_numbers[i], f"{name}: {reason}"))
+    errors.sort()
+    keep = ~(invalid | empty)
+    return starts[keep], stops[keep], [p for p, k in zip(predictions, keep) if k], errors
+
+
+def annotations_from_intervals(intervals):
+    """
+    Rebuild annotations from per-category intervals.
+
+    intervals maps a category to (starts, stops, predictions) as returned by
+    read_category_csv. All interval ends are swept in order: every span
+    between consecutive ends where some category has a prediction becomes
+    one annotation with the predictions active over it. Times are made
+    relative to midnight of the earliest day, as the exported video times
+    are.
+    """
+    used = [(category, data) for category, data in intervals.items() if len(data[0])]
+    if not used:
+        return []
+    bounds = np.unique(np.concatenate([np.concatenate((starts, stops)) for _, (starts, stops, _) in used]))
+    segments = np.arange(len(bounds) - 1)
+    active = np.zeros(len(segments), dtype=bool)
+    codes = []
+    values = []
+    for category, (starts, stops, predictions) in used:
+        order = np.argsort(starts, kind='stable')
+        first = np.searchsorted(bounds, starts[order])
+        last = np.searchsorted(bounds, stops[order])
+        # The interval covering a segment is the last one starting at or before it
+        covering = np.searchsorted(first, segments, side='right') - 1
+        covered = (covering >= 0) & (segments < last[np.maximum(covering, 0)])
+        unique, inverse = np.unique(np.asarray(predictions, dtype=object)[order].astype(str), return_inverse=True)
+        codes.append(np.where(covered, inverse[np.maximum(covering, 0)], -1))
+        values.append((category, unique.tolist()))
+        active |= covered
+
+    base = bounds[0] - bounds[0] % 86400
+    offsets = (bounds - base).astype(np.float64).tolist()
+    fields = {category: (field_name, is_list) for category, field_name, is_list in LABEL_CATEGORIES}
+    label_kwargs = {}
+    annotations = []
+    segment_codes = np.stack(codes, axis=1)[active]
+    for segment, row in zip(np.flatnonzero(active), segment_codes.tolist()):
+        key = tuple(row)
+        kwargs = label_kwargs.get(key)
+        if kwargs is None:
+            kwargs = {}
+            for code, (category, category_values) in zip(row, values):
+                if code < 0 or category not in fields:
+                    continue
+                field_name, is_list = fields[category]
+                value = category_values[code]
+                kwargs[field_name] = value.split(LABEL_SEPARATOR) if is_list else value
+            label_kwargs[key] = kwargs
+        annotation = TimelineAnnotation(start_time=offsets[segment], end_time=offsets[segment + 1])
+        annotation.update_comment_body(**kwargs)
+        annotations.append(annotation)
+    return annotations
+
+
+def _category_of(name):
+    stem = os.path.splitext(os.path.basename(name))[0]
+    for category in LABELSETS:
+        if stem.lower() == category.lower():
+            return category
+    return None
+
+
+def import_bundle(path, progress=None, prefer_labels=True):
+    """
+    Annotations of an exported ZIP bundle, or of a directory of its CSVs.
+
+    ZIP members are read as streams without extracting them. When the
+    bundle has a labels.json (or binary session) and prefer_labels is true,
+    that is loaded; otherwise the annotations are rebuilt from the category
+    CSVs, to the one-second resolution of their times. Returns a LoadResult;
+    a result rebuilt from CSVs has no videoHash in its header.
+    """
+    if os.path.isdir(path):
+        names = sorted(name for name in os.listdir(path) if _category_of(name))
+        return _import_csvs([(name, lambda name=name: open(os.path.join(path, name), 'rb')) for name in names],
+                            progress)
+    with ZipFile(path) as zipf:
+        members = [info for info in zipf.infolist() if not info.is_dir()]
+        if prefer_labels:
+            for info in members:
+                if os.path.basename(info.filename) in LABELS_MEMBERS:
+                    with zipf.open(info) as f:
+                        return read_annotations(f, info.file_size, progress)
+        csvs = [(info.filename, lambda info=info: zipf.open(info)) for info in members if _category_of(info.filename)]
+        return _import_csvs(csvs, progress)
+
+
+def _import_csvs(members, progress):
+    intervals = {}
+    errors = []
+    for i, (name, opener) in enumerate(members):
+        with opener() as raw, io.TextIOWrapper(raw, encoding='utf-8-sig', newline='') as f:
+            starts, stops, predictions, member_errors = read_category_csv(f, name)
+        errors.extend(member_errors)
+        intervals[_category_of(name)] = (starts, stops, predictions)
+        if progress is not None:
+            progress((i + 1) / (len(members) + 1))
+    annotations = annotations_from_intervals(intervals)
+    if progress is not None:
+        progress(1.0)
+    return LoadResult(AnnotationStore(annotations), {}, errors)
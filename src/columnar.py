@@ -0,0 +1,107 @@
+import struct
+from zipfile import ZIP_STORED, ZipFile, is_zipfile
+import numpy as np
+from src.annotation_store import as_store
+from src.label_arrays import _smallest_code_dtype, category_codes
+from src.utils import zip_member
+
+COLUMNAR_EXTENSION = ".npz"
+COLUMNAR_VERSION = 1
+# Marker member: label matrices (see label_arrays) are .npz files too
+COLUMNAR_FORMAT = "paaws-columns"
+_LOCAL_HEADER = struct.Struct('<4s5H3L2H')
+
+
+def _id_array(ids):
+    """Annotation ids as fixed-width bytes when they are ASCII (UUIDs are), else as text"""
+    try:
+        return np.array(ids, dtype='S')
+    except UnicodeEncodeError:
+        return np.array(ids, dtype=str)
+
+
+def write_columns(path, annotations, video_hash=0):
+    """
+    Write annotations as an uncompressed .npz of columns.
+
+    Members: "format" (COLUMNAR_FORMAT), "start_ms" and "end_ms" (int64 milliseconds), "codes" (rows x
+    categories, smallest unsigned int, stored column by column),
+    "categories", "values" (categories x codes label table, code 0 is
+    unlabeled), "ids" (ASCII bytes where possible), "video_hash" and
+    "version". Members are stored
+    uncompressed so load_columns can memory-map them in place.
+    """
+    store = as_store(annotations)
+    starts, ends, columns = category_codes(store)
+    dtype = _smallest_code_dtype(columns)
+    values = [category_values for _, category_values in columns.values()]
+    width = max(len(category_values) for category_values in values)
+    codes = np.empty((len(store), len(columns)), dtype=dtype, order='F')
+    for j, (column_codes, _) in enumerate(columns.values()):
+        codes[:, j] = column_codes
+    arrays = {
+        "format": np.array(COLUMNAR_FORMAT),
+        "version": np.array(COLUMNAR_VERSION),
+        "start_ms": np.round(starts * 1000).astype(np.int64),
+        "end_ms": np.round(ends * 1000).astype(np.int64),
+        "codes": codes,
+        "categories": np.array(list(columns)),
+        "values": np.array([category_values + [""] * (width - len(category_values)) for category_values in values]),
+        "ids": _id_array([annotation.id for annotation in store]),
+        "video_hash": np.array(str(video_hash)),
+    }
+    with ZipFile(path, 'w', compression=ZIP_STORED) as zipf:
+        for name, array in arrays.items():
+            with zipf.open(zip_member(zipf, name + '.npy'), 'w', force_zip64=True) as f:
+                np.lib.format.write_array(f, array, allow_pickle=False)
+
+
+def _member_array(f, path, info, mmap_mode):
+    """Array of a stored .npy member, memory-mapped where it lies in the zip file"""
+    f.seek(info.header_offset)
+    fields = _LOCAL_HEADER.unpack(f.read(_LOCAL_HEADER.size))
+    f.seek(info.header_offset + _LOCAL_HEADER.size + fields[-2] + fields[-1])
+    if np.lib.format.read_magic(f) == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+    if mmap_mode is None or dtype.hasobject or 0 in shape:
+        count = int(np.prod(shape))
+        array = np.frombuffer(f.read(count * dtype.itemsize), dtype=dtype, count=count)
+        return array.reshape(shape, order='F' if fortran_order else 'C')
+    return np.memmap(path, dtype=dtype, mode=mmap_mode, offset=f.tell(), shape=shape,
+                     order='F' if fortran_order else 'C')
+
+
+def is_columnar(path):
+    """True if path is an archive written by write_columns, whatever its name"""
+    if not is_zipfile(path):
+        return False
+    with ZipFile(path) as zipf:
+        if 'format.npy' not in zipf.namelist():
+            return False
+        with zipf.open('format.npy') as f:
+            return str(np.lib.format.read_array(f, allow_pickle=False)) == COLUMNAR_FORMAT
+
+
+def load_columns(path, mmap_mode='r'):
+    """
+    Arrays of a file written by write_columns, by member name.
+
+    The numeric columns are memory-mapped (mmap_mode=None reads them
+    instead), so opening a large export costs no parsing and pages are read
+    only when used. Small members are returned as ordinary arrays. Raises
+    ValueError for other archives, such as label matrices.
+    """
+    if not is_columnar(path):
+        raise ValueError(f"{path} is not a columnar label export")
+    arrays = {}
+    with ZipFile(path) as zipf, open(path, 'rb') as f:
+        for info in zipf.infolist():
+            name = info.filename[:-len('.npy')] if info.filename.endswith('.npy') else info.filename
+            if info.compress_type != ZIP_STORED:
+                with zipf.open(info) as member:
+                    arrays[name] = np.lib.format.read_array(member, allow_pickle=False)
+                continue
+            arrays[name] = _member_array(f, path, info, mmap_mode if name in ("start_ms", "end_ms", "codes") else None)
+    return arrays
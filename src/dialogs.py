@@ -10,6 +10,7 @@ from PyQt6.QtCore import Qt, pyqtSignal, QSize, QRect, QPoint, QTimer, QSettings
 from PyQt6.QtGui import QKeyEvent
 from src.utils import resource_path
 from src.custom_combo import SearchableComboBox, MultiSelectComboBox
+from src.models import AnnotationLabels
 
 # Constants
 APP_NAME = "PAAWS-Annotation-Software"
@@ -402,12 +403,12 @@ class AnnotationDialog(QDialog):
         dialog_layout = QVBoxLayout(self); dialog_layout.setContentsMargins(0, 0, 0, 0); dialog_layout.addWidget(main_scroll)
     
     def _get_initial_data(self, annotation):
-        if annotation and hasattr(annotation, 'comments') and annotation.comments:
-            try:
-                return json.loads(annotation.comments[0]["body"])
-            except Exception as e:
-                QMessageBox.critical(self, "Load Error", f"Failed to parse annotation: {e}")
-                return None
+        labels = getattr(annotation, 'labels', None) if annotation else None
+        if not isinstance(labels, AnnotationLabels) and annotation and getattr(annotation, 'comments', None):
+            # Duck-typed annotations without decoded labels still carry a v1 body
+            labels = AnnotationLabels.from_body(annotation.comments[0].get("body"))
+        if isinstance(labels, AnnotationLabels):
+            return [{"category": category, "selectedValue": value} for category, value in labels.items()]
         elif hasattr(self.parent(), "annotation_manager") and hasattr(self.parent().annotation_manager, "last_used_labels"):
             d = self.parent().annotation_manager.last_used_labels
             if any(v for k, v in d.items() if k != "special_notes" or v):
@@ -0,0 +1,94 @@
+import hashlib
+import json
+import mmap
+import os
+import threading
+
+FINGERPRINT_PREFIX = "sfp1-"
+BLOCK_SIZE = 256 * 1024
+
+
+def sampled_fingerprint(file_path, block_size=BLOCK_SIZE):
+    """
+    Fingerprint of a video from its size and three sampled blocks.
+
+    The head, middle and tail blocks are read through a memory map, so the
+    cost does not depend on the file size. Files shorter than three blocks
+    are hashed whole.
+    """
+    size = os.path.getsize(file_path)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(size.to_bytes(8, 'little'))
+    digest.update(block_size.to_bytes(8, 'little'))
+    if size:
+        with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if size <= 3 * block_size:
+                digest.update(mapped[:])
+            else:
+                middle = (size - block_size) // 2
+                for offset in (0, middle, size - block_size):
+                    digest.update(mapped[offset:offset + block_size])
+    return FINGERPRINT_PREFIX + digest.hexdigest()
+
+
+class FingerprintCache:
+    """
+    Fingerprints persisted to a JSON file, keyed by path and valid while the
+    file keeps the size and modification time it had when it was hashed.
+    """
+    max_entries = 1000
+
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+        self._lock = threading.Lock()
+        self._entries = None
+
+    def _load(self):
+        if self._entries is None:
+            try:
+                with open(self.cache_path, 'r') as f:
+                    entries = json.load(f)
+                self._entries = entries if isinstance(entries, dict) else {}
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    @staticmethod
+    def _stat_key(file_path):
+        stat = os.stat(file_path)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def get(self, file_path):
+        """Cached fingerprint of file_path, or None if unknown or the file changed"""
+        try:
+            key = self._stat_key(file_path)
+        except OSError:
+            return None
+        with self._lock:
+            entry = self._load().get(os.path.abspath(file_path))
+        if entry and entry.get("stat") == key:
+            return entry.get("fingerprint")
+        return None
+
+    def fingerprint(self, file_path):
+        """Fingerprint of file_path, computed and stored if not cached"""
+        cached = self.get(file_path)
+        if cached is not None:
+            return cached
+        key = self._stat_key(file_path)
+        fingerprint = sampled_fingerprint(file_path)
+        with self._lock:
+            entries = self._load()
+            path = os.path.abspath(file_path)
+            entries.pop(path, None)
+            entries[path] = {"stat": key, "fingerprint": fingerprint}
+            while len(entries) > self.max_entries:
+                del entries[next(iter(entries))]
+            try:
+                temp_path = self.cache_path + ".tmp"
+                with open(temp_path, 'w') as f:
+                    json.dump(entries, f)
+                os.replace(temp_path, self.cache_path)
+            except OSError as e:
+                print(f"Could not save fingerprint cache: {str(e)}")
+        return fingerprint
@@ -0,0 +1,446 @@
+import csv
+import heapq
+import json
+import os
+from zipfile import ZIP_DEFLATED, ZipFile
+import numpy as np
+from src.annotation_store import as_store
+from src.models import FREE_TEXT_CATEGORIES, LABEL_CATEGORIES
+from src.utils import zip_member
+from src.vocabulary import get_vocabulary
+
+MIN_RATE = 1
+MAX_RATE = 80
+MATRIX_CHUNK_SIZE = 1 << 20
+# Multi-valued labels are joined with this, as in the exported CSVs
+LABEL_SEPARATOR = ", "
+
+
+def category_codes(annotations):
+    """
+    Per-category label columns of annotations.
+
+    Returns (starts, ends, {category: (codes, values)}): the start and end
+    times as float64 arrays in store order and, per category, an int array
+    of codes into values. values[0] is "" (unlabeled); the other values are
+    the labels as exported, with the labels of multi-valued categories
+    joined by LABEL_SEPARATOR. Labels are decoded once per distinct label
+    set.
+    """
+    store = as_store(annotations)
+    starts = np.frombuffer(store.start_times(), dtype=np.float64)
+    ends = np.frombuffer(store.end_times(), dtype=np.float64)
+    rows = np.frombuffer(store.label_codes(), dtype=np.uint32) if len(store) else np.empty(0, np.uint32)
+    table = store.label_table()
+    vocabulary = get_vocabulary()
+    columns = {}
+    for category, field_name, is_list in LABEL_CATEGORIES:
+        values = [""]
+        indices = {"": 0}
+        table_codes = np.empty(len(table), dtype=np.int64)
+        for i, labels in enumerate(table):
+            if category in FREE_TEXT_CATEGORIES:
+                value = getattr(labels, field_name)
+            else:
+                codes = getattr(labels.codes, field_name)
+                value = LABEL_SEPARATOR.join(vocabulary.decode(category, code)
+                                             for code in (codes if is_list else (codes,))
+                                             if not vocabulary.is_unlabeled(category, code))
+            if value not in indices:
+                indices[value] = len(values)
+                values.append(value)
+            table_codes[i] = indices[value]
+        columns[category] = (table_codes[rows] if len(table) else np.zeros(0, np.int64), values)
+    return starts, ends, columns
+
+
+def visible_intervals(starts, ends):
+    """
+    Non-overlapping pieces of intervals sorted by start.
+
+    Returns (starts, ends, rows): where intervals overlap, the one starting
+    later (the later row for equal starts) covers the earlier one, which may
+    leave it split in two pieces. Sessions are normally free of overlaps, in
+    which case the intervals are returned as they are.
+    """
+    starts, ends = np.asarray(starts, dtype=np.float64), np.asarray(ends, dtype=np.float64)
+    if not np.any(ends[:-1] > starts[1:]):
+        return starts, ends, np.arange(len(starts))
+    bounds = np.unique(np.concatenate([starts, ends]))
+    winners = np.full(len(bounds) - 1, -1, dtype=np.int64)
+    active = []
+    row = 0
+    start_list, end_list = starts.tolist(), ends.tolist()
+    for k, bound in enumerate(bounds[:-1].tolist()):
+        while row < len(start_list) and start_list[row] <= bound:
+            heapq.heappush(active, (-row, end_list[row]))
+            row += 1
+        while active and active[0][1] <= bound:
+            heapq.heappop(active)
+        if active:
+            winners[k] = -active[0][0]
+    # Merge runs of elementary intervals with the same winner
+    runs = np.flatnonzero(np.diff(winners, prepend=-2) != 0)
+    run_ends = np.append(runs[1:], len(winners))
+    keep = winners[runs] >= 0
+    return bounds[runs][keep], bounds[run_ends][keep], winners[runs][keep]
+
+
+def _covering(starts, ends, times):
+    # The only candidate for a time is the last interval starting at or before it
+    rows = np.searchsorted(starts, times, side='right') - 1
+    # Row -1 reads the padding, which no time is before
+    padded_ends = np.append(ends, -np.inf)
+    rows[times >= padded_ends[rows]] = -1
+    return rows
+
+
+def covering_rows(starts, ends, times):
+    """
+    Row of the interval containing each time, or -1.
+
+    Intervals are half-open [start, end) and sorted by start; where they
+    overlap, the one starting later wins (see visible_intervals).
+    """
+    piece_starts, piece_ends, rows = visible_intervals(starts, ends)
+    return np.append(rows, -1)[_covering(piece_starts, piece_ends, times)]
+
+
+def _smallest_code_dtype(columns):
+    largest = max((len(values) for _, values in columns.values()), default=1)
+    return np.dtype(np.uint8 if largest <= 0xFF else np.uint16 if largest <= 0xFFFF else np.uint32)
+
+
+def _sample_count(ends, rate, start, end):
+    if not MIN_RATE <= rate <= MAX_RATE:
+        raise ValueError(f"Sampling rate must be between {MIN_RATE} and {MAX_RATE} Hz")
+    if end is None:
+        end = float(ends.max()) if len(ends) else start
+    return max(int(np.ceil((end - start) * rate - 1e-9)), 0)
+
+
+def _matrix_chunks(starts, ends, columns, rate, start, count, chunk_size):
+    dtype = _smallest_code_dtype(columns)
+    starts, ends, pieces = visible_intervals(starts, ends)
+    # A trailing 0 makes row -1 (no annotation) gather unlabeled
+    padded_codes = [np.append(codes[pieces], 0).astype(dtype) for codes, _ in columns.values()]
+    for first in range(0, count, chunk_size):
+        times = start + np.arange(first, min(first + chunk_size, count), dtype=np.float64) / rate
+        rows = _covering(starts, ends, times)
+        matrix = np.empty((len(times), len(columns)), dtype=dtype)
+        for j, codes in enumerate(padded_codes):
+            matrix[:, j] = codes[rows]
+        yield times, matrix
+
+
+def iter_label_matrix(annotations, rate, start=0.0, end=None, chunk_size=MATRIX_CHUNK_SIZE):
+    """
+    Dense labels sampled at rate Hz, in chunks.
+
+    Sample i is taken at start + i / rate, up to but excluding end (the end
+    of the last annotation by default). Yields (times, matrix) per chunk of
+    at most chunk_size samples: the float64 sample times and a (samples,
+    categories) code matrix in LABEL_CATEGORIES order, with codes into the
+    value tables of category_codes and 0 for unlabeled.
+    """
+    starts, ends, columns = category_codes(annotations)
+    count = _sample_count(ends, rate, start, end)
+    yield from _matrix_chunks(starts, ends, columns, rate, start, count, chunk_size)
+
+
+def _write_npy(f, chunks, shape, dtype):
+    """Stream chunks of a 2-D array into f as a .npy file"""
+    np.lib.format.write_array_header_1_0(f, {'descr': np.lib.format.dtype_to_descr(dtype),
+                                            'fortran_order': False, 'shape': shape})
+    for matrix in chunks:
+        f.write(np.ascontiguousarray(matrix).tobytes())
+
+
+def export_label_matrix(path, annotations, rate, start=0.0, end=None, chunk_size=MATRIX_CHUNK_SIZE):
+    """
+    Write the dense label matrix of annotations at rate Hz to path.
+
+    The format follows the extension:
+
+    - .csv: a TIME column (seconds) and one column of labels per category
+    - .npy: the (samples, categories) code matrix, plus a <stem>_values.json
+      sidecar with the rate, start time, categories and value tables
+    - .npz: "labels" (the code matrix), "categories", "values" (a
+      categories x codes string table), "rate" and "start"
+
+    The matrix is computed and written in chunks of chunk_size samples, so
+    memory use does not grow with the length of the session. Returns the
+    number of samples written.
+    """
+    categories = [category for category, _, _ in LABEL_CATEGORIES]
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in ('.csv', '.npy', '.npz'):
+        raise ValueError(f"Unsupported label matrix format {extension!r}")
+    starts, ends, columns = category_codes(annotations)
+    samples = _sample_count(ends, rate, start, end)
+    chunks = _matrix_chunks(starts, ends, columns, rate, start, samples, chunk_size)
+    values = [values for _, values in columns.values()]
+    dtype = _smallest_code_dtype(columns)
+
+    if extension == '.csv':
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['TIME'] + categories)
+            tables = [np.asarray(category_values, dtype=object) for category_values in values]
+            for times, matrix in chunks:
+                labels = [table[matrix[:, j]].tolist() for j, table in enumerate(tables)]
+                writer.writerows(zip(np.round(times, 6).tolist(), *labels))
+    elif extension == '.npy':
+        with open(path, 'wb') as f:
+            _write_npy(f, (matrix for _, matrix in chunks), (samples, len(categories)), dtype)
+        with open(os.path.splitext(path)[0] + '_values.json', 'w') as f:
+            json.dump({"rate": rate, "start": start, "samples": samples, "categories": categories,
+                       "values": values}, f, indent=4)
+    else:
+        width = max(len(category_values) for category_values in values)
+        table = np.array([category_values + [""] * (width - len(category_values)) for category_values in values])
+        with ZipFile(path, 'w', compression=ZIP_DEFLATED) as zipf:
+            with zipf.open(zip_member(zipf, 'labels.npy'), 'w', force_zip64=True) as f:
+                _write_npy(f, (matrix for _, matrix in chunks), (samples, len(categories)), dtype)
+            for name, array in (('categories', np.array(categories)), ('values', table),
+                                ('rate', np.array(rate, dtype=np.float64)),
+                                ('start', np.array(start, dtype=np.float64))):
+                with zipf.open(zip_member(zipf, name + '.npy'), 'w') as f:
+                    np.lib.format.write_array(f, array, allow_pickle=False)
+    return samples
+
+
+class EpochSummary:
+    """
+    Labels of one category aggregated over fixed epochs.
+
+    coverage[i, code] is the number of seconds of epoch i labelled with
+    values[code]; column 0 holds the unlabeled time. majority[i] is the
+    code with the most time in epoch i, unlabeled included; ties go to a
+    label over unlabeled time and otherwise to the lower code.
+    """
+
+    def __init__(self, category, values, coverage, durations):
+        self.category = category
+        self.values = values
+        self.coverage = coverage
+        self.fractions = coverage / durations[:, None] if len(durations) else coverage
+        if len(coverage) and coverage.shape[1] > 1:
+            labelled = coverage[:, 1:].argmax(axis=1) + 1
+            self.majority = np.where(coverage[:, 0] > coverage[np.arange(len(coverage)), labelled], 0, labelled)
+        else:
+            self.majority = np.zeros(len(coverage), np.int64)
+
+    @property
+    def unlabeled(self):
+        """Fraction of each epoch without a label in this category"""
+        return self.fractions[:, 0]
+
+    def majority_labels(self):
+        return [self.values[code] for code in self.majority.tolist()]
+
+
+class EpochAggregation:
+    """Result of aggregate_epochs: the epoch grid and an EpochSummary per category"""
+
+    def __init__(self, epoch_length, starts, durations, categories):
+        self.epoch_length = epoch_length
+        self.starts = starts
+        self.durations = durations
+        self.categories = categories
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, category):
+        return self.categories[category]
+
+
+def aggregate_epochs(annotations, epoch_length, start=0.0, end=None):
+    """
+    Aggregate labels over consecutive epochs of epoch_length seconds.
+
+    Epochs start at start and tile the range up to end (the end of the last
+    annotation by default); the last one may be shorter. Each annotation is
+    clipped against every epoch it overlaps in one vectorized step, and the
+    overlaps are summed per epoch and label with bincount, so the cost does
+    not depend on the number of epochs an annotation spans.
+    """
+    if epoch_length <= 0:
+        raise ValueError("Epoch length must be positive")
+    starts, ends, columns = category_codes(annotations)
+    if end is None:
+        end = float(ends.max()) if len(ends) else start
+    # Overlapping annotations would count the same seconds twice
+    starts, ends, pieces = visible_intervals(starts, ends)
+    count = max(int(np.ceil((end - start) / epoch_length - 1e-9)), 0)
+    epoch_starts = start + np.arange(count, dtype=np.float64) * epoch_length
+    durations = np.minimum(epoch_starts + epoch_length, end) - epoch_starts
+
+    clipped_starts = np.maximum(starts, start)
+    clipped_ends = np.minimum(ends, end)
+    rows = np.flatnonzero(clipped_ends > clipped_starts)
+    clipped_starts, clipped_ends = clipped_starts[rows], clipped_ends[rows]
+    first = np.floor((clipped_starts - start) / epoch_length).astype(np.int64)
+    last = np.minimum(np.ceil((clipped_ends - start) / epoch_length).astype(np.int64) - 1, count - 1)
+    spans = np.maximum(last - first + 1, 0)
+    # One entry per (annotation, epoch) pair the annotation overlaps
+    pair_rows = np.repeat(np.arange(len(rows)), spans)
+    epochs = first[pair_rows] + np.arange(len(pair_rows)) - np.repeat(np.cumsum(spans) - spans, spans)
+    # Rounding at epoch edges can add an empty pair; clip it to no time
+    overlaps = np.maximum(np.minimum(clipped_ends[pair_rows], epoch_starts[epochs] + durations[epochs])
+                          - np.maximum(clipped_starts[pair_rows], epoch_starts[epochs]), 0)
+
+    categories = {}
+    for category, (codes, values) in columns.items():
+        pair_codes = codes[pieces[rows]][pair_rows]
+        labelled = pair_codes > 0
+        coverage = np.bincount(epochs[labelled] * len(values) + pair_codes[labelled], weights=overlaps[labelled],
+                               minlength=count * len(values)).astype(np.float64).reshape(count, len(values))
+        coverage[:, 0] = np.maximum(durations - coverage[:, 1:].sum(axis=1), 0)
+        categories[category] = EpochSummary(category, values, coverage, durations)
+    return EpochAggregation(epoch_length, epoch_starts, durations, categories)
+
+
+def export_epochs(path, annotations, epoch_length, start=0.0, end=None):
+    """
+    Write aggregate_epochs as a CSV with one row per epoch.
+
+    Columns: EPOCH_START and EPOCH_END in seconds, then per category its
+    majority label, the unlabeled fraction and the fraction of each label.
+    Returns the number of epochs.
+    """
+    aggregation = aggregate_epochs(annotations, epoch_length, start, end)
+    header = ['EPOCH_START', 'EPOCH_END']
+    columns = [np.round(aggregation.starts, 6).tolist(),
+               np.round(aggregation.starts + aggregation.durations, 6).tolist()]
+    for category, summary in aggregation.categories.items():
+        header += [f"{category} MAJORITY", f"{category} UNLABELED"]
+        columns += [summary.majority_labels(), np.round(summary.unlabeled, 6).tolist()]
+        for code, value in enumerate(summary.values[1:], start=1):
+            header.append(f"{category}: {value}")
+            columns.append(np.round(summary.fractions[:, code], 6).tolist())
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(zip(*columns))
+    return len(aggregation)
+
+
+class LabelIndex:
+    """
+    Read-only columnar view of a session for vectorized queries.
+
+    Built once from annotations (or loaded from a session file with load);
+    later edits to the annotations are not reflected. Times are in seconds
+    and intervals are half-open [start, end), as in the label matrix.
+    """
+
+    def __init__(self, annotations):
+        store = as_store(annotations)
+        starts, ends, columns = category_codes(store)
+        self._set_columns(starts, ends, [annotation.id for annotation in store], columns)
+
+    @classmethod
+    def from_columns(cls, arrays):
+        """Index of the arrays of a columnar export (see columnar.load_columns), without parsing any text"""
+        index = cls.__new__(cls)
+        columns = {}
+        for j, category in enumerate(arrays["categories"].tolist()):
+            values = arrays["values"][j].tolist()
+            # The value table is padded with "" after each category's last label
+            while len(values) > 1 and values[-1] == "":
+                values.pop()
+            columns[category] = (arrays["codes"][:, j], values)
+        ids = arrays["ids"]
+        ids = ids.astype(str).tolist() if ids.dtype.kind == 'S' else ids.tolist()
+        index._set_columns(arrays["start_ms"] / 1000, arrays["end_ms"] / 1000, ids, columns)
+        return index
+
+    def _set_columns(self, starts, ends, ids, columns):
+        self.starts, self.ends, self._columns = starts, ends, columns
+        self.ids = ids
+        self.categories = list(self._columns)
+        self.code_dtype = _smallest_code_dtype(self._columns)
+        self._pieces = visible_intervals(starts, ends)
+        # Codes per row with a trailing 0, so row -1 (no annotation) gathers unlabeled
+        self._padded_codes = {category: np.append(codes, 0).astype(self.code_dtype)
+                              for category, (codes, _) in self._columns.items()}
+
+    @classmethod
+    def load(cls, path):
+        """Index of a labels.json, binary session, autosave, export ZIP or columnar export"""
+        # Both modules import this one
+        from src.batch_export import load_input
+        from src.columnar import is_columnar, load_columns
+        if is_columnar(path):
+            return cls.from_columns(load_columns(path))
+        if path.lower().endswith('.npz'):
+            raise ValueError(f"{path} is not a columnar label export; label matrices cannot be indexed")
+        return cls(load_input(path).annotations)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def values(self, category):
+        """Labels of a category, indexed by code; code 0 is unlabeled"""
+        return self._columns[category][1]
+
+    def codes(self, category):
+        """Per-annotation label codes of a category"""
+        return self._columns[category][0]
+
+    def rows_at(self, times):
+        """Row of the annotation containing each time, or -1"""
+        piece_starts, piece_ends, rows = self._pieces
+        return np.append(rows, -1)[_covering(piece_starts, piece_ends, np.asarray(times, dtype=np.float64))]
+
+    def labels_at(self, times, categories=None, chunk_size=MATRIX_CHUNK_SIZE):
+        """
+        Label codes active at each of times, per category.
+
+        Returns {category: codes} with one small-int array per category,
+        aligned with times (0 where nothing is labelled). times may be any
+        array-like, including a memory-mapped array larger than memory; it
+        is processed in chunks with one searchsorted per chunk, shared by
+        all categories.
+        """
+        times = np.asarray(times, dtype=np.float64)
+        categories = self.categories if categories is None else list(categories)
+        result = {category: np.zeros(times.shape, dtype=self.code_dtype) for category in categories}
+        flat_times = times.reshape(-1)
+        flat_results = {category: codes.reshape(-1) for category, codes in result.items()}
+        for first in range(0, len(flat_times), chunk_size):
+            rows = self.rows_at(flat_times[first:first + chunk_size])
+            for category in categories:
+                np.take(self._padded_codes[category], rows, out=flat_results[category][first:first + chunk_size])
+        return result
+
+    def decode(self, category, codes):
+        """Label strings of codes, as an object array"""
+        return np.asarray(self.values(category), dtype=object)[codes]
+
+    def columns(self):
+        """
+        The annotations as columns: {"id", "start", "end", <category>: codes}.
+
+        Arrays are the index's own, so nothing is copied per row; treat them
+        as read-only.
+        """
+        columns = {"id": self.ids, "start": self.starts, "end": self.ends}
+        for category in self.categories:
+            columns[category] = self.codes(category)
+        return columns
+
+    def to_dataframe(self):
+        """
+        The annotations as a pandas DataFrame (pandas is optional).
+
+        Category columns are pandas Categoricals built from the codes and
+        value tables, so the label strings are not repeated per row.
+        """
+        import pandas as pd
+        data = {"id": self.ids, "start": self.starts, "end": self.ends}
+        for category in self.categories:
+            data[category] = pd.Categorical.from_codes(self.codes(category), categories=self.values(category))
+        return pd.DataFrame(data, copy=False)
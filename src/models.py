@@ -1,61 +1,416 @@
 from dataclasses import dataclass
+from functools import cached_property, lru_cache
+import copy
 import json
+import sys
+import time
 import uuid
+import weakref
 from datetime import datetime
+from typing import NamedTuple
+from src.vocabulary import get_vocabulary
+
+# (comment body category, update_comment_body keyword, holds a list)
+LABEL_CATEGORIES = (
+    ("POSTURE", "posture", False),
+    ("HIGH LEVEL BEHAVIOR", "hlb", True),
+    ("PA TYPE", "pa_type", False),
+    ("Behavioral Parameters", "behavioral_params", True),
+    ("Experimental situation", "exp_situation", False),
+    ("Special Notes", "special_notes", False),
+)
+# Categories typed in by hand rather than picked from categories.csv. They are
+# not dictionary-encoded, so distinct notes do not grow the shared vocabulary.
+FREE_TEXT_CATEGORIES = frozenset({"Special Notes"})
+
+
+# Version of the saved record layout. v1 stores the labels of a comment as a
+# JSON string in "body"; v2 stores them as a "labels" object keyed by category.
+LABELS_SCHEMA_VERSION = 2
+
+
+class LabelCodes(NamedTuple):
+    """Vocabulary codes of an AnnotationLabels, field for field; free-text fields hold the text"""
+    posture: int
+    hlb: tuple
+    pa_type: int
+    behavioral_params: tuple
+    exp_situation: int
+    special_notes: str
+
+
+@dataclass(frozen=True)
+class AnnotationLabels:
+    """Decoded labels of an annotation, mirroring the JSON comment body"""
+    posture: str = ""
+    hlb: tuple = ()
+    pa_type: str = ""
+    behavioral_params: tuple = ()
+    exp_situation: str = ""
+    special_notes: str = ""
+
+    @classmethod
+    def from_body(cls, body):
+        """Decode a comment body string; invalid bodies yield empty labels"""
+        try:
+            items = json.loads(body) if body else []
+            data_map = {item.get("category"): item.get("selectedValue") for item in items}
+        except (ValueError, TypeError, AttributeError):
+            return cls()
+        return cls.from_values(data_map)
+
+    @classmethod
+    def from_values(cls, data_map):
+        """Build labels from a {category: selectedValue} mapping"""
+        kwargs = {}
+        for category, field_name, is_list in LABEL_CATEGORIES:
+            value = data_map.get(category)
+            if is_list:
+                kwargs[field_name] = tuple(value) if isinstance(value, (list, tuple)) else ()
+            else:
+                kwargs[field_name] = value if isinstance(value, str) else ""
+        return cls(**kwargs)
+
+    @classmethod
+    def from_codes(cls, codes):
+        """Decode LabelCodes back to labels"""
+        vocabulary = get_vocabulary()
+        kwargs = {}
+        for (category, field_name, is_list), code in zip(LABEL_CATEGORIES, codes):
+            if category in FREE_TEXT_CATEGORIES:
+                kwargs[field_name] = code
+            elif is_list:
+                kwargs[field_name] = tuple(vocabulary.decode_many(category, code))
+            else:
+                kwargs[field_name] = vocabulary.decode(category, code)
+        return cls(**kwargs)
+
+    @cached_property
+    def codes(self):
+        """Vocabulary codes of every category"""
+        vocabulary = get_vocabulary()
+        return LabelCodes(*(
+            getattr(self, field_name) if category in FREE_TEXT_CATEGORIES
+            else vocabulary.encode_many(category, getattr(self, field_name)) if is_list
+            else vocabulary.encode(category, getattr(self, field_name))
+            for category, field_name, is_list in LABEL_CATEGORIES
+        ))
+
+    @cached_property
+    def merge_key(self):
+        """Codes of the labels that must agree for a merge without a conflict prompt"""
+        codes = self.codes
+        return codes.posture, tuple(sorted(codes.hlb)), codes.pa_type
+
+    def items(self):
+        """(category, selectedValue) pairs in comment body order"""
+        return [(category, list(getattr(self, field_name)) if is_list else getattr(self, field_name))
+                for category, field_name, is_list in LABEL_CATEGORIES]
+
+    @cached_property
+    def by_category(self):
+        """{category: selectedValue} object written as the labels of a v2 record; do not modify"""
+        return dict(self.items())
+
+    def as_dict(self):
+        """Keyword arguments accepted by TimelineAnnotation.update_comment_body"""
+        return {field_name: list(getattr(self, field_name)) if is_list else getattr(self, field_name)
+                for _, field_name, is_list in LABEL_CATEGORIES}
+
+    def to_body(self):
+        return json.dumps([{"category": category, "selectedValue": value} for category, value in self.items()])
+
+
+DEFAULT_SHAPE = {
+    "x1": None,
+    "x2": None,
+    "y1": None,
+    "y2": None
+}
+
+# Weak, so labels (and the notes they hold) are dropped once no annotation uses them
+_INTERNED_LABELS = weakref.WeakValueDictionary()
+
+
+def _intern_labels(labels):
+    # Keyed by the field values, as a key is held strongly
+    key = tuple(getattr(labels, field_name) for _, field_name, _ in LABEL_CATEGORIES)
+    return _INTERNED_LABELS.setdefault(key, labels)
+
+
+@lru_cache(maxsize=4096)
+def _decode_body(body):
+    return _intern_labels(AnnotationLabels.from_body(body))
+
+
+@lru_cache(maxsize=4096)
+def _encode_labels(labels):
+    return sys.intern(labels.to_body())
+
 
-@dataclass
 class TimelineAnnotation:
+    """
+    A labelled time range.
+
+    Records are slotted and keep their single comment in compact form: the
+    comment id and metadata, an interned body string and the decoded labels,
+    which are shared between annotations with equal labels. The comments list
+    is built when read, so change it by assigning comments or calling
+    update_comment_body rather than mutating the returned list. Comment lists
+    that do not have the usual single-comment layout are kept as given.
+
+    The annotation and comment UUIDs are generated the first time they are
+    read, and saved records are restored with from_record, so neither path
+    spends time on ids or timestamps that are never used. to_record returns
+    the saved form and caches it until the annotation changes.
+    """
+    __slots__ = ('_store', '_id', '_start_time', '_end_time', '_shape', '_comments',
+                 '_comment_id', '_comment_meta', '_created', '_body', '_labels', '_record')
+
     def __init__(self, start_time=0, end_time=0):
-        self.id = str(uuid.uuid4())
-        self.start_time = start_time
-        self.end_time = end_time
-        self.shape = {
-            "x1": None,
-            "x2": None,
-            "y1": None,
-            "y2": None
-        }
-        self.comments = []
-        self._add_initial_comment()
-        
-    def _add_initial_comment(self):
-        comment = {
-            "id": str(uuid.uuid4()),
-            "meta": {
-                "datetime": datetime.now().isoformat(),
-                "user_id": "NA",
-                "user_name": "NA"
+        self._init_slots(start_time, end_time)
+        self._created = time.time()
+
+    def _init_slots(self, start_time, end_time):
+        self._store = None
+        self._id = None
+        self._start_time = start_time
+        self._end_time = end_time
+        self._shape = None
+        self._comments = None
+        self._comment_id = None
+        self._comment_meta = None
+        self._created = None
+        self._body = "[]"
+        self._labels = None
+        self._record = None
+
+    @classmethod
+    def from_record(cls, record):
+        """Build an annotation from a saved {"id", "range", "shape", "comments"} record"""
+        annotation = cls.__new__(cls)
+        annotation._init_slots(record["range"]["start"], record["range"]["end"])
+        annotation._id = record["id"]
+        annotation.shape = record.get("shape")
+        annotation.comments = record.get("comments", [])
+        return annotation
+
+    @classmethod
+    def from_records(cls, records):
+        """Build annotations from an iterable of saved records, v1 or v2"""
+        return [cls.from_record(record) for record in records]
+
+    def to_record(self, version=LABELS_SCHEMA_VERSION):
+        """
+        Saved {"id", "range", "shape", "comments"} record of this annotation.
+
+        Version 2 records carry the labels as an object; version 1 records
+        carry them as the JSON body string older tools expect. Comment lists
+        kept as given are written unchanged, except that v1 records get any
+        "labels" object converted to a body string. The record is
+        built from copies and the v2 record is cached until the annotation
+        changes, so it can be handed to another thread and must not be
+        modified.
+        """
+        if self._record is not None and version == LABELS_SCHEMA_VERSION:
+            return self._record
+        if self._comments is not None:
+            comments = copy.deepcopy(self._comments)
+            if version == 1:
+                for comment in comments:
+                    if isinstance(comment.get("labels"), dict):
+                        comment["body"] = _encode_labels(_intern_labels(AnnotationLabels.from_values(comment.pop("labels"))))
+        elif version == 1:
+            comments = self.comments
+        else:
+            if self._comment_id is None:
+                self._comment_id = str(uuid.uuid4())
+            comments = [{"id": self._comment_id, "meta": self._meta(), "labels": self.labels.by_category}]
+        record = {
+            "id": self.id,
+            "range": {
+                "start": self._start_time,
+                "end": self._end_time
             },
-            "body": "[]"
+            "shape": dict(self.shape),
+            "comments": comments
         }
-        self.comments.append(comment)
-        
+        # Raw comment lists may be mutated in place, so only compact records are cached
+        if self._comments is None and version == LABELS_SCHEMA_VERSION:
+            self._record = record
+        return record
+
+    @property
+    def id(self):
+        if self._id is None:
+            self._id = str(uuid.uuid4())
+        return self._id
+
+    @id.setter
+    def id(self, value):
+        self._id = value
+        self._changed()
+
+    @property
+    def start_time(self):
+        return self._start_time
+
+    @start_time.setter
+    def start_time(self, value):
+        old_start = self._start_time
+        self._start_time = value
+        self._record = None
+        if self._store is not None:
+            self._store._times_changed(self, old_start)
+
+    @property
+    def end_time(self):
+        return self._end_time
+
+    @end_time.setter
+    def end_time(self, value):
+        self._end_time = value
+        self._record = None
+        if self._store is not None:
+            self._store._times_changed(self, self._start_time)
+
+    @property
+    def shape(self):
+        return dict(DEFAULT_SHAPE) if self._shape is None else self._shape
+
+    @shape.setter
+    def shape(self, shape):
+        self._shape = None if shape is None or shape == DEFAULT_SHAPE else shape
+        self._changed()
+
+    @property
+    def comments(self):
+        if self._comments is not None:
+            return self._comments
+        if self._comment_id is None:
+            self._comment_id = str(uuid.uuid4())
+        return [{"id": self._comment_id, "meta": self._meta(), "body": self.body}]
+
+    @comments.setter
+    def comments(self, comments):
+        comment = comments[0] if isinstance(comments, list) and len(comments) == 1 else None
+        keys = comment.keys() if isinstance(comment, dict) else ()
+        if keys == {"id", "meta", "body"} and isinstance(comment["body"], str):
+            self._comments = None
+            self._comment_id = comment["id"]
+            self._comment_meta = comment["meta"]
+            self._body = sys.intern(comment["body"])
+            self._labels = None
+        elif keys == {"id", "meta", "labels"} and isinstance(comment["labels"], dict):
+            # v2 comment: take the labels as they are and serialize a body only if asked
+            self._comments = None
+            self._comment_id = comment["id"]
+            self._comment_meta = comment["meta"]
+            self._body = None
+            self._labels = _intern_labels(AnnotationLabels.from_values(comment["labels"]))
+        else:
+            self._comments = comments
+            self._labels = None
+        self._labels_changed()
+
+    def _meta(self):
+        if self._comment_meta is not None:
+            return self._comment_meta
+        return {
+            "datetime": datetime.fromtimestamp(self._created).isoformat(),
+            "user_id": "NA",
+            "user_name": "NA"
+        }
+
+    @property
+    def body(self):
+        """Serialized labels of the first comment"""
+        if self._comments is not None:
+            comment = self._comments[0] if self._comments else {}
+            body = comment.get("body", "[]")
+            if isinstance(comment.get("labels"), dict):
+                return _encode_labels(self.labels)
+            return body if isinstance(body, str) else "[]"
+        if self._body is None:
+            # Labels set through update_comment_body are only serialized when
+            # the comment is actually read, e.g. for autosave or export.
+            self._body = _encode_labels(self._labels)
+        return self._body
+
+    @property
+    def labels(self):
+        """Labels decoded from the first comment body, shared between equal bodies"""
+        if self._comments is not None:
+            labels = self._comments[0].get("labels") if self._comments else None
+            if isinstance(labels, dict):
+                return _intern_labels(AnnotationLabels.from_values(labels))
+            return _decode_body(self.body)
+        if self._labels is None:
+            self._labels = _decode_body(self._body)
+        return self._labels
+
+    def _changed(self):
+        self._record = None
+        if self._store is not None:
+            self._store._annotation_changed(self)
+
+    def _labels_changed(self):
+        self._record = None
+        if self._store is not None:
+            self._store._labels_changed(self)
+
     def copy_comments_from(self, source_annotation):
         """Deep copy comments from another annotation with new UUIDs"""
-        self.comments = []
+        if isinstance(source_annotation, TimelineAnnotation) and source_annotation._comments is None:
+            meta = source_annotation._comment_meta
+            self._comments = None
+            self._comment_id = None
+            self._comment_meta = meta.copy() if meta is not None else None
+            self._created = source_annotation._created
+            self._body = source_annotation._body
+            self._labels = source_annotation._labels
+            self._labels_changed()
+            return
+
+        comments = []
         for comment in source_annotation.comments:
             new_comment = {
                 "id": str(uuid.uuid4()),
-                "meta": comment["meta"].copy(),
-                "body": comment["body"]
+                "meta": dict(comment.get("meta") or {}),
             }
-            self.comments.append(new_comment)
-            
+            if isinstance(comment.get("labels"), dict):
+                new_comment["labels"] = copy.deepcopy(comment["labels"])
+            else:
+                new_comment["body"] = comment.get("body", "[]")
+            comments.append(new_comment)
+        self.comments = comments
+
     def update_comment_body(self, posture="", hlb=None, pa_type="", behavioral_params=None, exp_situation="", special_notes=""):
         if hlb is None:
             hlb = []
         if behavioral_params is None:
             behavioral_params = []
-            
-        comment_data = [
-            {"category": "POSTURE", "selectedValue": posture},
-            {"category": "HIGH LEVEL BEHAVIOR", "selectedValue": hlb},
-            {"category": "PA TYPE", "selectedValue": pa_type},
-            {"category": "Behavioral Parameters", "selectedValue": behavioral_params},
-            {"category": "Experimental situation", "selectedValue": exp_situation},
-            {"category": "Special Notes", "selectedValue": special_notes}
-        ]
-        self.comments[0]["body"] = json.dumps(comment_data)
+
+        labels = _intern_labels(AnnotationLabels(
+            posture=posture or "",
+            hlb=tuple(hlb),
+            pa_type=pa_type or "",
+            behavioral_params=tuple(behavioral_params),
+            exp_situation=exp_situation or "",
+            special_notes=special_notes or ""
+        ))
+        if self._comments:
+            if isinstance(self._comments[0].get("labels"), dict):
+                self._comments[0]["labels"] = dict(labels.by_category)
+            else:
+                self._comments[0]["body"] = _encode_labels(labels)
+        else:
+            if self._comment_meta is None and self._created is None:
+                self._created = time.time()
+            self._comments = None
+            self._labels = labels
+            self._body = None
+        self._labels_changed()
 
     def __str__(self):
         return f"Annotation {self.id}: {self.start_time} - {self.end_time}"
@@ -0,0 +1,272 @@
+import json
+import struct
+import sys
+import zlib
+from array import array
+from src.models import DEFAULT_SHAPE
+
+SESSION_MAGIC = b"PAAWS\x00S1"
+SESSION_EXTENSION = ".paaws"
+
+_COMPRESSION_NONE = 0
+_COMPRESSION_ZLIB = 1
+_LENGTH = struct.Struct('<Q')
+
+
+def _array_bytes(values):
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _array_from(typecode, content):
+    values = array(typecode)
+    values.frombytes(content)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def _regular_labels(record):
+    """
+    Labels of a record with the default shape and a single comment: the v1
+    body string or the v2 labels object. None for any other layout.
+    """
+    comments = record.get("comments")
+    if type(comments) is not list or len(comments) != 1:
+        return None
+    comment = comments[0]
+    if type(comment) is not dict or len(comment) != 3 or "id" not in comment or "meta" not in comment:
+        return None
+    labels = comment.get("labels")
+    if type(labels) is not dict:
+        labels = comment.get("body")
+        if type(labels) is not str:
+            return None
+    if record.get("shape") not in (None, DEFAULT_SHAPE):
+        return None
+    return labels
+
+
+def encode_session(data, compress=True):
+    """
+    Binary form of a session dict ({"annotations": [...], "videoHash", ...}).
+
+    Start and end times are stored as little-endian float64 columns; comment
+    labels (v1 body strings or v2 label objects) and metadata go into tables
+    referenced by uint32 codes, so equal labels are written once. Records
+    that do not have the regular single-comment layout are kept as JSON.
+    The whole payload is zlib compressed unless compress is False.
+    """
+    records = data.get("annotations", [])
+    header = {key: value for key, value in data.items() if key != "annotations"}
+    header["count"] = len(records)
+
+    ids = []
+    comment_ids = []
+    starts = array('d')
+    ends = array('d')
+    body_codes = array('I')
+    meta_codes = array('I')
+    bodies = {}
+    body_values = []
+    label_objects = {}
+    metas = {}
+    meta_values = []
+    irregular = {}
+    for row, record in enumerate(records):
+        ids.append(record["id"])
+        starts.append(record["range"]["start"])
+        ends.append(record["range"]["end"])
+        labels = _regular_labels(record)
+        if labels is not None:
+            comment = record["comments"][0]
+            comment_ids.append(comment["id"])
+            if type(labels) is str:
+                body_key = labels
+            else:
+                # Equal v2 labels are usually the same shared object
+                body_key = label_objects.get(id(labels))
+                if body_key is None:
+                    body_key = label_objects[id(labels)] = ("labels", json.dumps(labels, sort_keys=True))
+            if body_key not in bodies:
+                bodies[body_key] = len(body_values)
+                body_values.append(labels)
+            body_codes.append(bodies[body_key])
+            meta = comment["meta"]
+            try:
+                meta_key = tuple(meta.items())
+                hash(meta_key)
+            except (AttributeError, TypeError):
+                meta_key = json.dumps(meta, sort_keys=True)
+            if meta_key not in metas:
+                metas[meta_key] = len(meta_values)
+                meta_values.append(meta)
+            meta_codes.append(metas[meta_key])
+        else:
+            comment_ids.append(None)
+            body_codes.append(0)
+            meta_codes.append(0)
+            irregular[str(row)] = {"shape": record.get("shape"), "comments": record.get("comments", [])}
+
+    sections = [
+        json.dumps(header).encode('utf-8'),
+        json.dumps(ids).encode('utf-8'),
+        json.dumps(comment_ids).encode('utf-8'),
+        _array_bytes(starts),
+        _array_bytes(ends),
+        json.dumps(body_values).encode('utf-8'),
+        _array_bytes(body_codes),
+        json.dumps(meta_values).encode('utf-8'),
+        _array_bytes(meta_codes),
+        json.dumps(irregular).encode('utf-8'),
+    ]
+    payload = b"".join(_LENGTH.pack(len(section)) + section for section in sections)
+    if compress:
+        return SESSION_MAGIC + bytes([_COMPRESSION_ZLIB]) + zlib.compress(payload, 1)
+    return SESSION_MAGIC + bytes([_COMPRESSION_NONE]) + payload
+
+
+def decode_session(content):
+    """Session dict from encode_session output, with records in the JSON layout"""
+    if not is_binary_session(content):
+        raise ValueError("Not a binary session file")
+    compression = content[len(SESSION_MAGIC)]
+    payload = memoryview(content)[len(SESSION_MAGIC) + 1:]
+    if compression == _COMPRESSION_ZLIB:
+        payload = memoryview(zlib.decompress(payload))
+    elif compression != _COMPRESSION_NONE:
+        raise ValueError(f"Unknown session compression {compression}")
+
+    sections = []
+    offset = 0
+    while offset < len(payload):
+        (length,) = _LENGTH.unpack_from(payload, offset)
+        offset += _LENGTH.size
+        sections.append(payload[offset:offset + length])
+        offset += length
+    if len(sections) != 10:
+        raise ValueError("Truncated session file")
+
+    header = json.loads(bytes(sections[0]))
+    ids = json.loads(bytes(sections[1]))
+    comment_ids = json.loads(bytes(sections[2]))
+    starts = _array_from('d', sections[3])
+    ends = _array_from('d', sections[4])
+    bodies = json.loads(bytes(sections[5]))
+    body_codes = _array_from('I', sections[6])
+    metas = json.loads(bytes(sections[7]))
+    meta_codes = _array_from('I', sections[8])
+    irregular = json.loads(bytes(sections[9]))
+
+    records = []
+    for row, annotation_id in enumerate(ids):
+        record = {
+            "id": annotation_id,
+            "range": {
+                "start": starts[row],
+                "end": ends[row]
+            }
+        }
+        extra = irregular.get(str(row)) if irregular else None
+        if extra is not None:
+            record["shape"] = extra["shape"]
+            record["comments"] = extra["comments"]
+        else:
+            record["shape"] = dict(DEFAULT_SHAPE)
+            labels = bodies[body_codes[row]]
+            record["comments"] = [{
+                "id": comment_ids[row],
+                "meta": metas[meta_codes[row]],
+                "body" if type(labels) is str else "labels": labels
+            }]
+        records.append(record)
+
+    header.pop("count", None)
+    data = {"annotations": records}
+    data.update(header)
+    return data
+
+
+def is_binary_session(content):
+    return content[:len(SESSION_MAGIC)] == SESSION_MAGIC
+
+
+class FragmentCache:
+    """
+    JSON text of annotation records, reused while the record is unchanged.
+
+    Annotations hand out the same cached record object until they are
+    modified, so fragments are keyed by record identity: after an edit only
+    the records of the edited annotations are serialized again. Each call
+    keeps only the fragments of the records it was given. Fragments are
+    indented as elements of the top-level "annotations" array.
+    """
+
+    def __init__(self, indent=4):
+        self.indent = indent
+        self._fragments = {}
+
+    def fragments(self, records):
+        previous = self._fragments
+        current = {}
+        texts = []
+        prefix = "\n" + " " * (2 * self.indent) if self.indent is not None else None
+        for record in records:
+            key = id(record)
+            entry = previous.get(key)
+            if entry is None or entry[0] is not record:
+                text = json.dumps(record, indent=self.indent)
+                if prefix is not None:
+                    text = text.replace("\n", prefix)
+                entry = (record, text)
+            current[key] = entry
+            texts.append(entry[1])
+        self._fragments = current
+        return texts
+
+
+_ANNOTATIONS_PLACEHOLDER = "\x00annotations\x00"
+
+
+def _assemble_json(data, fragments):
+    """json.dumps(data, indent=fragments.indent), with the annotations taken from the cache"""
+    indent = fragments.indent
+    texts = fragments.fragments(data.get("annotations", []))
+    if not texts:
+        array_text = "[]"
+    elif indent is None:
+        array_text = "[" + ", ".join(texts) + "]"
+    else:
+        inner = "\n" + " " * (2 * indent)
+        array_text = "[" + inner + ("," + inner).join(texts) + "\n" + " " * indent + "]"
+    text = json.dumps(dict(data, annotations=_ANNOTATIONS_PLACEHOLDER), indent=indent)
+    return text.replace(json.dumps(_ANNOTATIONS_PLACEHOLDER), array_text, 1)
+
+
+def dumps_session(data, binary=False, indent=4, fragments=None):
+    """
+    Serialize a session dict as binary or as JSON text, both as bytes.
+
+    With a FragmentCache, JSON output reuses the cached text of unchanged
+    annotation records; the cache's indent then applies.
+    """
+    if binary:
+        return encode_session(data)
+    if fragments is not None:
+        return _assemble_json(data, fragments).encode('utf-8')
+    return json.dumps(data, indent=indent).encode('utf-8')
+
+
+def loads_session(content):
+    """Parse session bytes, detecting the binary format by its magic number"""
+    if is_binary_session(content):
+        return decode_session(content)
+    return json.loads(content)
+
+
+def load_session(path):
+    """Read a session file in either format"""
+    with open(path, 'rb') as f:
+        return loads_session(f.read())
@@ -2,20 +2,168 @@ import json
 import os
 from pathlib import Path
 import tempfile
-from typing import List, Optional, Tuple
-from src.models import TimelineAnnotation
+import threading
+import time
+import uuid
+from typing import List, Optional, Tuple, Union
+from zipfile import ZipFile, ZipInfo
+from src.models import LABELS_SCHEMA_VERSION, TimelineAnnotation
+from src.annotation_store import AnnotationStore
+from src.fingerprint import FINGERPRINT_PREFIX, FingerprintCache
+from src.autosave_versions import AutosaveVersions
+from src.session_format import FragmentCache, dumps_session, load_session
+from src.annotation_db import AnnotationDatabase
 import sys
 from pathlib import Path
 
+def snapshot_annotations(annotations) -> tuple:
+    """Immutable tuple of saved annotation records, cheap to take on the GUI thread"""
+    if isinstance(annotations, AnnotationStore):
+        return annotations.snapshot()
+    records = []
+    for annotation in annotations:
+        if isinstance(annotation, TimelineAnnotation):
+            records.append(annotation.to_record())
+        else:
+            records.append({
+                "id": annotation.id,
+                "range": {
+                    "start": annotation.start_time,
+                    "end": annotation.end_time
+                },
+                "shape": annotation.shape,
+                "comments": annotation.comments
+            })
+    return tuple(records)
+
+
+def _journal_ops(previous: dict, records: tuple) -> Tuple[dict, list]:
+    """
+    Operation records turning the previously written records into records.
+
+    Unchanged annotations hand out the same cached record object, so most
+    rows are skipped by an identity check. Returns ({id: record}, ops).
+    """
+    current = {}
+    ops = []
+    for record in records:
+        annotation_id = record["id"]
+        current[annotation_id] = record
+        old = previous.get(annotation_id)
+        if old is record:
+            continue
+        if old is None:
+            ops.append({"op": "create", "record": record})
+            continue
+        if old["shape"] != record["shape"]:
+            ops.append({"op": "update", "record": record})
+            continue
+        if old["range"] != record["range"]:
+            ops.append({"op": "resize", "id": annotation_id, "range": record["range"]})
+        if old["comments"] != record["comments"]:
+            ops.append({"op": "relabel", "id": annotation_id, "comments": record["comments"]})
+    for annotation_id in previous.keys() - current.keys():
+        ops.append({"op": "delete", "id": annotation_id})
+    return current, ops
+
+
+def replay_journal(records: list, ops: list) -> list:
+    """Apply journal operation records to saved records, returned sorted by start"""
+    by_id = {record["id"]: record for record in records}
+    for op in ops:
+        kind = op.get("op")
+        if kind in ("create", "update"):
+            by_id[op["record"]["id"]] = op["record"]
+        elif kind == "delete":
+            by_id.pop(op["id"], None)
+        elif kind == "resize" and op["id"] in by_id:
+            by_id[op["id"]] = dict(by_id[op["id"]], range=op["range"])
+        elif kind == "relabel" and op["id"] in by_id:
+            by_id[op["id"]] = dict(by_id[op["id"]], comments=op["comments"])
+    return sorted(by_id.values(), key=lambda record: record["range"]["start"])
+
+
+def read_journal(journal_path: str, journal_id: str) -> list:
+    """Operations of the journal belonging to journal_id; a torn last line ends the journal"""
+    ops = []
+    try:
+        with open(journal_path, 'r') as f:
+            header = json.loads(f.readline() or "{}")
+            if header.get("journal") != journal_id:
+                return []
+            for line in f:
+                try:
+                    ops.append(json.loads(line))
+                except ValueError:
+                    break
+    except (OSError, ValueError):
+        return []
+    return ops
+
+
 class AutosaveManager:
+    """
+    Writes autosave files for the open video.
+
+    An autosave is a full snapshot (<stem>_autosave.json) plus an append-only
+    journal (<stem>_autosave.journal) of create/delete/resize/relabel/update
+    operations since that snapshot; a split is journaled as a resize and a
+    create, a merge as a resize and a delete. Each write appends only the
+    operations for what changed and the journal is compacted into a new
+    snapshot every compact_after operations, on request (e.g. after an
+    export) and whenever the manager has no snapshot for the video yet.
+    The snapshot names the journal it belongs to, so a journal left behind
+    by an interrupted compaction is ignored. Snapshots are also compacted
+    at least every snapshot_interval seconds while editing, and every
+    snapshot is kept as a version in AutosaveVersions, so a bad edit never
+    overwrites the only copy.
+
+    With use_database(True) the files are replaced by an AnnotationDatabase
+    (SQLite, WAL) in the autosave directory: each write stores the same
+    changes the journal would record, as one transaction.
+
+    save_annotations writes a full snapshot synchronously.
+    save_annotations_async takes a snapshot of the records on the calling
+    thread and leaves serialization and disk I/O to a single worker thread:
+    at most one write is in flight, and a snapshot queued while the worker
+    is busy replaces any older one still waiting, so only the latest state
+    is written.
+    """
+    compact_after = 500
+    snapshot_interval = 600
+    # Write snapshots in the compact binary session format instead of JSON
+    binary_sessions = False
+
     def __init__(self, interval: int = 300000) -> None:
         """Initialize autosave manager"""
         self.interval = interval
         self.autosave_dir = os.path.join(tempfile.gettempdir(), 'paaws_annotation_software_autosave')
         os.makedirs(self.autosave_dir, exist_ok=True)
+        self._condition = threading.Condition()
+        self._pending = None
+        self._writing = False
+        self._worker = None
+        self._io_lock = threading.Lock()
+        # video_path -> (journal id, video hash, {id: record} as written, journaled op count, snapshot time)
+        self._written = {}
+        self._fingerprints = None
+        self._versions = None
+        # Serialized records reused between snapshots; only edited annotations are re-serialized
+        self._fragments = FragmentCache(indent=None)
+        self.database = None
+
+    def autosave_path(self, video_path: str) -> str:
+        """Autosave file used for the given video"""
+        video_name = Path(video_path).stem
+        return os.path.join(self.autosave_dir, f"{video_name}_autosave.json")
+
+    def journal_path(self, video_path: str) -> str:
+        """Journal of changes since the autosave snapshot of the given video"""
+        video_name = Path(video_path).stem
+        return os.path.join(self.autosave_dir, f"{video_name}_autosave.journal")
 
     def calculate_video_hash(self, file_path: str) -> int:
-        """Calculate hash from video file size"""
+        """Calculate the legacy hash from video file size, as stored by older files"""
         try:
             file_size = os.path.getsize(file_path)
             size_str = str(file_size)
@@ -30,74 +178,259 @@ class AutosaveManager:
             print(f"Error calculating video hash: {str(e)}")
             return 0
 
+    @property
+    def fingerprints(self) -> FingerprintCache:
+        """Persistent cache of video fingerprints kept in the autosave directory"""
+        cache_path = os.path.join(self.autosave_dir, 'video_fingerprints.json')
+        if self._fingerprints is None or self._fingerprints.cache_path != cache_path:
+            self._fingerprints = FingerprintCache(cache_path)
+        return self._fingerprints
+
+    def use_database(self, enabled: bool) -> None:
+        """Store autosaves in the SQLite database instead of snapshot and journal files"""
+        self.flush()
+        with self._io_lock:
+            self._written.clear()
+            if enabled and self.database is None:
+                try:
+                    self.database = AnnotationDatabase(os.path.join(self.autosave_dir, 'annotations.sqlite3'))
+                except Exception as e:
+                    print(f"Could not open annotation database: {str(e)}")
+            elif not enabled and self.database is not None:
+                self.database.close()
+                self.database = None
+
+    @property
+    def versions(self) -> AutosaveVersions:
+        """Versioned autosave snapshots kept in the autosave directory"""
+        directory = os.path.join(self.autosave_dir, 'versions')
+        if self._versions is None or self._versions.directory != directory:
+            self._versions = AutosaveVersions(directory)
+        return self._versions
+
+    def list_autosave_versions(self, video_path: str) -> list:
+        """Stored autosave versions of the given video, newest first"""
+        with self._io_lock:
+            return self.versions.list(video_path)
+
+    def load_autosave_version(self, digest: str) -> dict:
+        """Data of a stored autosave version, in the form returned by check_for_autosave"""
+        with self._io_lock:
+            return self.versions.load(digest)
+
+    def calculate_video_fingerprint(self, file_path: str):
+        """Sampled content fingerprint of a video, from the cache when the file is unchanged"""
+        try:
+            return self.fingerprints.fingerprint(file_path)
+        except Exception as e:
+            print(f"Error calculating video fingerprint: {str(e)}")
+            return 0
+
+    def cached_video_fingerprint(self, file_path: str) -> Optional[str]:
+        """Fingerprint of an unchanged, already hashed video without touching its content"""
+        return self.fingerprints.get(file_path)
+
+    def calculate_video_fingerprint_async(self, file_path: str, callback) -> None:
+        """Compute the fingerprint on a background thread and pass (file_path, fingerprint) to callback"""
+        def run():
+            callback(file_path, self.calculate_video_fingerprint(file_path))
+        threading.Thread(target=run, name="video-fingerprint", daemon=True).start()
+
+    def hash_matches(self, saved_hash, current_hash, video_path: Optional[str] = None) -> bool:
+        """
+        Compare a saved videoHash with the current one.
+
+        Files written before fingerprints were introduced store the 32-bit
+        size hash; when the current hash is a fingerprint, those are checked
+        against the size hash of the open video instead.
+        """
+        if (isinstance(saved_hash, int) and isinstance(current_hash, str)
+                and current_hash.startswith(FINGERPRINT_PREFIX)):
+            return bool(video_path) and saved_hash == self.calculate_video_hash(video_path)
+        return saved_hash == current_hash
+
     def delete_autosave(self, video_path: str) -> None:
         """Delete autosave file for the given video"""
         if not video_path:
             return
             
+        # Drop a queued write so it cannot recreate the file
+        with self._condition:
+            if self._pending is not None and self._pending[0] == video_path:
+                self._pending = None
+        self.flush()
+
         try:
-            video_name = Path(video_path).stem
-            autosave_path = os.path.join(self.autosave_dir, f"{video_name}_autosave.json")
-            if os.path.exists(autosave_path):
-                os.remove(autosave_path)
+            with self._io_lock:
+                self._written.pop(video_path, None)
+                if self.database is not None:
+                    self.database.delete(video_path)
+                for path in (self.autosave_path(video_path), self.journal_path(video_path)):
+                    if os.path.exists(path):
+                        os.remove(path)
         except Exception as e:
             print(f"Error deleting autosave: {str(e)}")
 
-    def save_annotations(self, video_path: str, annotations: List[TimelineAnnotation], *, video_hash: int = 0) -> None:
-        """Save annotations to autosave file"""
+    def save_annotations(self, video_path: str, annotations: List[TimelineAnnotation], *, video_hash: Union[int, str] = 0) -> bool:
+        """Save annotations to autosave file; False if the write failed"""
         print(f"Autosaving annotations for {video_path}...")
+        if not video_path:
+            return False
+        return self._write(video_path, snapshot_annotations(annotations), video_hash, compact=True)
+
+    def save_annotations_async(self, video_path: str, annotations: List[TimelineAnnotation], *,
+                               video_hash: Union[int, str] = 0, compact: bool = False) -> None:
+        """Snapshot annotations now and write them on the autosave worker thread"""
         if not video_path:
             return
-            
+        snapshot = snapshot_annotations(annotations)
+        with self._condition:
+            if self._pending is not None and self._pending[0] == video_path:
+                compact = compact or self._pending[3]
+            self._pending = (video_path, snapshot, video_hash, compact)
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run_worker, name="autosave", daemon=True)
+                self._worker.start()
+            self._condition.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until queued and in-flight autosaves are written; False on timeout"""
+        with self._condition:
+            return self._condition.wait_for(lambda: self._pending is None and not self._writing, timeout)
+
+    def _run_worker(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending is not None)
+                video_path, snapshot, video_hash, compact = self._pending
+                self._pending = None
+                self._writing = True
+            try:
+                print(f"Autosaving annotations for {video_path}...")
+                self._write(video_path, snapshot, video_hash, compact)
+            finally:
+                with self._condition:
+                    self._writing = False
+                    self._condition.notify_all()
+
+    def _write(self, video_path: str, records: tuple, video_hash: Union[int, str], compact: bool) -> bool:
+        with self._io_lock:
+            try:
+                written = self._written.get(video_path)
+                if self.database is not None:
+                    self._write_database(video_path, records, video_hash, written)
+                elif (compact or written is None or written[1] != video_hash
+                        or written[3] >= self.compact_after
+                        or time.time() - written[4] >= self.snapshot_interval):
+                    self._write_snapshot(video_path, records, video_hash)
+                else:
+                    self._append_journal(video_path, records, written)
+            except Exception as e:
+                self._written.pop(video_path, None)
+                print(f"Autosave failed: {str(e)}")
+                return False
+        return True
+
+    def _write_snapshot(self, video_path: str, records: tuple, video_hash: Union[int, str]) -> None:
+        journal_id = uuid.uuid4().hex
+        autosave_path = self.autosave_path(video_path)
+        annotations_data = {
+            "version": LABELS_SCHEMA_VERSION,
+            "annotations": list(records),
+            "videoHash": video_hash,
+            "video_path": video_path,
+            "journal": journal_id
+        }
+        # Write next to the target and swap it in, so a reader never sees a partial file
+        temp_path = autosave_path + ".tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(dumps_session(annotations_data, binary=self.binary_sessions, fragments=self._fragments))
+        os.replace(temp_path, autosave_path)
+        with open(self.journal_path(video_path), 'w') as f:
+            f.write(json.dumps({"journal": journal_id}) + "\n")
+        self._written[video_path] = (journal_id, video_hash, {record["id"]: record for record in records}, 0, time.time())
+
+        # The version leaves out the journal id so that equal snapshots share one object
         try:
-            video_name = Path(video_path).stem
-            autosave_path = os.path.join(self.autosave_dir, f"{video_name}_autosave.json")
-            
-            annotations_data = {
-                "annotations": [],
+            content = dumps_session({
+                "version": LABELS_SCHEMA_VERSION,
+                "annotations": annotations_data["annotations"],
                 "videoHash": video_hash,
                 "video_path": video_path
-            }
-            
-            for annotation in annotations:
-                annotations_data["annotations"].append({
-                    "id": annotation.id,
-                    "range": {
-                        "start": annotation.start_time,
-                        "end": annotation.end_time
-                    },
-                    "shape": annotation.shape,
-                    "comments": annotation.comments
-                })
-                
-            with open(autosave_path, 'w') as f:
-                json.dump(annotations_data, f, indent=4)
+            }, binary=self.binary_sessions, fragments=self._fragments)
+            self.versions.add(video_path, content, count=len(records))
         except Exception as e:
-            print(f"Autosave failed: {str(e)}")
-            
+            print(f"Could not store autosave version: {str(e)}")
+
+    def _write_database(self, video_path: str, records: tuple, video_hash: Union[int, str], written) -> None:
+        if written is None or written[1] != video_hash:
+            current, changes = {record["id"]: record for record in records}, None
+        else:
+            current, changes = _journal_ops(written[2], records)
+        if changes != []:
+            self.database.write(video_path, records, video_hash, LABELS_SCHEMA_VERSION, changes)
+        self._written[video_path] = (None, video_hash, current, 0, time.time())
+
+    def _append_journal(self, video_path: str, records: tuple, written: tuple) -> None:
+        journal_id, video_hash, previous, op_count, snapshot_time = written
+        current, ops = _journal_ops(previous, records)
+        if ops:
+            with open(self.journal_path(video_path), 'a') as f:
+                f.write("".join(json.dumps(op) + "\n" for op in ops))
+        self._written[video_path] = (journal_id, video_hash, current, op_count + len(ops), snapshot_time)
+
+    def _read_journal(self, video_path: str, journal_id: str) -> list:
+        return read_journal(self.journal_path(video_path), journal_id)
+
     def check_for_autosave(self, video_path: str, current_hash: int) -> Tuple[Optional[dict], bool]:
         """
         Check for and load autosave file
         Returns: Tuple of (data dict, hash_matches)
                 data dict is None if no autosave found
                 hash_matches is True if video hash matches autosave
+        data["versions"] lists the stored versions of the video, newest
+        first. If the autosave file exists but cannot be read, the newest
+        version is loaded instead.
         """
         if not video_path:
             return None, False
             
-        video_name = Path(video_path).stem
-        autosave_path = os.path.join(self.autosave_dir, f"{video_name}_autosave.json")
-        
+        if self.database is not None:
+            with self._io_lock:
+                data = self.database.load(video_path)
+            if data is not None:
+                data["versions"] = []
+                return data, self.hash_matches(data.get("videoHash", 0), current_hash, video_path)
+
+        autosave_path = self.autosave_path(video_path)
+        versions = self.list_autosave_versions(video_path)
+
+        data = None
+        damaged = False
         if os.path.exists(autosave_path):
             try:
-                with open(autosave_path, 'r') as f:
-                    data = json.load(f)
-                if data.get("video_path") == video_path:
-                    saved_hash = data.get("videoHash", 0)
-                    return data, saved_hash == current_hash
+                data = load_session(autosave_path)
+                if data.get("video_path") != video_path:
+                    data = None
+                elif data.get("journal"):
+                    ops = self._read_journal(video_path, data["journal"])
+                    if ops:
+                        data["annotations"] = replay_journal(data.get("annotations", []), ops)
             except Exception as e:
+                data = None
+                damaged = True
                 print(f"Failed to load autosave: {str(e)}")
-        
+
+        if damaged and versions:
+            try:
+                data = self.load_autosave_version(versions[0]["digest"])
+            except Exception as e:
+                print(f"Failed to load autosave version: {str(e)}")
+
+        if data is not None:
+            data["versions"] = versions
+            saved_hash = data.get("videoHash", 0)
+            return data, self.hash_matches(saved_hash, current_hash, video_path)
         return None, False
     
 def autosave(func):
@@ -116,6 +449,13 @@ def autosave(func):
     return wrapper
 
 
+def zip_member(zipf: ZipFile, name: str) -> ZipInfo:
+    """Entry for streaming name into zipf with ZipFile.open(..., 'w'), dated now and compressed like the archive"""
+    info = ZipInfo(name, date_time=time.localtime()[:6])
+    info.compress_type = zipf.compression
+    return info
+
+
 def resource_path(relative_path: str) -> str:
     try:
         base_path = getattr(sys, '_MEIPASS', None)
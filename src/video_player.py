@@ -1,29 +1,43 @@
 # --- Imports ---
-import json
-import io
-import csv
-from zipfile import ZipFile
+from zipfile import ZIP_DEFLATED, ZipFile
 import os
 import sys
+import threading
+from datetime import datetime
 
 # PyQt6 imports
 from PyQt6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
                              QPushButton, QFileDialog, QLabel, QMessageBox,
-                             QMenu)
-from PyQt6.QtCore import Qt, QUrl, QTime, QTimer
+                             QMenu, QInputDialog, QProgressDialog)
+from PyQt6.QtCore import Qt, QUrl, QTime, QTimer, QSettings, pyqtSignal
 from PyQt6.QtGui import QAction, QPalette, QGuiApplication
 from PyQt6.QtQuickWidgets import QQuickWidget
 from src.slider import CustomSlider
-from src.models import TimelineAnnotation
+from src.models import LABELS_SCHEMA_VERSION, TimelineAnnotation
 from src.widgets import TimelineWidget
-from src.dialogs import AnnotationDialog
+from src.dialogs import AnnotationDialog, APP_NAME, ORGANIZATION_NAME
 from src.shortcuts import ShortcutManager
 from src.annotation_manager import AnnotationManager
-from src.utils import AutosaveManager
+from src.utils import AutosaveManager, zip_member
+from src.annotation_store import AnnotationStore, as_store
+from src.annotation_loader import load_annotations
+from src.label_arrays import MAX_RATE, MIN_RATE, export_epochs, export_label_matrix
+from src.columnar import COLUMNAR_EXTENSION, write_columns
+from src.bundle import import_bundle, video_date_of, write_category_csvs, write_labels
+from src.session_format import SESSION_EXTENSION, FragmentCache
+
+SETTINGS_BINARY_SESSIONS = "binary_session_files"
+SETTINGS_LEGACY_LABELS = "export_labels_v1"
+SETTINGS_SQLITE_STORAGE = "sqlite_autosave"
 class VideoPlayerApp(QMainWindow):
     SYNC_THRESHOLD = 150
     MIN_ZOOM_DURATION = 600000 # 10 minutes in ms
     BASE_PREVIEW_OFFSET = 2000  # 2 seconds in ms
+    AUTOSAVE_DEBOUNCE = 1000  # ms of quiet after an edit before it is autosaved
+
+    videoFingerprintReady = pyqtSignal(str, object)
+    annotationsLoadProgress = pyqtSignal(str, int)
+    annotationsLoaded = pyqtSignal(str, object)
 
     def __init__(self):
         super().__init__()
@@ -41,7 +55,8 @@ class VideoPlayerApp(QMainWindow):
         self.current_video_path = None
         self.video_hash = 0
         self.current_rotation = 0
-        self.annotations = []
+        self._annotations = AnnotationStore()
+        self._export_fragments = FragmentCache(indent=4)
         self.current_annotation = None 
         self.zoom_start = 0.0 
         self.zoom_end = 1.0 
@@ -53,6 +68,19 @@ class VideoPlayerApp(QMainWindow):
         self.autosave_timer.setInterval(self.autosave_manager.interval)
         self.autosave_timer.timeout.connect(self.autosave)
 
+        # Coalesces bursts of edits into one autosave
+        self.autosave_debounce_timer = QTimer(self)
+        self.autosave_debounce_timer.setSingleShot(True)
+        self.autosave_debounce_timer.setInterval(self.AUTOSAVE_DEBOUNCE)
+        self.autosave_debounce_timer.timeout.connect(self._write_autosave)
+        self._autosaved_state = None
+        self._fingerprint_pending = None
+        self.videoFingerprintReady.connect(self._restore_autosave)
+        self._annotations_loading = None
+        self._load_progress = None
+        self.annotationsLoadProgress.connect(self._annotations_load_progress)
+        self.annotationsLoaded.connect(self._annotations_load_finished)
+
         
         self.setStyleSheet("""
             QMainWindow { background-color: #2b2b2b; color: #ffffff; }
@@ -106,6 +134,15 @@ class VideoPlayerApp(QMainWindow):
         
 
 
+    @property
+    def annotations(self):
+        return self._annotations
+
+    @annotations.setter
+    def annotations(self, annotations):
+        self._annotations = as_store(annotations)
+
+
     def setupUI(self):
         print("--- setupUI: Starting UI creation...")
         central_widget = QWidget(self)
@@ -338,10 +375,25 @@ class VideoPlayerApp(QMainWindow):
         self.settings_menu = QMenu(self); self.settings_menu.setStyleSheet("QMenu { background-color: #2b2b2b; border: 1px solid #3a3a3a; } QMenu::item { padding: 8px 20px; color: white; } QMenu::item:selected { background-color: #4a90e2; }")
         load_action = QAction("Load JSON", self); load_action.triggered.connect(self.loadAnnotations)
         export_action = QAction("Export Labels", self); export_action.triggered.connect(self.saveAnnotations)
+        export_matrix_action = QAction("Export Label Matrix", self); export_matrix_action.triggered.connect(self.exportLabelMatrix)
+        export_epochs_action = QAction("Export Epoch Summary", self); export_epochs_action.triggered.connect(self.exportEpochSummary)
+        export_columns_action = QAction("Export Columnar Labels", self); export_columns_action.triggered.connect(self.exportColumns)
         new_video_action = QAction("New Video", self); new_video_action.triggered.connect(self.openFile)
+        restore_version_action = QAction("Restore Autosave Version", self); restore_version_action.triggered.connect(self.restoreAutosaveVersion)
         self.rotate_action = QAction("Rotate Video", self); self.rotate_action.setEnabled(False); self.rotate_action.triggered.connect(self.rotateVideo) 
         self.toggle_shortcuts_action = QAction("Hide Shortcuts", self); self.toggle_shortcuts_action.triggered.connect(self.toggleShortcutsWidget)
-        self.settings_menu.addAction(load_action); self.settings_menu.addAction(export_action); self.settings_menu.addAction(new_video_action)
+        self.binary_sessions_action = QAction("Binary Session Files", self); self.binary_sessions_action.setCheckable(True)
+        self.binary_sessions_action.setChecked(QSettings(ORGANIZATION_NAME, APP_NAME).value(SETTINGS_BINARY_SESSIONS, False, type=bool))
+        self.binary_sessions_action.toggled.connect(self.setBinarySessions); self.setBinarySessions(self.binary_sessions_action.isChecked())
+        self.settings_menu.addAction(load_action); self.settings_menu.addAction(export_action); self.settings_menu.addAction(export_matrix_action); self.settings_menu.addAction(export_epochs_action); self.settings_menu.addAction(export_columns_action); self.settings_menu.addAction(new_video_action)
+        self.legacy_labels_action = QAction("Export v1 labels.json", self); self.legacy_labels_action.setCheckable(True)
+        self.legacy_labels_action.setChecked(QSettings(ORGANIZATION_NAME, APP_NAME).value(SETTINGS_LEGACY_LABELS, False, type=bool))
+        self.legacy_labels_action.toggled.connect(lambda checked: QSettings(ORGANIZATION_NAME, APP_NAME).setValue(SETTINGS_LEGACY_LABELS, checked))
+        self.settings_menu.addAction(restore_version_action); self.settings_menu.addAction(self.binary_sessions_action)
+        self.sqlite_storage_action = QAction("Autosave to SQLite", self); self.sqlite_storage_action.setCheckable(True)
+        self.sqlite_storage_action.setChecked(QSettings(ORGANIZATION_NAME, APP_NAME).value(SETTINGS_SQLITE_STORAGE, False, type=bool))
+        self.sqlite_storage_action.toggled.connect(self.setSqliteStorage); self.setSqliteStorage(self.sqlite_storage_action.isChecked())
+        self.settings_menu.addAction(self.legacy_labels_action); self.settings_menu.addAction(self.sqlite_storage_action)
         self.settings_menu.addSeparator(); self.settings_menu.addAction(self.rotate_action); self.settings_menu.addSeparator()
         self.settings_menu.addAction(self.toggle_shortcuts_action)
         self.gear_button.setMenu(self.settings_menu)
@@ -707,45 +759,16 @@ class VideoPlayerApp(QMainWindow):
         if filename:
             print(f"--- User selected file: {filename}")
             self.current_video_path = filename
-            try: self.video_hash = self.autosave_manager.calculate_video_hash(filename)
-            except Exception as e: self.video_hash = 0; print(f"Warn: Hash failed {e}")
-
-            
-            self.annotations = [] 
-            autosave_data, hash_matches = self.autosave_manager.check_for_autosave(filename, self.video_hash)
-            if autosave_data:
-                message = "An autosaved version of the annotations was found."
-                if self.video_hash != 0 and not hash_matches:
-                    message += "\nWarning: The video file appears to have changed since the autosave."
-                message += "\nWould you like to restore from autosave or start over?"
-                reply = QMessageBox.question(self, "Autosave Found", message, QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No, QMessageBox.StandardButton.Yes)
-                if reply == QMessageBox.StandardButton.Yes:
-                    try: 
-                        print("--- Restoring annotations from autosave...")
-                        loaded_count = 0
-                        for ann_data in autosave_data.get("annotations", []):
-                             
-                             if "id" in ann_data and "range" in ann_data and "start" in ann_data["range"] and "end" in ann_data["range"]:
-                                 annotation = TimelineAnnotation()
-                                 annotation.id = ann_data["id"]
-                                 annotation.start_time = ann_data["range"]["start"] 
-                                 annotation.end_time = ann_data["range"]["end"] 
-                                 annotation.shape = ann_data.get("shape", {})
-                                 annotation.comments = ann_data.get("comments", [])
-                                 self.annotations.append(annotation)
-                                 loaded_count += 1
-                             else:
-                                 print(f"--- Warning: Skipping invalid autosave annotation data: {ann_data}")
-                        self.updateAnnotationTimeline()
-                        print(f"--- Loaded {loaded_count} annotations from autosave.")
-                    except Exception as e: QMessageBox.critical(self, "Autosave Error", f"Failed to load autosave: {e}"); self.annotations = []
-                else:
-                    print("--- User chose not to restore autosave. Deleting...")
-                    self.autosave_manager.delete_autosave(filename)
-                    self.updateAnnotationTimeline() 
+            self.annotations = []
+            self.video_hash = 0
+            fingerprint = self.autosave_manager.cached_video_fingerprint(filename)
+            if fingerprint:
+                self._restore_autosave(filename, fingerprint)
             else:
-                print("--- No autosave data found.")
-                self.updateAnnotationTimeline() 
+                # Hash the video off the GUI thread; autosaves wait for the result
+                self._fingerprint_pending = filename
+                self.updateAnnotationTimeline()
+                self.autosave_manager.calculate_video_fingerprint_async(filename, self.videoFingerprintReady.emit)
 
             if getattr(sys, 'frozen', False):
                 # Running in PyInstaller bundle - ensure proper URL format
@@ -781,6 +804,44 @@ class VideoPlayerApp(QMainWindow):
 
 
     
+    def _restore_autosave(self, filename, fingerprint):
+        """Take the fingerprint of the opened video and offer to restore its autosave"""
+        if filename != self.current_video_path:
+            return
+        self._fingerprint_pending = None
+        self.video_hash = fingerprint
+        autosave_data, hash_matches = self.autosave_manager.check_for_autosave(filename, self.video_hash)
+        if autosave_data:
+            message = "An autosaved version of the annotations was found."
+            if self.video_hash != 0 and not hash_matches:
+                message += "\nWarning: The video file appears to have changed since the autosave."
+            message += "\nWould you like to restore from autosave or start over?"
+            reply = QMessageBox.question(self, "Autosave Found", message, QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No, QMessageBox.StandardButton.Yes)
+            if reply == QMessageBox.StandardButton.Yes:
+                try: 
+                    print("--- Restoring annotations from autosave...")
+                    loaded_count = 0
+                    restored = []
+                    for ann_data in autosave_data.get("annotations", []):
+                         
+                         if "id" in ann_data and "range" in ann_data and "start" in ann_data["range"] and "end" in ann_data["range"]:
+                             restored.append(TimelineAnnotation.from_record(ann_data))
+                             loaded_count += 1
+                         else:
+                             print(f"--- Warning: Skipping invalid autosave annotation data: {ann_data}")
+                    self.annotations = restored
+                    self.updateAnnotationTimeline()
+                    print(f"--- Loaded {loaded_count} annotations from autosave.")
+                except Exception as e: QMessageBox.critical(self, "Autosave Error", f"Failed to load autosave: {e}"); self.annotations = []
+            else:
+                print("--- User chose not to restore autosave. Deleting...")
+                self.autosave_manager.delete_autosave(filename)
+                self.updateAnnotationTimeline() 
+        else:
+            print("--- No autosave data found.")
+            self.updateAnnotationTimeline()
+
+
     def togglePlayPause(self):
         if not self.qml_root_main or not self.current_video_path:
              print("--- togglePlayPause: Aborted (QML main root missing or no video path)")
@@ -932,133 +993,126 @@ class VideoPlayerApp(QMainWindow):
             self.qml_root_preview.seek(target_preview_pos)
 
     def saveAnnotations(self):
-        from zipfile import ZipFile
-        import csv
-        import io
-        from datetime import datetime, timedelta
-
         filename, _ = QFileDialog.getSaveFileName(self, "Export Annotations", "", "ZIP Files (*.zip)")
         if filename:
             try:
-                with ZipFile(filename, 'w') as zipf:
-                    annotations_data = {
-                        "annotations": [],
-                        "videoHash": self.video_hash
-                    }
-                    
-                    for annotation in self.annotations:
-                        annotations_data["annotations"].append({
-                            "id": annotation.id,
-                            "range": {
-                                "start": annotation.start_time,
-                                "end": annotation.end_time
-                            },
-                            "shape": annotation.shape,
-                            "comments": annotation.comments
-                        })
-                    
-                    zipf.writestr('labels.json', json.dumps(annotations_data, indent=4))
-
-                    if self.current_video_path and os.path.exists(self.current_video_path):
-                        video_timestamp = os.path.getmtime(self.current_video_path)
-                        video_date = datetime.fromtimestamp(video_timestamp)
+                with ZipFile(filename, 'w', compression=ZIP_DEFLATED) as zipf:
+                    legacy = self.legacy_labels_action.isChecked()
+                    from_database = (self.sqlite_storage_action.isChecked() and not legacy
+                                     and not self.binary_sessions_action.isChecked()
+                                     and self.current_video_path and not self._fingerprint_pending
+                                     and self.autosave_manager.database is not None)
+                    if from_database:
+                        # Write the current annotations synchronously, after any queued
+                        # autosave, so the database holds exactly what is exported
+                        self.autosave_debounce_timer.stop()
+                        self.autosave_manager.flush()
+                        from_database = self.autosave_manager.save_annotations(
+                            self.current_video_path, self.annotations, video_hash=self.video_hash)
+                        if from_database:
+                            self._autosaved_state = self._autosave_state()
+                    if from_database:
+                        # Stream labels.json from the database rather than building it in memory
+                        with zipf.open(zip_member(zipf, 'labels.json'), 'w') as f:
+                            self.autosave_manager.database.write_labels_json(self.current_video_path, f)
                     else:
-                        video_date = datetime.now()
-                    
-                    date_only = video_date.replace(hour=0, minute=0, second=0, microsecond=0)
-
-                    headers = {
-                        'POSTURE.csv': [],
-                        'HIGH LEVEL BEHAVIOR.csv': [],
-                        'PA TYPE.csv': [],
-                        'Behavioral Parameters.csv': [],
-                        'Experimental situation.csv': [],
-                        'Special Notes.csv': []
-                    }
-
-                    for annotation in self.annotations:
-                        try:
-                            comment_data = json.loads(annotation.comments[0]["body"])
-                            start_offset = timedelta(seconds=annotation.start_time)
-                            end_offset = timedelta(seconds=annotation.end_time)
-
-                            start_datetime = video_date + start_offset
-                            end_datetime = video_date + end_offset
-                            
-                            video_start_datetime = date_only + start_offset
-                            video_end_datetime = date_only + end_offset
-                            
-                            start_str = start_datetime.strftime("%Y-%m-%d %H:%M:%S")
-                            end_str = end_datetime.strftime("%Y-%m-%d %H:%M:%S")
-                            video_start_str = video_start_datetime.strftime("%Y-%m-%d %H:%M:%S")
-                            video_end_str = video_end_datetime.strftime("%Y-%m-%d %H:%M:%S")
-                           
-                            category_values = {}
-                            for item in comment_data:
-                                category = item["category"]
-                                selected_value = item["selectedValue"]
-                                
-                                if isinstance(selected_value, list):
-                                    values = [v for v in selected_value if v and not v.endswith("_Unlabeled")]
-                                else:
-                                    values = [selected_value] if selected_value and not selected_value.endswith("_Unlabeled") else []
-                                
-                                if values:
-                                    category_values[category] = values
-                            
-                            # Create CSV rows - one row per category
-                            labelset_map = {
-                                "POSTURE": "Posture",
-                                "HIGH LEVEL BEHAVIOR": "High Level Behavior",
-                                "PA TYPE": "PA Type",
-                                "Behavioral Parameters": "Behavioral Parameters",
-                                "Experimental situation": "Experimental Situation",
-                                "Special Notes": "Special Notes"
-                            }
-                            
-                            for category, csv_file in [
-                                ("POSTURE", 'POSTURE.csv'),
-                                ("HIGH LEVEL BEHAVIOR", 'HIGH LEVEL BEHAVIOR.csv'),
-                                ("PA TYPE", 'PA TYPE.csv'),
-                                ("Behavioral Parameters", 'Behavioral Parameters.csv'),
-                                ("Experimental situation", 'Experimental situation.csv'),
-                                ("Special Notes", 'Special Notes.csv')
-                            ]:
-                                if category in category_values and category_values[category]:
-                                    prediction = ", ".join(category_values[category])
-                                    headers[csv_file].append([
-                                        start_str, end_str,
-                                        prediction, 'Expert', labelset_map[category],
-                                        video_start_str, video_end_str
-                                    ])
-                        except Exception as e:
-                            print(f"Error processing annotation {annotation.id}: {str(e)}")
-
-                    csv_header = ['START_TIME','STOP_TIME','PREDICTION','SOURCE','LABELSET','VIDEO_START_TIME','VIDEO_END_TIME']
-                    for filename, data in headers.items():
-                        if data:  
-                            output = io.StringIO()
-                            writer = csv.writer(output)
-                            writer.writerow(csv_header)
-                            writer.writerows(data)
-                            zipf.writestr(filename, output.getvalue())
-                            output.close()
+                        # v1 for downstream tools that expect labels as a JSON string body
+                        write_labels(zipf, self.annotations, self.video_hash,
+                                     version=1 if legacy else LABELS_SCHEMA_VERSION,
+                                     binary=self.binary_sessions_action.isChecked(),
+                                     fragments=self._export_fragments)
 
+                    write_category_csvs(zipf, self.annotations, video_date_of(self.current_video_path))
+
+                # The export is a good point to fold the autosave journal into a snapshot
+                self.autosave(compact=True)
                 QMessageBox.information(self, "Success", "Annotations exported successfully")
             except Exception as e:
                 QMessageBox.critical(self, "Error", f"Failed to export annotations: {str(e)}")
     
     
-    def autosave(self):
-        """Trigger autosave of current annotations"""
-        if hasattr(self, 'current_video_path') and self.current_video_path:
-            self.autosave_manager.save_annotations(
-                self.current_video_path,
-                self.annotations,
-                video_hash=self.video_hash
-            )
-    
-    
+    def exportLabelMatrix(self):
+        """Export the labels sampled at a fixed rate, for aligning with sensor data"""
+        rate, ok = QInputDialog.getDouble(self, "Export Label Matrix", "Sampling rate (Hz):", 30, MIN_RATE, MAX_RATE, 2)
+        if not ok:
+            return
+        filename, selected_filter = QFileDialog.getSaveFileName(
+            self, "Export Label Matrix", "", "CSV Files (*.csv);;NumPy Array (*.npy);;NumPy Archive (*.npz)")
+        if filename:
+            if not os.path.splitext(filename)[1]:
+                filename += selected_filter[selected_filter.index("*") + 1:-1] if "*" in selected_filter else ".csv"
+            try:
+                samples = export_label_matrix(filename, self.annotations, rate, end=self._labels_end())
+                QMessageBox.information(self, "Success", f"Exported {samples} samples at {rate:g} Hz")
+            except Exception as e:
+                QMessageBox.critical(self, "Error", f"Failed to export label matrix: {str(e)}")
+
+
+    def exportEpochSummary(self):
+        """Export per-epoch majority labels and label fractions as CSV"""
+        epoch_length, ok = QInputDialog.getDouble(self, "Export Epoch Summary", "Epoch length (seconds):", 60, 0.1, 86400, 1)
+        if not ok:
+            return
+        filename, _ = QFileDialog.getSaveFileName(self, "Export Epoch Summary", "", "CSV Files (*.csv)")
+        if filename:
+            try:
+                epochs = export_epochs(filename, self.annotations, epoch_length, end=self._labels_end())
+                QMessageBox.information(self, "Success", f"Exported {epochs} epochs of {epoch_length:g} s")
+            except Exception as e:
+                QMessageBox.critical(self, "Error", f"Failed to export epoch summary: {str(e)}")
+
+    def exportColumns(self):
+        """Export the annotations as memory-mappable columns for analysis tools"""
+        filename, _ = QFileDialog.getSaveFileName(self, "Export Columnar Labels", "", f"NumPy Archive (*{COLUMNAR_EXTENSION})")
+        if filename:
+            if not filename.lower().endswith(COLUMNAR_EXTENSION):
+                filename += COLUMNAR_EXTENSION
+            try:
+                write_columns(filename, self.annotations, self.video_hash)
+                QMessageBox.information(self, "Success", "Annotations exported successfully")
+            except Exception as e:
+                QMessageBox.critical(self, "Error", f"Failed to export annotations: {str(e)}")
+
+    def _labels_end(self):
+        """End of the labelled range in seconds: the whole video, or further if labels run past it"""
+        last_end = self.annotations[len(self.annotations) - 1].end_time if len(self.annotations) else 0
+        return max(self.media_player['_duration'] / 1000, last_end)
+
+
+    def autosave(self, compact=False):
+        """Schedule an autosave of current annotations if they changed since the last one"""
+        if not getattr(self, 'current_video_path', None) or self._fingerprint_pending:
+            return
+        if compact:
+            self._write_autosave(compact=True)
+        elif self._autosave_state() != self._autosaved_state:
+            self.autosave_debounce_timer.start()
+
+    def _autosave_state(self):
+        return self.current_video_path, self.video_hash, self._annotations, self._annotations.generation
+
+    def _write_autosave(self, compact=False):
+        """Hand a snapshot of the annotations to the autosave worker now"""
+        self.autosave_debounce_timer.stop()
+        if not self.current_video_path or self._fingerprint_pending:
+            return
+        self.autosave_manager.save_annotations_async(
+            self.current_video_path,
+            self.annotations,
+            video_hash=self.video_hash,
+            compact=compact
+        )
+        self._autosaved_state = self._autosave_state()
+
+    def closeEvent(self, event):
+        """Write pending autosave changes before the window closes"""
+        self.autosave_timer.stop()
+        if self.current_video_path and self._autosave_state() != self._autosaved_state:
+            self._write_autosave()
+        self.autosave_manager.flush()
+        super().closeEvent(event)
+
+
     def rotateVideo(self):
         """Rotates the video display using QML orientation."""
         if not self.qml_root_main or not self.qml_root_preview:
@@ -1078,42 +1132,115 @@ class VideoPlayerApp(QMainWindow):
             self.shortcuts_container.setVisible(not visible)
             self.toggle_shortcuts_action.setText("Show Shortcuts" if visible else "Hide Shortcuts")
     
+    def restoreAutosaveVersion(self):
+        """Replace the annotations with an earlier autosave version of the current video"""
+        if not self.current_video_path:
+            QMessageBox.information(self, "Autosave Versions", "Open a video first.")
+            return
+        versions = self.autosave_manager.list_autosave_versions(self.current_video_path)
+        if not versions:
+            QMessageBox.information(self, "Autosave Versions", "No autosave versions were found for this video.")
+            return
+        items = [f"{datetime.fromtimestamp(version['created']).strftime('%Y-%m-%d %H:%M:%S')}  ({version['count']} annotations)"
+                 for version in versions]
+        item, ok = QInputDialog.getItem(self, "Autosave Versions", "Restore version:", items, 0, False)
+        if not ok:
+            return
+        try:
+            data = self.autosave_manager.load_autosave_version(versions[items.index(item)]["digest"])
+            self.annotations = TimelineAnnotation.from_records(data.get("annotations", []))
+            self.updateAnnotationTimeline()
+            self.autosave()
+        except Exception as e:
+            QMessageBox.critical(self, "Autosave Error", f"Failed to restore autosave version: {str(e)}")
+
+    def setBinarySessions(self, enabled):
+        """Use the compact binary session format for autosaves and the exported labels"""
+        self.autosave_manager.binary_sessions = enabled
+        QSettings(ORGANIZATION_NAME, APP_NAME).setValue(SETTINGS_BINARY_SESSIONS, enabled)
+
+    def setSqliteStorage(self, enabled):
+        """Keep autosaves in the SQLite database, committing after every edit"""
+        self.autosave_manager.use_database(enabled)
+        # With the database every edit is its own small transaction; a zero
+        # interval still folds the changes of one manager operation together.
+        self.autosave_debounce_timer.setInterval(0 if enabled else self.AUTOSAVE_DEBOUNCE)
+        QSettings(ORGANIZATION_NAME, APP_NAME).setValue(SETTINGS_SQLITE_STORAGE, enabled)
+
     def loadAnnotations(self):
-        filename, _ = QFileDialog.getOpenFileName(self, "Load Annotations", "", "JSON Files (*.json)")
+        filename, _ = QFileDialog.getOpenFileName(
+            self, "Load Annotations", "", f"Annotation Files (*.json *{SESSION_EXTENSION} *.zip)")
         if filename:
-            try:
-                with open(filename, 'r') as f:
-                    data = json.load(f)
-       
-                if self.current_video_path:
-                    saved_hash = data.get("videoHash", 0)
-                    if saved_hash != self.video_hash:
-                        reply = QMessageBox.question(
-                            self,
-                            "Hash Mismatch",
-                            "The video file used to create these annotations appears to be different.\n"
-                            "Loading annotations from a different video may result in incorrect timings.\n"
-                            "Would you like to continue loading anyway?",
-                            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
-                        )
-                        if reply == QMessageBox.StandardButton.No:
-                            return
-                
-                self.annotations = []
-                for ann_data in data.get("annotations", []):
-                    annotation = TimelineAnnotation()
-                    annotation.id = ann_data["id"]
-                    annotation.start_time = ann_data["range"]["start"]
-                    annotation.end_time = ann_data["range"]["end"]
-                    annotation.shape = ann_data["shape"]
-                    annotation.comments = ann_data["comments"]
-                    self.annotations.append(annotation)
-                
-                self.updateAnnotationTimeline()
-                if self.current_video_path:
-                    self.autosave()
-            except Exception as e:
-                QMessageBox.critical(self, "Error", f"Failed to load annotations: {str(e)}")
+            # Parse off the GUI thread; the result is swapped in when it arrives
+            self._annotations_loading = filename
+            self._load_progress = QProgressDialog("Loading annotations...", "Cancel", 0, 100, self)
+            self._load_progress.setWindowTitle("Load Annotations")
+            self._load_progress.setMinimumDuration(500)
+            self._load_progress.canceled.connect(self._cancel_annotations_load)
+
+            def run():
+                try:
+                    # Exported bundles are read through their labels.json, or rebuilt from the CSVs
+                    loader = import_bundle if filename.lower().endswith('.zip') else load_annotations
+                    result = loader(
+                        filename, progress=lambda fraction: self.annotationsLoadProgress.emit(filename, int(fraction * 100)))
+                except Exception as e:
+                    result = e
+                self.annotationsLoaded.emit(filename, result)
+            threading.Thread(target=run, name="load-annotations", daemon=True).start()
+
+    def _cancel_annotations_load(self):
+        self._annotations_loading = None
+        self._load_progress = None
+
+    def _annotations_load_progress(self, filename, percent):
+        if filename == self._annotations_loading and self._load_progress is not None:
+            self._load_progress.setValue(percent)
+
+    def _annotations_load_finished(self, filename, result):
+        """Swap in annotations loaded by loadAnnotations, after the hash check"""
+        if filename != self._annotations_loading:
+            return
+        self._annotations_loading = None
+        if self._load_progress is not None:
+            self._load_progress.canceled.disconnect(self._cancel_annotations_load)
+            self._load_progress.close()
+            self._load_progress = None
+        if isinstance(result, Exception):
+            QMessageBox.critical(self, "Error", f"Failed to load annotations: {str(result)}")
+            return
+
+        # Annotations rebuilt from CSVs carry no hash to check
+        from_csv = filename.lower().endswith('.zip') and "videoHash" not in result.header
+        if self.current_video_path and not from_csv:
+            saved_hash = result.header.get("videoHash", 0)
+            if not self.autosave_manager.hash_matches(saved_hash, self.video_hash, self.current_video_path):
+                reply = QMessageBox.question(
+                    self,
+                    "Hash Mismatch",
+                    "The video file used to create these annotations appears to be different.\n"
+                    "Loading annotations from a different video may result in incorrect timings.\n"
+                    "Would you like to continue loading anyway?",
+                    QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
+                )
+                if reply == QMessageBox.StandardButton.No:
+                    return
+
+        if result.errors:
+            details = "\n".join(f"Record {index + 1}: {reason}" for index, reason in result.errors[:10])
+            if len(result.errors) > 10:
+                details += f"\n... and {len(result.errors) - 10} more"
+            QMessageBox.warning(
+                self,
+                "Load Annotations",
+                f"{len(result.errors)} record(s) could not be loaded and were skipped:\n{details}"
+            )
+
+        self.annotations = result.annotations
+
+        self.updateAnnotationTimeline()
+        if self.current_video_path:
+            self.autosave()
 
     
     
@@ -0,0 +1,87 @@
+import csv
+import threading
+
+UNLABELED_SUFFIX = "_Unlabeled"
+
+
+class LabelVocabulary:
+    """
+    Dictionary encoding of label values per category.
+
+    Code 0 is always the empty value. Values from categories.csv get the next
+    codes in file order; values met elsewhere (labels from older files) are
+    appended the first time they are encoded. Free-text categories such as
+    special notes are kept out of the vocabulary (see
+    models.FREE_TEXT_CATEGORIES).
+    """
+
+    def __init__(self, categories=None):
+        self._codes = {}
+        self._values = {}
+        self._lock = threading.Lock()
+        for category, values in (categories or {}).items():
+            for value in values:
+                self.encode(category, value)
+
+    @classmethod
+    def from_csv(cls, path):
+        """Build a vocabulary from a categories.csv with one column per category"""
+        categories = {}
+        with open(path, 'r', newline='') as f:
+            for row in csv.DictReader(f):
+                for category, value in row.items():
+                    if category and value:
+                        categories.setdefault(category, []).append(value)
+        return cls(categories)
+
+    def encode(self, category, value):
+        value = value or ""
+        codes = self._codes.get(category)
+        code = codes.get(value) if codes is not None else None
+        if code is not None:
+            return code
+        with self._lock:
+            codes = self._codes.setdefault(category, {"": 0})
+            values = self._values.setdefault(category, [""])
+            code = codes.get(value)
+            if code is None:
+                code = len(values)
+                values.append(value)
+                codes[value] = code
+            return code
+
+    def encode_many(self, category, values):
+        return tuple(self.encode(category, value) for value in values)
+
+    def decode(self, category, code):
+        return self._values[category][code] if code else ""
+
+    def decode_many(self, category, codes):
+        return [self.decode(category, code) for code in codes]
+
+    def values(self, category):
+        """All values of a category, indexed by code"""
+        return list(self._values.get(category, [""]))
+
+    def is_unlabeled(self, category, code):
+        """True for the empty value and the *_Unlabeled placeholders"""
+        return code == 0 or self.decode(category, code).endswith(UNLABELED_SUFFIX)
+
+
+_vocabulary = None
+_vocabulary_lock = threading.Lock()
+
+
+def get_vocabulary():
+    """Shared vocabulary loaded from data/categories/categories.csv"""
+    global _vocabulary
+    if _vocabulary is None:
+        from src.utils import resource_path
+        with _vocabulary_lock:
+            if _vocabulary is None:
+                try:
+                    _vocabulary = LabelVocabulary.from_csv(resource_path('data/categories/categories.csv'))
+                except OSError as e:
+                    print(f"Could not load categories for label vocabulary: {str(e)}")
+                    _vocabulary = LabelVocabulary()
+    return _vocabulary
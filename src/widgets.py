@@ -1,7 +1,7 @@
 from PyQt6.QtWidgets import QWidget
 from PyQt6.QtCore import Qt, QPointF, QRectF
-from PyQt6.QtGui import QPainter, QPen, QColor, QLinearGradient
-import json
+from PyQt6.QtGui import QPainter, QPen, QColor, QLinearGradient, QPixmap
+from src.annotation_store import as_store
 
 class TimelineWidget(QWidget):
     def __init__(self, parent=None, show_position=False, is_main_timeline=True):
@@ -16,6 +16,9 @@ class TimelineWidget(QWidget):
         self.hover_annotation = None
         self.hover_pos = None
 
+        self._layer = None
+        self._layer_state = None
+
         self.setCursor(Qt.CursorShape.ArrowCursor)
         self.setMouseTracking(True)
 
@@ -106,14 +109,9 @@ class TimelineWidget(QWidget):
                     if visible_duration <= 0: return
                     new_time = visible_start + (x / self.width()) * visible_duration
 
-                sorted_annotations = sorted(self.app.annotations, key=lambda x: x.start_time)
-                current_index = -1
-                for idx, ann in enumerate(sorted_annotations):
-                    if ann.id == annotation.id:
-                        current_index = idx
-                        break
-
-                if current_index == -1: return
+                sorted_annotations = as_store(self.app.annotations)
+                if annotation not in sorted_annotations: return
+                prev_annotation, next_annotation = sorted_annotations.neighbors(annotation)
 
                 min_duration = 0.05
 
@@ -121,8 +119,7 @@ class TimelineWidget(QWidget):
                     if annotation.end_time - new_time < min_duration:
                         new_time = annotation.end_time - min_duration
 
-                    if current_index > 0:
-                        prev_annotation = sorted_annotations[current_index - 1]
+                    if prev_annotation is not None:
                         if new_time < prev_annotation.end_time:
                             new_time = prev_annotation.end_time
 
@@ -132,8 +129,7 @@ class TimelineWidget(QWidget):
                     if new_time - annotation.start_time < min_duration:
                         new_time = annotation.start_time + min_duration
 
-                    if current_index < len(sorted_annotations) - 1:
-                        next_annotation = sorted_annotations[current_index + 1]
+                    if next_annotation is not None:
                         if new_time > next_annotation.start_time:
                             new_time = next_annotation.start_time
 
@@ -208,12 +204,7 @@ class TimelineWidget(QWidget):
 
         duration = self.app.media_player['_duration'] / 1000 or 1
 
-        visible_start = 0.0
-        visible_duration = duration
-        if not self.is_main_timeline:
-            visible_start = self.app.zoom_start * duration
-            visible_duration = (self.app.zoom_end - self.app.zoom_start) * duration
-            if visible_duration <= 0: visible_duration = 1
+        visible_start, visible_duration = self._visible_window(duration)
 
 
         painter.setPen(Qt.PenStyle.NoPen)
@@ -258,6 +249,79 @@ class TimelineWidget(QWidget):
                 painter.fillRect(QRectF(0, 0, zoom_start_x, self.height()), overlay_color)
                 painter.fillRect(QRectF(zoom_end_x, 0, self.width() - zoom_end_x, self.height()), overlay_color)
 
+        if hasattr(self.app, 'current_annotation') and self.app.current_annotation:
+            start_x, _ = self._get_annotation_screen_coords(self.app.current_annotation, duration)
+            if 0 <= start_x <= self.width():
+                painter.setPen(QPen(QColor(0, 255, 0, 200), 2))
+                painter.drawLine(QPointF(start_x, 0), QPointF(start_x, self.height()))
+
+
+        if hasattr(self.app, 'annotations'):
+            layer = self._annotation_layer(duration)
+            if layer is not None:
+                painter.drawPixmap(QPointF(0, 0), layer)
+            else:
+                self._draw_annotations(painter, self.app.annotations, duration)
+
+        if self.hover_annotation and self.hover_pos:
+            self._draw_hover_tooltip(painter, self.hover_pos, self.hover_annotation)
+
+    def _visible_window(self, duration):
+        """(start, duration) in seconds of the time range this timeline shows"""
+        if self.is_main_timeline:
+            return 0.0, duration
+        visible_duration = (self.app.zoom_end - self.app.zoom_start) * duration
+        if visible_duration <= 0: visible_duration = 1
+        return self.app.zoom_start * duration, visible_duration
+
+    def _layer_key(self, annotations, duration):
+        """
+        State the annotation layer depends on, or None if it cannot be cached.
+
+        Only an AnnotationStore reports its changes (through generation), so
+        plain lists are drawn directly on every paint. The zoomed timeline's
+        window is keyed to the pixel, so sub-pixel scrolling during playback
+        reuses the layer.
+        """
+        generation = getattr(annotations, 'generation', None)
+        if generation is None:
+            return None
+        window = None
+        if not self.is_main_timeline:
+            visible_start, visible_duration = self._visible_window(duration)
+            window = (visible_duration, round(visible_start / visible_duration * self.width()))
+        dragging = (self.dragging[0], self.dragging[1].id) if isinstance(self.dragging, tuple) else None
+        hover_edge = (self.hover_edge[0], self.hover_edge[1].id) if self.hover_edge else None
+        return (annotations, generation, self.width(), self.height(), self.devicePixelRatioF(), duration, window,
+                dragging, hover_edge)
+
+    def _annotation_layer(self, duration):
+        """
+        Annotation blocks and their labels rendered into a transparent pixmap.
+
+        The pixmap is redrawn only when the annotations, the visible window,
+        the widget size or the drag/hover highlight change, so position
+        updates during playback just composite it over the playhead.
+        """
+        annotations = self.app.annotations
+        key = self._layer_key(annotations, duration)
+        if key is None:
+            self._layer = self._layer_state = None
+            return None
+        if self._layer is None or key != self._layer_state:
+            ratio = self.devicePixelRatioF()
+            layer = QPixmap(max(1, round(self.width() * ratio)), max(1, round(self.height() * ratio)))
+            layer.setDevicePixelRatio(ratio)
+            layer.fill(Qt.GlobalColor.transparent)
+            painter = QPainter(layer)
+            painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+            self._draw_annotations(painter, annotations, duration)
+            painter.end()
+            self._layer = layer
+            self._layer_state = key
+        return self._layer
+
+    def _draw_annotations(self, painter, annotations, duration):
         def draw_annotation_block(start_x, end_x, annotation=None, is_dragging=False, is_edge_hover=False):
             block_width = max(1, end_x - start_x)
 
@@ -265,15 +329,11 @@ class TimelineWidget(QWidget):
             y_pos = (self.height() - height) / 2
 
             base_color = QColor("#808080")
-            if annotation and annotation.comments:
-                try:
-                    comment_data = json.loads(annotation.comments[0]["body"])
-                    posture = next((item.get("selectedValue") for item in comment_data if item.get("category") == "POSTURE"), None)
-                    if posture:
-                        color_str = self.app.annotation_manager.get_posture_color(posture)
-                        base_color = QColor(color_str)
-                except Exception as e:
-                    print(f"Error getting annotation color: {e}")
+            if annotation:
+                posture_code = annotation.labels.codes.posture
+                if posture_code:
+                    color_str = self.app.annotation_manager.get_posture_color_by_code(posture_code)
+                    base_color = QColor(color_str)
 
             alpha = 180 if is_dragging else (160 if is_edge_hover else 140)
             color = QColor(base_color.red(), base_color.green(), base_color.blue(), alpha)
@@ -297,51 +357,41 @@ class TimelineWidget(QWidget):
                     painter.drawLine(QPointF(end_x, y_pos - marker_height), QPointF(end_x, y_pos))
                     painter.drawLine(QPointF(end_x, y_pos + height), QPointF(end_x, y_pos + height + marker_height))
 
-        if hasattr(self.app, 'current_annotation') and self.app.current_annotation:
-            start_x, _ = self._get_annotation_screen_coords(self.app.current_annotation, duration)
-            if 0 <= start_x <= self.width():
-                painter.setPen(QPen(QColor(0, 255, 0, 200), 2))
-                painter.drawLine(QPointF(start_x, 0), QPointF(start_x, self.height()))
+        if hasattr(annotations, 'rows_between'):
+            visible_start, visible_duration = self._visible_window(duration)
+            first, stop = annotations.rows_between(visible_start, visible_start + visible_duration)
+            annotations = annotations[first:stop]
 
+        for annotation in annotations:
+            start_x, end_x = self._get_annotation_screen_coords(annotation, duration)
 
-        if hasattr(self.app, 'annotations'):
-            for annotation in self.app.annotations:
-                start_x, end_x = self._get_annotation_screen_coords(annotation, duration)
+            if end_x < 0 or start_x > self.width():
+                continue
 
-                if end_x < 0 or start_x > self.width():
-                    continue
+            clamped_start_x = max(0, start_x)
+            clamped_end_x = min(end_x, self.width())
+            block_width = clamped_end_x - clamped_start_x
 
-                clamped_start_x = max(0, start_x)
-                clamped_end_x = min(end_x, self.width())
-                block_width = clamped_end_x - clamped_start_x
 
+            if block_width >= 0:
+                is_dragging_this = self.dragging and isinstance(self.dragging, tuple) and self.dragging[1].id == annotation.id
+                is_hovering_this_edge = not self.dragging and self.hover_edge and self.hover_edge[1].id == annotation.id
+                draw_annotation_block(clamped_start_x, clamped_end_x, annotation=annotation, is_dragging=is_dragging_this, is_edge_hover=is_hovering_this_edge)
 
-                if block_width >= 0:
-                    is_dragging_this = self.dragging and isinstance(self.dragging, tuple) and self.dragging[1].id == annotation.id
-                    is_hovering_this_edge = not self.dragging and self.hover_edge and self.hover_edge[1].id == annotation.id
-                    draw_annotation_block(clamped_start_x, clamped_end_x, annotation=annotation, is_dragging=is_dragging_this, is_edge_hover=is_hovering_this_edge)
 
+            if block_width > 50:
+                painter.setPen(QPen(QColor(255, 255, 255)))
+                labels = annotation.labels
+                posture = labels.posture
+                hlb = labels.hlb
 
-                if block_width > 50:
-                    painter.setPen(QPen(QColor(255, 255, 255)))
-                    try:
-                        comment_data = json.loads(annotation.comments[0]["body"])
-                        posture = next((item.get("selectedValue") for item in comment_data if item.get("category") == "POSTURE"), "")
-                        hlb_list = next((item.get("selectedValue") for item in comment_data if item.get("category") == "HIGH LEVEL BEHAVIOR"), [])
-                        hlb = hlb_list if isinstance(hlb_list, list) else []
+                text = ", ".join(hlb[:2]) + ("..." if len(hlb) > 2 else "")
+                full_text = f"{posture} - {text}" if posture and text else posture or text
 
-                        text = ", ".join(hlb[:2]) + ("..." if len(hlb) > 2 else "")
-                        full_text = f"{posture} - {text}" if posture and text else posture or text
-
-                        block_height = self.height() * 0.4
-                        block_y_pos = (self.height() - block_height) / 2
-                        text_rect = QRectF(clamped_start_x + 4, block_y_pos, block_width - 8, block_height)
-                        painter.drawText(text_rect, Qt.AlignmentFlag.AlignCenter, full_text)
-                    except Exception as e:
-                        print(f"Error displaying annotation text: {e}")
-
-        if self.hover_annotation and self.hover_pos:
-            self._draw_hover_tooltip(painter, self.hover_pos, self.hover_annotation)
+                block_height = self.height() * 0.4
+                block_y_pos = (self.height() - block_height) / 2
+                text_rect = QRectF(clamped_start_x + 4, block_y_pos, block_width - 8, block_height)
+                painter.drawText(text_rect, Qt.AlignmentFlag.AlignCenter, full_text)
 
     def _get_annotation_screen_coords(self, annotation, duration):
         if duration <= 0: return -1, -1
@@ -358,46 +408,37 @@ class TimelineWidget(QWidget):
         return start_x, end_x
 
     def _format_annotation_for_tooltip(self, annotation):
-        if not annotation or not annotation.comments:
+        if not annotation:
             return ""
 
-        try:
-            comment_list = json.loads(annotation.comments[0]['body'])
-
-            def find_value(category_name):
-                return next((item.get("selectedValue") for item in comment_list if item.get("category") == category_name), None)
-
-            tooltip_items = [
-                ("Posture", find_value("POSTURE")),
-                ("Behavior", find_value("HIGH LEVEL BEHAVIOR")),
-                ("PA Type", find_value("PHYSICAL ACTIVITY TYPE")),
-                ("Params", find_value("BEHAVIORAL PARAMETERS")),
-                ("Situation", find_value("EXPERIMENTAL SITUATION")),
-                ("Notes", find_value("SPECIAL NOTES")),
-            ]
-
-            parts = []
-            for label, value in tooltip_items:
-                if not value:
-                    continue
-
-                if isinstance(value, list):
-                    valid_values = [str(v) for v in value if v]
-                    if not valid_values: continue
-                    formatted_value = ", ".join(valid_values)
-                else:
-                    formatted_value = str(value)
-
-                parts.append(f"{label}: {formatted_value}")
+        labels = annotation.labels
+        tooltip_items = [
+            ("Posture", labels.posture),
+            ("Behavior", labels.hlb),
+            ("PA Type", labels.pa_type),
+            ("Params", labels.behavioral_params),
+            ("Situation", labels.exp_situation),
+            ("Notes", labels.special_notes),
+        ]
+
+        parts = []
+        for label, value in tooltip_items:
+            if not value:
+                continue
+
+            if isinstance(value, tuple):
+                valid_values = [str(v) for v in value if v]
+                if not valid_values: continue
+                formatted_value = ", ".join(valid_values)
+            else:
+                formatted_value = str(value)
 
-            if not parts:
-                return "No Labels Set"
+            parts.append(f"{label}: {formatted_value}")
 
-            return " | ".join(parts)
+        if not parts:
+            return "No Labels Set"
 
-        except (json.JSONDecodeError, IndexError, KeyError, TypeError) as e:
-            print(f"Error formatting tooltip: {e}")
-            return "Invalid Annotation Data"
+        return " | ".join(parts)
 
 
     def _draw_hover_tooltip(self, painter, position, annotation):
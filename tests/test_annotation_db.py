@@ -0,0 +1,84 @@
+import io
+import json
+import pytest
+from src.annotation_db import AnnotationDatabase
+from src.annotation_store import AnnotationStore
+from src.models import TimelineAnnotation
+
+@pytest.fixture
+def database(tmp_path):
+    db = AnnotationDatabase(str(tmp_path / "annotations.sqlite3"))
+    yield db
+    db.close()
+
+@pytest.fixture
+def store():
+    annotations = [TimelineAnnotation(start_time=start, end_time=start + 5) for start in (0, 10, 20)]
+    annotations[1].update_comment_body(posture="Sitting")
+    return AnnotationStore(annotations)
+
+def test_wal_mode(database):
+    assert database._connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+def test_write_and_load(database, store):
+    database.write("a.mp4", store.snapshot(), video_hash="sfp1-x")
+    data = database.load("a.mp4")
+    assert data["videoHash"] == "sfp1-x"
+    assert data["annotations"] == json.loads(json.dumps(store.snapshot()))
+    assert database.load("b.mp4") is None
+
+def test_incremental_changes(database, store):
+    from src.utils import _journal_ops
+    database.write("a.mp4", store.snapshot())
+    previous = {record["id"]: record for record in store.snapshot()}
+    store[0].end_time = 3
+    removed = store[2]
+    store.remove(removed)
+    _, changes = _journal_ops(previous, store.snapshot())
+    database.write("a.mp4", store.snapshot(), changes=changes)
+    assert [record["range"] for record in database.iter_records("a.mp4")] == [
+        {"start": 0, "end": 3}, {"start": 10, "end": 15}]
+
+def test_point_and_overlap_queries(database, store):
+    database.write("a.mp4", store.snapshot())
+    assert database.annotation_at("a.mp4", 12)["id"] == store[1].id
+    assert database.annotation_at("a.mp4", 7) is None
+    assert [record["id"] for record in database.overlapping("a.mp4", 3, 12)] == [store[0].id, store[1].id]
+    assert database.overlapping("a.mp4", 15, 20) == []
+
+def test_queries_with_overlapping_rows(database):
+    from src.utils import _journal_ops
+    store = AnnotationStore([TimelineAnnotation(start_time=0, end_time=5)])
+    database.write("a.mp4", store.snapshot())
+    previous = {record["id"]: record for record in store.snapshot()}
+    store.append(TimelineAnnotation(start_time=10, end_time=100))
+    store.append(TimelineAnnotation(start_time=20, end_time=30))
+    _, changes = _journal_ops(previous, store.snapshot())
+    database.write("a.mp4", store.snapshot(), changes=changes)
+    assert database.annotation_at("a.mp4", 50)["id"] == store[1].id
+    assert database.annotation_at("a.mp4", 25)["id"] == store[1].id
+    assert [record["id"] for record in database.overlapping("a.mp4", 40, 60)] == [store[1].id]
+    assert [record["id"] for record in database.overlapping("a.mp4", 4, 22)] == [store[0].id, store[1].id, store[2].id]
+
+def test_longest_bound_added_to_older_databases(tmp_path, store):
+    import sqlite3
+    from src.annotation_db import _SCHEMA
+    path = str(tmp_path / "old.sqlite3")
+    connection = sqlite3.connect(path)
+    connection.executescript(_SCHEMA.replace(",\n    longest REAL NOT NULL DEFAULT 0", ""))
+    connection.execute("INSERT INTO sessions VALUES ('a.mp4', '0', 2, 0)")
+    connection.execute("INSERT INTO annotations VALUES ('a.mp4', 'x', 0, 50, ?)",
+                       (json.dumps({"id": "x", "range": {"start": 0, "end": 50}}),))
+    connection.commit()
+    connection.close()
+    database = AnnotationDatabase(path)
+    assert database.annotation_at("a.mp4", 40)["id"] == "x"
+    database.close()
+
+def test_stream_labels_json(database, store):
+    database.write("a.mp4", store.snapshot(), video_hash=5)
+    out = io.BytesIO()
+    database.write_labels_json("a.mp4", out)
+    data = json.loads(out.getvalue())
+    assert data["videoHash"] == 5 and data["version"] == 2
+    assert [TimelineAnnotation.from_record(r).labels for r in data["annotations"]] == [a.labels for a in store]
@@ -0,0 +1,87 @@
+import json
+import pytest
+from src.annotation_loader import iter_json_records, load_annotations, validate_record
+from src.annotation_store import AnnotationStore
+from src.models import TimelineAnnotation
+from src.session_format import encode_session
+
+@pytest.fixture
+def records():
+    annotations = []
+    for i in range(50):
+        annotation = TimelineAnnotation(start_time=i * 2.0, end_time=i * 2.0 + 1.5)
+        annotation.update_comment_body(posture="Sitting" if i % 2 else "Standing")
+        annotations.append(annotation)
+    return [json.loads(json.dumps(record)) for record in AnnotationStore(annotations).snapshot()]
+
+def write_json(tmp_path, data, indent=4):
+    path = tmp_path / "labels.json"
+    path.write_text(json.dumps(data, indent=indent))
+    return str(path)
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1 << 20])
+@pytest.mark.parametrize("indent", [None, 4])
+def test_iter_json_records_matches_json_load(tmp_path, records, chunk_size, indent):
+    data = {"version": 2, "annotations": records, "videoHash": 12345, "video_path": "/v.mp4"}
+    path = write_json(tmp_path, data, indent)
+    header = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        assert list(iter_json_records(f, header, chunk_size)) == records
+    assert header == {"version": 2, "videoHash": 12345, "video_path": "/v.mp4"}
+
+def test_iter_json_records_empty(tmp_path):
+    header = {}
+    with open(write_json(tmp_path, {"annotations": [], "videoHash": 0}), 'r') as f:
+        assert list(iter_json_records(f, header, 3)) == []
+    assert header == {"videoHash": 0}
+
+def test_load_skips_invalid_records(tmp_path, records):
+    records[3] = {"id": "bad"}
+    records[7]["range"]["start"] = "soon"
+    records[9]["comments"] = "nope"
+    path = write_json(tmp_path, {"annotations": records, "videoHash": "sfp1-x"})
+    progress = []
+    result = load_annotations(path, progress=progress.append, chunk_size=64)
+    assert [index for index, _ in result.errors] == [3, 7, 9]
+    assert len(result.annotations) == 47
+    assert isinstance(result.annotations, AnnotationStore)
+    assert result.header["videoHash"] == "sfp1-x"
+    assert progress[-1] == 1.0
+    assert progress == sorted(progress)
+
+def test_load_keeps_records_before_syntax_error(tmp_path, records):
+    path = tmp_path / "labels.json"
+    text = json.dumps({"annotations": records[:5]})
+    path.write_text(text[:text.index(records[3]["id"])])
+    result = load_annotations(str(path), chunk_size=16)
+    assert len(result.annotations) == 3
+    assert len(result.errors) == 1
+    assert "not valid JSON" in result.errors[0][1]
+
+def test_load_binary_session(tmp_path, records):
+    path = tmp_path / "labels.paaws"
+    path.write_bytes(encode_session({"annotations": records, "videoHash": 7}))
+    result = load_annotations(str(path))
+    assert result.errors == []
+    assert result.header == {"videoHash": 7}
+    assert [a.to_record() for a in result.annotations] == records
+
+def test_validate_record():
+    record = {"id": "a", "range": {"start": 1, "end": 2}}
+    assert validate_record(record) is None
+    assert validate_record([]) == "record is not an object"
+    assert validate_record({"range": {"start": 1, "end": 2}}) == "missing id"
+    assert validate_record({"id": "a", "range": {"start": 3, "end": 2}}) == "range ends before it starts"
+    assert validate_record({"id": "a", "range": {"start": True, "end": 2}}) == "range start and end must be numbers"
+
+def test_load_skips_records_with_unusable_comments(tmp_path, records):
+    records[1]["comments"] = ["x"]
+    records[2]["comments"] = [{"id": "c", "labels": "Sitting"}]
+    records[4]["comments"] = [{"id": "c", "body": None}]
+    records[5]["comments"] = [{"id": "c", "body": "[]"}]
+    path = write_json(tmp_path, {"annotations": records})
+    result = load_annotations(path)
+    assert result.errors == [(1, "comment is not an object"), (2, "comment labels is not an object"),
+                             (4, "comment has no body or labels")]
+    for annotation in result.annotations:
+        annotation.labels
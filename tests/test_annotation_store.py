@@ -0,0 +1,152 @@
+import pytest
+from src.annotation_store import AnnotationStore, as_store
+from src.models import TimelineAnnotation
+
+@pytest.fixture
+def store():
+    return AnnotationStore([
+        TimelineAnnotation(start_time=30, end_time=40),
+        TimelineAnnotation(start_time=10, end_time=20),
+        TimelineAnnotation(start_time=20, end_time=25),
+    ])
+
+def starts(store):
+    return [ann.start_time for ann in store]
+
+def test_store_sorted_on_creation_and_append(store):
+    assert starts(store) == [10, 20, 30]
+    store.append(TimelineAnnotation(start_time=0, end_time=5))
+    assert starts(store) == [0, 10, 20, 30]
+
+def test_index_at(store):
+    assert store.index_at(15) == 0
+    assert store.index_at(20) == 0
+    assert store.index_at(22) == 1
+    assert store.index_at(27) == -1
+    assert store.index_at(45) == -1
+    assert store.annotation_at(35) is store[2]
+
+def test_overlaps(store):
+    assert not store.overlaps(25, 30)
+    assert not store.overlaps(40, 50)
+    assert store.overlaps(24, 31)
+    assert store.overlaps(5, 11)
+    assert not store.overlaps(12, 18, exclude=store[0])
+
+def test_rows_between(store):
+    assert store.rows_between(0, 100) == (0, 3)
+    assert store.rows_between(21, 22) == (1, 2)
+    assert store.rows_between(20, 20) == (0, 2)
+    assert store.rows_between(26, 29) == (2, 2)
+    assert store.rows_between(41, 50) == (3, 3)
+    assert store.rows_between(0, 5) == (0, 0)
+
+def test_queries_with_overlapping_annotations():
+    store = AnnotationStore([TimelineAnnotation(start_time=0, end_time=100),
+                             TimelineAnnotation(start_time=10, end_time=20),
+                             TimelineAnnotation(start_time=30, end_time=40)])
+    assert store.index_at(50) == 0
+    assert store.index_at(35) == 0
+    assert store.overlaps(50, 60)
+    assert not store.overlaps(50, 60, exclude=store[0])
+    first, stop = store.rows_between(50, 60)
+    assert store[0] in store[first:stop]
+    assert store.index_at(150) == -1
+
+def test_overlap_queries_follow_edits():
+    import random
+    rng = random.Random(3)
+    annotations = []
+    for _ in range(40):
+        start = rng.uniform(0, 100)
+        annotations.append(TimelineAnnotation(start_time=start, end_time=start + rng.uniform(0.5, 30)))
+    store = AnnotationStore(annotations[:30])
+    for annotation in annotations[30:]:
+        store.append(annotation)
+    for annotation in rng.sample(annotations, 10):
+        annotation.end_time = annotation.start_time + rng.uniform(0.5, 5)
+    for annotation in rng.sample(annotations, 5):
+        annotation.start_time = rng.uniform(0, annotation.end_time)
+    for annotation in rng.sample(list(store), 8):
+        store.remove(annotation)
+    for t in [rng.uniform(-5, 140) for _ in range(200)]:
+        containing = [row for row, a in enumerate(store)
+                      if a.start_time - 0.001 <= t <= a.end_time + 0.001]
+        assert store.index_at(t) == (containing[0] if containing else -1)
+        assert store.overlaps(t, t + 2) == any(a.end_time - 0.001 > t and a.start_time < t + 2 - 0.001
+                                               for a in store)
+        first, stop = store.rows_between(t, t + 2)
+        visible = [a for a in store if a.end_time >= t and a.start_time <= t + 2]
+        assert all(a in store[first:stop] for a in visible)
+
+def test_remove_and_neighbors(store):
+    middle = store[1]
+    assert store.neighbors(middle) == (store[0], store[2])
+    store.remove(middle)
+    assert starts(store) == [10, 30]
+    assert middle not in store
+    with pytest.raises(ValueError):
+        store.remove(middle)
+
+def test_times_changed_keeps_store_sorted(store):
+    first = store[0]
+    first.start_time = 50
+    first.end_time = 60
+    assert starts(store) == [20, 30, 50]
+    assert store.index_at(55) == 2
+    store[0].end_time = 28
+    assert store.overlaps(27, 29)
+
+def test_as_store_wraps_plain_lists(store):
+    assert as_store(store) is store
+    wrapped = as_store([TimelineAnnotation(start_time=5, end_time=6)])
+    assert isinstance(wrapped, AnnotationStore)
+    assert len(wrapped) == 1
+
+def test_boundary_navigation(store):
+    assert store.next_boundary(15) == 20
+    assert store.next_boundary(20) == 25
+    assert store.previous_boundary(30) == 25
+    assert store.previous_boundary(10) is None
+    assert store.next_boundary(40) is None
+
+def test_boundaries_follow_edits(store):
+    store[2].end_time = 45
+    assert store.next_boundary(40) == 45
+    store.remove(store[1])
+    assert store.next_boundary(20) == 30
+    store.append(TimelineAnnotation(start_time=50, end_time=55))
+    assert store.next_boundary(45) == 50
+
+def test_label_codes_and_id_lookup(store):
+    store[0].update_comment_body(posture="Sitting")
+    store[2].update_comment_body(posture="Sitting")
+    codes = store.label_codes()
+    table = store.label_table()
+    assert codes[0] == codes[2] != codes[1]
+    assert table[codes[0]].posture == "Sitting"
+    assert store.get(store[1].id) is store[1]
+    store.remove(store[0])
+    assert store.row_of_id(store[0].id) == 0
+    assert list(store.start_times()) == [20, 30]
+
+def test_snapshot_reuses_unchanged_records(store):
+    snapshot = store.snapshot()
+    assert store.snapshot() is snapshot
+    assert [record["range"]["start"] for record in snapshot] == [10, 20, 30]
+    store[1].update_comment_body(posture="Sitting")
+    changed = store.snapshot()
+    assert changed is not snapshot
+    assert changed[0] is snapshot[0] and changed[2] is snapshot[2]
+    assert changed[1]["comments"][0]["labels"]["POSTURE"] == "Sitting"
+    store[2].end_time = 45
+    assert store.snapshot()[2]["range"]["end"] == 45
+
+def test_generation_counts_changes(store):
+    generation = store.generation
+    store[0].end_time = store[0].end_time
+    assert store.generation == generation
+    store[0].end_time = 18
+    store[1].update_comment_body(posture="Sitting")
+    store.append(TimelineAnnotation(start_time=50, end_time=55))
+    assert store.generation >= generation + 3
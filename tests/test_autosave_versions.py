@@ -0,0 +1,47 @@
+import os
+import pytest
+from src.autosave_versions import AutosaveVersions
+
+HOUR = 3600
+
+@pytest.fixture
+def versions(tmp_path):
+    return AutosaveVersions(str(tmp_path / "versions"))
+
+def test_equal_snapshots_share_one_object(versions):
+    first = versions.add("a.mp4", b'{"annotations": []}', created=1000)
+    second = versions.add("a.mp4", b'{"annotations": []}', created=1001)
+    assert first == second
+    assert len(versions.list("a.mp4")) == 2
+    assert len([name for name in os.listdir(versions.directory) if name != "manifest.json"]) == 1
+    assert versions.load(first) == {"annotations": []}
+
+def test_manifest_lists_versions_per_video_newest_first(versions):
+    versions.add("a.mp4", b'{"n": 1}', count=1, created=1000)
+    versions.add("b.mp4", b'{"n": 2}', count=2, created=2000)
+    versions.add("a.mp4", b'{"n": 3}', count=3, created=3000)
+    reloaded = AutosaveVersions(versions.directory)
+    assert [version["count"] for version in reloaded.list("a.mp4")] == [3, 1]
+    assert [version["count"] for version in reloaded.list("b.mp4")] == [2]
+
+def test_retention_keeps_last_hourly_and_daily(versions):
+    versions.keep_last = 2
+    versions.keep_hourly = 3
+    versions.keep_daily = 0
+    # Two versions in each of five hours
+    for hour in range(5):
+        for minute in (10, 40):
+            versions.add("a.mp4", f'{{"h": {hour}, "m": {minute}}}'.encode(), created=hour * HOUR + minute * 60)
+    kept = [version["created"] for version in versions.list("a.mp4")]
+    assert kept == [4 * HOUR + 2400, 4 * HOUR + 600, 3 * HOUR + 2400, 2 * HOUR + 2400]
+
+def test_size_cap_evicts_least_recently_used(versions):
+    versions.max_total_size = 250
+    old = versions.add("a.mp4", b'"' + b"a" * 98 + b'"', created=1000)
+    unused = versions.add("b.mp4", b'"' + b"b" * 98 + b'"', created=2000)
+    versions.load(old)
+    versions.add("c.mp4", b'"' + b"c" * 98 + b'"')
+    assert versions.list("b.mp4") == []
+    assert not os.path.exists(versions.object_path(unused))
+    assert len(versions.list("a.mp4")) == 1
+    assert len(versions.list("c.mp4")) == 1
@@ -0,0 +1,82 @@
+import json
+import os
+from zipfile import ZipFile
+import pytest
+from src.annotation_store import AnnotationStore
+from src.batch_export import export_batch, find_inputs, load_input, main, output_path_for, summarize
+from src.models import TimelineAnnotation
+
+def records(count=3):
+    annotations = []
+    for i in range(count):
+        annotation = TimelineAnnotation(start_time=i * 10, end_time=i * 10 + 5)
+        annotation.update_comment_body(posture="Sitting", hlb=["Eating"])
+        annotations.append(annotation)
+    return list(AnnotationStore(annotations).snapshot())
+
+def write_session(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(data, f)
+    return str(path)
+
+@pytest.fixture
+def study(tmp_path):
+    return [write_session(tmp_path / f"P{i:02d}" / "labels.json", {"version": 2, "annotations": records(i + 1),
+                                                                    "videoHash": "sfp1-x"})
+            for i in range(3)]
+
+def test_find_inputs_and_output_names(tmp_path, study):
+    (tmp_path / "P00" / "notes.json").write_text("{}")
+    assert find_inputs([str(tmp_path)]) == study
+    assert output_path_for(study[0]) == os.path.join(os.path.dirname(study[0]), "P00.zip")
+    assert output_path_for("/a/video_autosave.json", "/out") == os.path.join("/out", "video.zip")
+
+def test_export_batch_in_parallel_and_resume(tmp_path, study):
+    out = str(tmp_path / "out")
+    results = export_batch(study, out, jobs=2)
+    assert [result["status"] for result in results] == ["exported"] * 3
+    assert [result["annotations"] for result in results] == [1, 2, 3]
+    with ZipFile(os.path.join(out, "P02.zip")) as zipf:
+        assert {"labels.json", "POSTURE.csv", "HIGH LEVEL BEHAVIOR.csv"} <= set(zipf.namelist())
+
+    assert [result["status"] for result in export_batch(study, out, jobs=1)] == ["up to date"] * 3
+    later = os.path.getmtime(os.path.join(out, "P01.zip")) + 10
+    os.utime(study[1], (later, later))
+    assert [result["status"] for result in export_batch(study, out, jobs=1)] == ["up to date", "exported", "up to date"]
+    assert [result["status"] for result in export_batch(study, out, jobs=1, force=True)] == ["exported"] * 3
+    assert "3 exported" in summarize(export_batch(study, out, force=True))
+
+def test_failures_and_duplicate_outputs_are_reported(tmp_path, study):
+    broken = tmp_path / "P09" / "labels.json"
+    broken.parent.mkdir()
+    broken.write_text("not json")
+    results = export_batch(study[:1] + [str(broken), study[0]], str(tmp_path / "out"), jobs=1)
+    assert [result["status"] for result in results] == ["exported", "exported", "failed"]
+    assert results[1]["skipped"] and results[1]["annotations"] == 0
+    assert "same output" in results[2]["error"]
+    assert not any(name.endswith(".tmp") for name in os.listdir(tmp_path / "out"))
+
+def test_autosave_journal_is_replayed(tmp_path):
+    saved = records(3)
+    path = write_session(tmp_path / "video_autosave.json", {"version": 2, "annotations": saved, "videoHash": 0,
+                                                             "video_path": "/missing.mp4", "journal": "j1"})
+    with open(tmp_path / "video_autosave.journal", 'w') as f:
+        f.write(json.dumps({"journal": "j1"}) + "\n")
+        f.write(json.dumps({"op": "delete", "id": saved[1]["id"]}) + "\n")
+    assert [a.id for a in load_input(path).annotations] == [saved[0]["id"], saved[2]["id"]]
+
+def test_main_writes_report(tmp_path, study, capsys):
+    report = tmp_path / "report.json"
+    assert main([str(tmp_path), "-o", str(tmp_path / "out"), "-j", "1", "--report", str(report)]) == 0
+    assert [result["status"] for result in json.loads(report.read_text())] == ["exported"] * 3
+    assert "3 file(s)" in capsys.readouterr().out
+
+def test_columnar_output(tmp_path, study):
+    from src.columnar import load_columns
+    out = str(tmp_path / "out")
+    export_batch(study, out, jobs=1)
+    results = export_batch(study, out, jobs=1, columnar=True)
+    assert [result["status"] for result in results] == ["exported"] * 3
+    assert load_columns(os.path.join(out, "P02.npz"))["start_ms"].tolist() == [0, 10000, 20000]
+    assert [result["status"] for result in export_batch(study, out, jobs=1, columnar=True)] == ["up to date"] * 3
@@ -0,0 +1,136 @@
+import csv
+import io
+import json
+import time
+from zipfile import ZipFile
+import pytest
+from src.annotation_store import AnnotationStore
+from src.bundle import CSV_HEADER, LABELSETS, import_bundle, read_category_csv
+from src.models import TimelineAnnotation
+
+def stamp(seconds, day="2024-03-05"):
+    return f"{day} {int(seconds) // 3600:02d}:{int(seconds) // 60 % 60:02d}:{int(seconds) % 60:02d}"
+
+def make_annotations():
+    annotations = []
+    for i, (posture, hlb) in enumerate([("Sitting", ["Eating", "Reading"]), ("Sitting", []), ("Standing", ["Walking"])]):
+        annotation = TimelineAnnotation(start_time=100 + i * 10, end_time=110 + i * 10)
+        annotation.update_comment_body(posture=posture, hlb=hlb)
+        annotations.append(annotation)
+    gap = TimelineAnnotation(start_time=200, end_time=230)
+    gap.update_comment_body(pa_type="Walking", special_notes="door, then hall")
+    annotations.append(gap)
+    return annotations
+
+def csv_members(annotations):
+    members = {}
+    for category, _ in LABELSETS.items():
+        rows = []
+        for annotation in annotations:
+            value = annotation.labels.by_category.get(category)
+            prediction = ", ".join(value) if isinstance(value, (list, tuple)) else value
+            if prediction:
+                rows.append([stamp(annotation.start_time + 3600), stamp(annotation.end_time + 3600), prediction,
+                             'Expert', LABELSETS[category], stamp(annotation.start_time), stamp(annotation.end_time)])
+        if rows:
+            output = io.StringIO()
+            writer = csv.writer(output)
+            writer.writerow(CSV_HEADER)
+            writer.writerows(rows)
+            members[f"{category}.csv"] = output.getvalue()
+    return members
+
+def labels_of(annotations):
+    return [(a.start_time, a.end_time, a.labels.by_category) for a in annotations]
+
+def test_import_rebuilds_annotations_from_csvs(tmp_path):
+    annotations = make_annotations()
+    path = tmp_path / "export.zip"
+    with ZipFile(path, 'w') as zipf:
+        for name, text in csv_members(annotations).items():
+            zipf.writestr(name, text)
+    result = import_bundle(str(path))
+    assert result.errors == []
+    assert result.header == {}
+    assert labels_of(result.annotations) == labels_of(annotations)
+
+def test_import_prefers_labels_json(tmp_path):
+    annotations = make_annotations()
+    path = tmp_path / "export.zip"
+    with ZipFile(path, 'w') as zipf:
+        zipf.writestr('labels.json', json.dumps({"annotations": list(AnnotationStore(annotations).snapshot()),
+                                                 "videoHash": "sfp1-x"}))
+        for name, text in csv_members(annotations[:1]).items():
+            zipf.writestr(name, text)
+    result = import_bundle(str(path))
+    assert [a.id for a in result.annotations] == [a.id for a in annotations]
+    assert result.header["videoHash"] == "sfp1-x"
+    assert len(import_bundle(str(path), prefer_labels=False).annotations) == 1
+
+def test_import_directory_of_csvs(tmp_path):
+    annotations = make_annotations()
+    for name, text in csv_members(annotations).items():
+        (tmp_path / name).write_text(text)
+    (tmp_path / "notes.txt").write_text("ignored")
+    assert labels_of(import_bundle(str(tmp_path)).annotations) == labels_of(annotations)
+
+def test_read_category_csv_reports_bad_rows():
+    text = "\n".join([",".join(CSV_HEADER),
+                      f"x,y,Sitting,Expert,Posture,{stamp(0)},{stamp(5)}",
+                      f"x,y,Sitting,Expert,Posture,garbage,{stamp(5)}",
+                      f"x,y,Sitting,Expert,Posture,{stamp(9)},{stamp(9)}",
+                      "too,short"])
+    starts, stops, predictions, errors = read_category_csv(io.StringIO(text), "POSTURE.csv")
+    assert list(stops - starts) == [5]
+    assert predictions == ["Sitting"]
+    assert [row for row, _ in errors] == [2, 3, 4]
+
+def test_import_is_fast_for_a_day_of_labels(tmp_path):
+    annotations = []
+    for i in range(20000):
+        annotation = TimelineAnnotation(start_time=i * 4, end_time=i * 4 + 3)
+        annotation.update_comment_body(posture=("Sitting", "Standing", "Lying")[i % 3], hlb=["Eating"])
+        annotations.append(annotation)
+    path = tmp_path / "export.zip"
+    with ZipFile(path, 'w') as zipf:
+        for name, text in csv_members(annotations).items():
+            zipf.writestr(name, text)
+    started = time.perf_counter()
+    result = import_bundle(str(path))
+    assert time.perf_counter() - started < 2
+    assert len(result.annotations) == 20000
+
+def test_export_matches_strftime_rows(tmp_path):
+    from datetime import datetime, timedelta
+    from zipfile import ZIP_DEFLATED
+    from src.bundle import write_category_csvs
+    annotations = make_annotations()
+    annotations[0].start_time = 100.9999996
+    video_date = datetime(2024, 3, 5, 13, 7, 9, 500000)
+    path = tmp_path / "export.zip"
+    with ZipFile(path, 'w', compression=ZIP_DEFLATED) as zipf:
+        write_category_csvs(zipf, annotations, video_date, chunk_size=2)
+    date_only = video_date.replace(hour=0, minute=0, second=0, microsecond=0)
+    fmt = "%Y-%m-%d %H:%M:%S"
+    with ZipFile(path) as zipf:
+        assert sorted(zipf.namelist()) == ["HIGH LEVEL BEHAVIOR.csv", "PA TYPE.csv", "POSTURE.csv", "Special Notes.csv"]
+        assert all(info.compress_type == ZIP_DEFLATED for info in zipf.infolist())
+        assert all(info.date_time[0] > 1980 for info in zipf.infolist())
+        rows = list(csv.reader(io.TextIOWrapper(zipf.open("POSTURE.csv"), encoding='utf-8', newline='')))
+    assert rows[0] == CSV_HEADER
+    expected = [[(video_date + timedelta(seconds=a.start_time)).strftime(fmt),
+                 (video_date + timedelta(seconds=a.end_time)).strftime(fmt),
+                 a.labels.posture, 'Expert', 'Posture',
+                 (date_only + timedelta(seconds=a.start_time)).strftime(fmt),
+                 (date_only + timedelta(seconds=a.end_time)).strftime(fmt)]
+                for a in annotations if a.labels.posture]
+    assert rows[1:] == expected
+
+def test_export_then_import_round_trip(tmp_path):
+    from datetime import datetime
+    from src.bundle import write_category_csvs
+    annotations = make_annotations()
+    path = tmp_path / "export.zip"
+    with ZipFile(path, 'w') as zipf:
+        write_category_csvs(zipf, annotations, datetime(2024, 3, 5, 8, 30))
+    assert labels_of(import_bundle(str(path)).annotations) == labels_of(annotations)
@@ -0,0 +1,75 @@
+from zipfile import ZIP_STORED, ZipFile
+import numpy as np
+import pytest
+from src.columnar import load_columns, write_columns
+from src.label_arrays import LabelIndex
+from src.models import TimelineAnnotation
+
+@pytest.fixture
+def annotations():
+    result = []
+    for i, (posture, hlb) in enumerate([("Sitting", ["Eating"]), ("Standing", []), ("Sitting", ["Eating", "Reading"])]):
+        annotation = TimelineAnnotation(start_time=i * 2.5, end_time=i * 2.5 + 1.25)
+        annotation.update_comment_body(posture=posture, hlb=hlb)
+        result.append(annotation)
+    return result
+
+def test_round_trip_is_memory_mapped(tmp_path, annotations):
+    path = str(tmp_path / "labels.npz")
+    write_columns(path, annotations, video_hash="sfp1-x")
+    arrays = load_columns(path)
+    assert isinstance(arrays["start_ms"], np.memmap) and isinstance(arrays["codes"], np.memmap)
+    assert arrays["start_ms"].tolist() == [0, 2500, 5000]
+    assert arrays["end_ms"].tolist() == [1250, 3750, 6250]
+    assert arrays["codes"].dtype == np.uint8 and arrays["codes"].flags.f_contiguous
+    assert arrays["ids"].astype(str).tolist() == [a.id for a in annotations]
+    assert str(arrays["video_hash"]) == "sfp1-x"
+    posture = arrays["categories"].tolist().index("POSTURE")
+    assert [arrays["values"][posture][code] for code in arrays["codes"][:, posture]] == ["Sitting", "Standing", "Sitting"]
+
+    with ZipFile(path) as zipf:
+        assert all(info.compress_type == ZIP_STORED and info.date_time[0] > 1980 for info in zipf.infolist())
+
+    # numpy reads the same file as an ordinary .npz
+    with np.load(path) as data:
+        assert (data["codes"] == arrays["codes"]).all()
+    assert load_columns(path, mmap_mode=None)["start_ms"].tolist() == [0, 2500, 5000]
+
+def test_label_index_from_columns(tmp_path, annotations):
+    path = str(tmp_path / "labels.npz")
+    write_columns(path, annotations)
+    index = LabelIndex.load(path)
+    direct = LabelIndex(annotations)
+    assert index.values("HIGH LEVEL BEHAVIOR") == direct.values("HIGH LEVEL BEHAVIOR")
+    times = np.linspace(0, 7, 50)
+    for category, codes in direct.labels_at(times).items():
+        assert (index.labels_at(times)[category] == codes).all()
+
+def test_empty_session(tmp_path):
+    path = str(tmp_path / "empty.npz")
+    write_columns(path, [])
+    arrays = load_columns(path)
+    assert arrays["start_ms"].shape == (0,)
+    assert len(LabelIndex.load(path)) == 0
+
+def test_non_ascii_ids(tmp_path, annotations):
+    from src.annotation_store import AnnotationStore
+    records = [dict(record, id=f"é{i}") for i, record in enumerate(AnnotationStore(annotations).snapshot())]
+    path = str(tmp_path / "labels.npz")
+    write_columns(path, TimelineAnnotation.from_records(records))
+    assert LabelIndex.load(path).ids == ["é0", "é1", "é2"]
+
+def test_label_matrix_is_not_columnar(tmp_path, annotations):
+    from src.columnar import is_columnar
+    from src.label_arrays import export_label_matrix
+    matrix_path = str(tmp_path / "matrix.npz")
+    export_label_matrix(matrix_path, annotations, 2)
+    columns_path = str(tmp_path / "columns.bin")
+    write_columns(columns_path, annotations)
+    assert not is_columnar(matrix_path)
+    assert is_columnar(columns_path)
+    assert len(LabelIndex.load(columns_path)) == 3
+    with pytest.raises(ValueError):
+        LabelIndex.load(matrix_path)
+    with pytest.raises(ValueError):
+        load_columns(matrix_path)
@@ -5,6 +5,7 @@ from unittest.mock import patch, MagicMock
 from PyQt6.QtCore import Qt
 from PyQt6.QtWidgets import QWidget, QLabel, QPushButton # Import QWidget
 from src.dialogs import AnnotationDialog
+from src.models import TimelineAnnotation
 
 @pytest.fixture
 def mock_categories_csv():
@@ -117,4 +118,20 @@ def test_keyboard_shortcuts_focus_combos(qtbot, mock_categories_csv):
     dialog.posture_combo.hidePopup()
     qtbot.keyPress(dialog, Qt.Key.Key_2)
     assert dialog.hlb_combo.view().isVisible()
-    dialog.hlb_combo.hidePopup()
\ No newline at end of file
+    dialog.hlb_combo.hidePopup()
+
+
+def test_initial_data_read_from_v2_labels():
+    annotation = TimelineAnnotation.from_record({
+        "id": "a", "range": {"start": 0, "end": 1},
+        "comments": [{"id": "c", "labels": {"POSTURE": "Sitting", "HIGH LEVEL BEHAVIOR": ["Walking"]}}]})
+    data = AnnotationDialog._get_initial_data(MagicMock(), annotation)
+    data_map = {item["category"]: item["selectedValue"] for item in data}
+    assert data_map["POSTURE"] == "Sitting"
+    assert data_map["HIGH LEVEL BEHAVIOR"] == ["Walking"]
+    assert data_map["Special Notes"] == ""
+
+
+def test_initial_data_of_v1_body(mock_annotation):
+    data = AnnotationDialog._get_initial_data(MagicMock(), mock_annotation)
+    assert {item["category"]: item["selectedValue"] for item in data}["PA TYPE"] == "Avoid"
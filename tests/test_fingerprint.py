@@ -0,0 +1,47 @@
+import os
+import pytest
+from src.fingerprint import FINGERPRINT_PREFIX, FingerprintCache, sampled_fingerprint
+
+@pytest.fixture
+def video(tmp_path):
+    path = tmp_path / "video.mp4"
+    path.write_bytes(bytes(range(256)) * 4096)
+    return path
+
+def test_fingerprint_depends_on_content_not_only_size(tmp_path, video):
+    other = tmp_path / "other.mp4"
+    data = bytearray(video.read_bytes())
+    data[0] ^= 0xFF
+    other.write_bytes(bytes(data))
+    assert os.path.getsize(other) == os.path.getsize(video)
+    assert sampled_fingerprint(str(video), block_size=1024).startswith(FINGERPRINT_PREFIX)
+    assert sampled_fingerprint(str(video), block_size=1024) != sampled_fingerprint(str(other), block_size=1024)
+
+def test_fingerprint_samples_head_middle_and_tail(tmp_path, video):
+    data = bytearray(video.read_bytes())
+    data[len(data) // 4] ^= 0xFF
+    unsampled = tmp_path / "unsampled.mp4"
+    unsampled.write_bytes(bytes(data))
+    assert sampled_fingerprint(str(video), block_size=1024) == sampled_fingerprint(str(unsampled), block_size=1024)
+
+def test_small_and_empty_files(tmp_path):
+    empty = tmp_path / "empty.mp4"
+    empty.write_bytes(b"")
+    small = tmp_path / "small.mp4"
+    small.write_bytes(b"abc")
+    assert sampled_fingerprint(str(empty)) != sampled_fingerprint(str(small))
+
+def test_cache_keyed_by_size_and_mtime(tmp_path, video, mocker):
+    cache = FingerprintCache(str(tmp_path / "cache.json"))
+    assert cache.get(str(video)) is None
+    fingerprint = cache.fingerprint(str(video))
+
+    compute = mocker.patch("src.fingerprint.sampled_fingerprint")
+    reloaded = FingerprintCache(str(tmp_path / "cache.json"))
+    assert reloaded.get(str(video)) == fingerprint
+    assert reloaded.fingerprint(str(video)) == fingerprint
+    compute.assert_not_called()
+
+    stat = os.stat(video)
+    os.utime(video, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert reloaded.get(str(video)) is None
@@ -0,0 +1,200 @@
+import csv
+import json
+import numpy as np
+import pytest
+from src.label_arrays import category_codes, covering_rows, export_label_matrix, iter_label_matrix
+from src.models import LABEL_CATEGORIES, TimelineAnnotation
+
+@pytest.fixture
+def annotations():
+    result = []
+    for start, end, posture, hlb in [(0, 1.5, "Sitting", ["Eating"]), (1.5, 2, "Standing", []),
+                                     (3, 4, "Sitting", ["Eating", "Reading"])]:
+        annotation = TimelineAnnotation(start_time=start, end_time=end)
+        annotation.update_comment_body(posture=posture, hlb=hlb)
+        result.append(annotation)
+    return result
+
+def test_category_codes(annotations):
+    starts, ends, columns = category_codes(annotations)
+    assert starts.tolist() == [0, 1.5, 3] and ends.tolist() == [1.5, 2, 4]
+    codes, values = columns["POSTURE"]
+    assert [values[code] for code in codes] == ["Sitting", "Standing", "Sitting"]
+    codes, values = columns["HIGH LEVEL BEHAVIOR"]
+    assert [values[code] for code in codes] == ["Eating", "", "Eating, Reading"]
+
+def test_covering_rows_uses_half_open_intervals():
+    starts, ends = np.array([0.0, 1.5, 3.0]), np.array([1.5, 2.0, 4.0])
+    times = np.array([-1, 0, 1.49, 1.5, 2.0, 2.5, 3.999, 4.0])
+    assert covering_rows(starts, ends, times).tolist() == [-1, 0, 0, 1, -1, -1, 2, -1]
+
+@pytest.fixture
+def overlapping():
+    result = []
+    for start, end, posture in [(0, 100, "Sitting"), (10, 20, "Standing"), (15, 30, "Lying")]:
+        annotation = TimelineAnnotation(start_time=start, end_time=end)
+        annotation.update_comment_body(posture=posture)
+        result.append(annotation)
+    return result
+
+def test_later_annotation_wins_where_annotations_overlap(overlapping):
+    from src.label_arrays import LabelIndex, visible_intervals
+    starts, ends, rows = visible_intervals(np.array([0.0, 10, 15]), np.array([100.0, 20, 30]))
+    assert list(zip(starts.tolist(), ends.tolist(), rows.tolist())) == [(0, 10, 0), (10, 15, 1), (15, 30, 2),
+                                                                       (30, 100, 0)]
+    times = np.array([5, 12, 17, 50, 100])
+    index = LabelIndex(overlapping)
+    assert index.rows_at(times).tolist() == [0, 1, 2, 0, -1]
+    assert index.decode("POSTURE", index.labels_at(times)["POSTURE"]).tolist() == [
+        "Sitting", "Standing", "Lying", "Sitting", ""]
+    assert covering_rows(index.starts, index.ends, times).tolist() == [0, 1, 2, 0, -1]
+    _, matrix = next(iter_label_matrix(overlapping, 1))
+    _, _, columns = category_codes(overlapping)
+    assert [columns["POSTURE"][1][code] for code in matrix[[5, 12, 17, 50], 0]] == [
+        "Sitting", "Standing", "Lying", "Sitting"]
+    assert len(matrix) == 100
+
+def test_matrix_matches_a_per_sample_lookup(annotations):
+    _, _, columns = category_codes(annotations)
+    chunks = list(iter_label_matrix(annotations, 4, chunk_size=3))
+    assert [len(times) for times, _ in chunks] == [3, 3, 3, 3, 3, 1]
+    times = np.concatenate([times for times, _ in chunks])
+    matrix = np.concatenate([matrix for _, matrix in chunks])
+    assert times.tolist() == [i / 4 for i in range(16)]
+    postures = columns["POSTURE"][1]
+    expected = []
+    for t in times:
+        match = [a for a in annotations if a.start_time <= t < a.end_time]
+        expected.append(match[0].labels.posture if match else "")
+    assert [postures[code] for code in matrix[:, 0]] == expected
+
+def test_rate_is_validated(annotations):
+    with pytest.raises(ValueError):
+        list(iter_label_matrix(annotations, 100))
+
+def test_export_formats(tmp_path, annotations):
+    categories = [category for category, _, _ in LABEL_CATEGORIES]
+    assert export_label_matrix(str(tmp_path / "m.csv"), annotations, 2, end=5) == 10
+    with open(tmp_path / "m.csv", newline='') as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == ["TIME"] + categories
+    assert rows[1][:3] == ["0.0", "Sitting", "Eating"]
+    assert rows[4][:2] == ["1.5", "Standing"]
+    assert rows[5][:2] == ["2.0", ""]
+    assert rows[7][:3] == ["3.0", "Sitting", "Eating, Reading"]
+
+    export_label_matrix(str(tmp_path / "m.npy"), annotations, 2, chunk_size=3)
+    matrix = np.load(tmp_path / "m.npy", mmap_mode='r')
+    sidecar = json.loads((tmp_path / "m_values.json").read_text())
+    assert matrix.shape == (8, len(categories))
+    assert sidecar["values"][0][matrix[6, 0]] == "Sitting"
+
+    export_label_matrix(str(tmp_path / "m.npz"), annotations, 2, chunk_size=3)
+    with np.load(tmp_path / "m.npz") as data:
+        assert (data["labels"] == matrix).all()
+        assert data["categories"].tolist() == categories
+        assert data["values"][1, data["labels"][7, 1]] == "Eating, Reading"
+        assert float(data["rate"]) == 2
+
+def test_day_at_80_hz_streams_in_chunks(tmp_path):
+    annotations = []
+    for i in range(0, 86400, 60):
+        annotation = TimelineAnnotation(start_time=i, end_time=i + 45)
+        annotation.update_comment_body(posture="Sitting")
+        annotations.append(annotation)
+    samples = export_label_matrix(str(tmp_path / "day.npy"), annotations, 80)
+    matrix = np.load(tmp_path / "day.npy", mmap_mode='r')
+    assert samples == matrix.shape[0] == (86400 - 15) * 80
+    assert matrix[80 * 30, 0] != 0 and matrix[80 * 50, 0] == 0
+
+def test_aggregate_epochs_matches_brute_force(annotations):
+    from src.label_arrays import aggregate_epochs
+    aggregation = aggregate_epochs(annotations, 1.25, end=4.5)
+    assert aggregation.starts.tolist() == [0, 1.25, 2.5, 3.75]
+    assert aggregation.durations.tolist() == [1.25, 1.25, 1.25, 0.75]
+    posture = aggregation["POSTURE"]
+    for i, (epoch_start, duration) in enumerate(zip(aggregation.starts, aggregation.durations)):
+        epoch_end = epoch_start + duration
+        seconds = {}
+        for a in annotations:
+            overlap = min(a.end_time, epoch_end) - max(a.start_time, epoch_start)
+            if overlap > 0:
+                seconds[a.labels.posture] = seconds.get(a.labels.posture, 0) + overlap
+        for code, value in enumerate(posture.values[1:], start=1):
+            assert posture.fractions[i, code] == pytest.approx(seconds.get(value, 0) / duration)
+        assert posture.unlabeled[i] == pytest.approx(1 - sum(seconds.values()) / duration)
+    assert posture.majority_labels() == ["Sitting", "Standing", "Sitting", ""]
+    assert aggregation["HIGH LEVEL BEHAVIOR"].majority_labels()[1] == ""
+
+def test_aggregate_epochs_category_without_labels(annotations):
+    from src.label_arrays import aggregate_epochs
+    aggregation = aggregate_epochs(annotations, 7.3, end=10.4)
+    assert aggregation.durations.tolist() == pytest.approx([7.3, 3.1])
+    situation = aggregation["Experimental situation"]
+    assert situation.coverage[:, 0].tolist() == pytest.approx([7.3, 3.1])
+    assert situation.unlabeled.tolist() == pytest.approx([1.0, 1.0])
+    assert situation.majority_labels() == ["", ""]
+
+def test_aggregate_epochs_resolves_overlaps(overlapping):
+    from src.label_arrays import aggregate_epochs
+    posture = aggregate_epochs(overlapping, 100)["POSTURE"]
+    assert posture.fractions.sum(axis=1).tolist() == pytest.approx([1.0])
+    fractions = dict(zip(posture.values, posture.fractions[0].tolist()))
+    assert fractions == pytest.approx({"": 0, "Sitting": 0.8, "Standing": 0.05, "Lying": 0.15})
+
+def test_export_epochs_csv(tmp_path, annotations):
+    from src.label_arrays import export_epochs
+    assert export_epochs(str(tmp_path / "epochs.csv"), annotations, 2) == 2
+    with open(tmp_path / "epochs.csv", newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert rows[0]["EPOCH_END"] == "2.0"
+    assert rows[0]["POSTURE MAJORITY"] == "Sitting"
+    assert float(rows[0]["POSTURE: Standing"]) == 0.25
+    assert float(rows[1]["POSTURE UNLABELED"]) == 0.5
+
+def test_week_aggregates_quickly():
+    import time
+    from src.annotation_store import AnnotationStore
+    from src.label_arrays import aggregate_epochs
+    annotations = []
+    for i in range(0, 7 * 86400, 37):
+        annotation = TimelineAnnotation(start_time=i, end_time=i + 30)
+        annotation.update_comment_body(posture=("Sitting", "Standing")[i % 2])
+        annotations.append(annotation)
+    store = AnnotationStore(annotations)
+    store.label_codes()
+    started = time.perf_counter()
+    aggregation = aggregate_epochs(store, 10)
+    assert time.perf_counter() - started < 0.5
+    assert len(aggregation) == 60480
+    assert aggregation["POSTURE"].coverage.sum() == pytest.approx(aggregation.durations.sum())
+
+def test_label_index_queries(annotations):
+    from src.label_arrays import LabelIndex
+    index = LabelIndex(annotations)
+    times = np.array([[0.5, 1.75], [2.5, 3.5]])
+    labels = index.labels_at(times, chunk_size=3)
+    assert labels["POSTURE"].shape == (2, 2)
+    assert index.decode("POSTURE", labels["POSTURE"]).tolist() == [["Sitting", "Standing"], ["", "Sitting"]]
+    assert index.decode("HIGH LEVEL BEHAVIOR", labels["HIGH LEVEL BEHAVIOR"][1]).tolist() == ["", "Eating, Reading"]
+    assert list(index.labels_at([1.0], categories=["PA TYPE"])) == ["PA TYPE"]
+    assert index.rows_at([3.5, 9]).tolist() == [2, -1]
+
+    columns = index.columns()
+    assert columns["id"] == [a.id for a in annotations]
+    assert columns["start"] is index.starts
+    assert index.values("POSTURE")[columns["POSTURE"][1]] == "Standing"
+
+def test_label_index_load(tmp_path, annotations):
+    from src.annotation_store import AnnotationStore
+    from src.label_arrays import LabelIndex
+    path = tmp_path / "labels.json"
+    path.write_text(json.dumps({"annotations": list(AnnotationStore(annotations).snapshot())}))
+    assert len(LabelIndex.load(str(path))) == 3
+
+def test_label_index_dataframe(annotations):
+    pd = pytest.importorskip("pandas")
+    from src.label_arrays import LabelIndex
+    frame = LabelIndex(annotations).to_dataframe()
+    assert list(frame["POSTURE"]) == ["Sitting", "Standing", "Sitting"]
+    assert isinstance(frame["POSTURE"].dtype, pd.CategoricalDtype)
@@ -2,8 +2,9 @@
 
 import pytest
 import json
+import uuid
 from datetime import datetime
-from src.models import TimelineAnnotation
+from src.models import AnnotationLabels, TimelineAnnotation
 
 def test_timeline_annotation_initialization():
     annotation = TimelineAnnotation()
@@ -89,3 +90,156 @@ def test_update_comment_body_with_defaults():
     assert any(item["category"] == "Behavioral Parameters" and item["selectedValue"] == [] for item in comment_data)
     assert any(item["category"] == "Experimental situation" and item["selectedValue"] == "" for item in comment_data)
     assert any(item["category"] == "Special Notes" and item["selectedValue"] == "" for item in comment_data)
+
+def test_labels_decoded_from_comment_body():
+    annotation = TimelineAnnotation()
+    annotation.update_comment_body(posture="Standing", hlb=["Walking", "Talking"])
+
+    labels = annotation.labels
+    assert labels.posture == "Standing"
+    assert labels.hlb == ("Walking", "Talking")
+    assert labels.pa_type == ""
+    assert annotation.labels is labels
+
+def test_labels_follow_replaced_comments():
+    annotation = TimelineAnnotation()
+    annotation.update_comment_body(posture="Standing")
+    body = json.dumps([{"category": "POSTURE", "selectedValue": "Sitting"}])
+    annotation.comments = [{"id": "c1", "meta": {}, "body": body}]
+    assert annotation.labels.posture == "Sitting"
+
+    annotation.comments = [{"id": "c1", "meta": {}, "body": "not json"}]
+    assert annotation.labels == AnnotationLabels()
+
+def test_irregular_comment_lists_kept_as_given():
+    annotation = TimelineAnnotation()
+    comments = [{"body": json.dumps([{"category": "POSTURE", "selectedValue": "Sitting"}])}]
+    annotation.comments = comments
+    assert annotation.comments is comments
+    assert annotation.labels.posture == "Sitting"
+    annotation.update_comment_body(posture="Standing")
+    assert "Standing" in comments[0]["body"]
+
+def test_annotation_records_are_slotted():
+    annotation = TimelineAnnotation()
+    assert not hasattr(annotation, "__dict__")
+    annotation.shape = {"x1": None, "x2": None, "y1": None, "y2": None}
+    assert annotation.shape == {"x1": None, "x2": None, "y1": None, "y2": None}
+
+def test_labels_shared_with_copied_comments():
+    source = TimelineAnnotation()
+    source.update_comment_body(posture="Standing", hlb=["Walking"])
+    target = TimelineAnnotation()
+    target.copy_comments_from(source)
+    assert target.labels is source.labels
+
+def test_label_codes_round_trip():
+    annotation = TimelineAnnotation()
+    annotation.update_comment_body(posture="In_Position_Sitting", hlb=["Cleaning", "Cooking/Prepping_Food"])
+    codes = annotation.labels.codes
+    assert codes.posture != 0
+    assert len(codes.hlb) == 2
+    assert AnnotationLabels.from_codes(codes) == annotation.labels
+
+def test_merge_key_ignores_hlb_order():
+    first = AnnotationLabels(posture="In_Position_Sitting", hlb=("Cleaning", "Bathing_Pet"))
+    second = AnnotationLabels(posture="In_Position_Sitting", hlb=("Bathing_Pet", "Cleaning"), special_notes="x")
+    assert first.merge_key == second.merge_key
+
+def test_from_record():
+    body = json.dumps([{"category": "POSTURE", "selectedValue": "Sitting"}])
+    record = {
+        "id": "ann-1",
+        "range": {"start": 5, "end": 9},
+        "shape": {"x1": None, "x2": None, "y1": None, "y2": None},
+        "comments": [{"id": "c1", "meta": {"datetime": "2024-01-01T00:00:00", "user_id": "NA", "user_name": "NA"}, "body": body}]
+    }
+    annotation = TimelineAnnotation.from_record(record)
+
+    assert annotation.id == "ann-1"
+    assert (annotation.start_time, annotation.end_time) == (5, 9)
+    assert annotation.comments == record["comments"]
+    assert annotation.labels.posture == "Sitting"
+
+def test_from_records_rejects_incomplete_records():
+    with pytest.raises(KeyError):
+        TimelineAnnotation.from_records([{"id": "ann-1"}])
+
+def test_ids_generated_on_first_use(mocker):
+    uuid4 = mocker.spy(uuid, "uuid4")
+    annotation = TimelineAnnotation(start_time=1, end_time=2)
+    assert uuid4.call_count == 0
+    first_id = annotation.id
+    assert annotation.id == first_id
+    assert uuid4.call_count == 1
+
+def test_to_record_cached_until_changed():
+    annotation = TimelineAnnotation(start_time=1, end_time=2)
+    record = annotation.to_record()
+    assert annotation.to_record() is record
+    assert TimelineAnnotation.from_record(record).to_record() == record
+    annotation.update_comment_body(posture="Sitting")
+    assert annotation.to_record() is not record
+    assert annotation.to_record()["comments"][0]["labels"]["POSTURE"] == "Sitting"
+    assert annotation.to_record(version=1)["comments"][0]["body"] == annotation.body
+
+def test_v2_record_round_trip_without_body_encoding(mocker):
+    annotation = TimelineAnnotation(start_time=1, end_time=2)
+    annotation.update_comment_body(posture="Sitting", hlb=["Cleaning", "Eating"])
+    record = annotation.to_record()
+    assert "body" not in record["comments"][0]
+    assert record["comments"][0]["labels"]["HIGH LEVEL BEHAVIOR"] == ["Cleaning", "Eating"]
+
+    encode = mocker.spy(AnnotationLabels, "to_body")
+    restored = TimelineAnnotation.from_record(json.loads(json.dumps(record)))
+    assert restored.labels == annotation.labels
+    assert restored.to_record() == record
+    encode.assert_not_called()
+    # v1 output and v1 input still work
+    v1 = restored.to_record(version=1)
+    assert json.loads(v1["comments"][0]["body"])[0] == {"category": "POSTURE", "selectedValue": "Sitting"}
+    assert TimelineAnnotation.from_record(v1).labels == annotation.labels
+
+def test_to_record_copies_raw_comments():
+    annotation = TimelineAnnotation()
+    annotation.comments = [{"body": "x"}, {"body": "y"}]
+    record = annotation.to_record()
+    annotation.comments[0]["body"] = "z"
+    assert record["comments"][0]["body"] == "x"
+
+def test_copy_raw_v2_comments():
+    source = TimelineAnnotation.from_record({"id": "a", "range": {"start": 0, "end": 1}, "comments": [
+        {"id": "c1", "labels": {"POSTURE": "Sitting"}},
+        {"id": "c2", "meta": {"author": "x"}, "labels": {"POSTURE": "Standing"}}]})
+    target = TimelineAnnotation()
+    target.copy_comments_from(source)
+    assert [comment["meta"] for comment in target.comments] == [{}, {"author": "x"}]
+    assert target.labels.posture == "Sitting"
+
+def test_raw_v2_comments_written_as_v1_bodies():
+    annotation = TimelineAnnotation.from_record({"id": "a", "range": {"start": 0, "end": 1}, "comments": [
+        {"id": "c1", "labels": {"POSTURE": "Sitting"}},
+        {"id": "c2", "meta": {}, "labels": {"POSTURE": "Standing"}}]})
+    comments = annotation.to_record(version=1)["comments"]
+    assert all("labels" not in comment for comment in comments)
+    assert [AnnotationLabels.from_body(comment["body"]).posture for comment in comments] == ["Sitting", "Standing"]
+    assert "labels" in annotation.to_record()["comments"][0]
+
+def test_special_notes_stay_out_of_shared_tables():
+    import gc
+    from src.models import _INTERNED_LABELS
+    from src.vocabulary import get_vocabulary
+    vocabulary_size = len(get_vocabulary().values("Special Notes"))
+    annotations = []
+    for i in range(100):
+        annotation = TimelineAnnotation()
+        annotation.update_comment_body(posture="In_Position_Sitting", special_notes=f"note {i}")
+        annotations.append(annotation)
+    codes = annotations[7].labels.codes
+    assert codes.special_notes == "note 7"
+    assert AnnotationLabels.from_codes(codes) == annotations[7].labels
+    assert len(get_vocabulary().values("Special Notes")) == vocabulary_size
+
+    del annotations, annotation, codes
+    gc.collect()
+    assert not [labels for labels in _INTERNED_LABELS.values() if labels.special_notes.startswith("note ")]
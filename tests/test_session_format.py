@@ -0,0 +1,69 @@
+import json
+import pytest
+from src.annotation_store import AnnotationStore
+from src.models import TimelineAnnotation
+from src.session_format import (FragmentCache, decode_session, dumps_session, encode_session,
+                                 is_binary_session, load_session, loads_session)
+
+@pytest.fixture
+def session():
+    annotations = []
+    for i, posture in enumerate(["Sitting", "Standing", "Sitting"]):
+        annotation = TimelineAnnotation(start_time=i * 10.5, end_time=i * 10.5 + 3.25)
+        annotation.update_comment_body(posture=posture, hlb=["Cleaning"])
+        annotations.append(annotation)
+    odd = TimelineAnnotation(start_time=40, end_time=41)
+    odd.comments = [{"body": "free text"}, {"body": "second"}]
+    odd.shape = {"x1": 1, "x2": 2, "y1": 3, "y2": 4}
+    annotations.append(odd)
+    return {
+        "annotations": list(AnnotationStore(annotations).snapshot()),
+        "videoHash": "sfp1-abc",
+        "video_path": "/videos/a.mp4"
+    }
+
+def test_binary_round_trip(session):
+    content = encode_session(session)
+    assert is_binary_session(content)
+    assert decode_session(content) == json.loads(json.dumps(session))
+
+def test_uncompressed_round_trip(session):
+    assert decode_session(encode_session(session, compress=False)) == session
+
+def test_binary_smaller_than_json(session):
+    session["annotations"] = session["annotations"] * 200
+    assert len(encode_session(session)) * 5 < len(dumps_session(session))
+
+def test_loads_detects_format(session, tmp_path):
+    assert loads_session(dumps_session(session)) == loads_session(dumps_session(session, binary=True))
+    path = tmp_path / "labels.paaws"
+    path.write_bytes(dumps_session(session, binary=True))
+    assert load_session(str(path))["video_path"] == "/videos/a.mp4"
+
+def test_truncated_file_rejected(session):
+    content = encode_session(session, compress=False)
+    with pytest.raises(ValueError):
+        decode_session(content[:len(content) // 2])
+
+def test_v1_records_round_trip(session):
+    v1 = dict(session, annotations=[TimelineAnnotation.from_record(record).to_record(version=1)
+                                    for record in session["annotations"]])
+    assert "body" in v1["annotations"][0]["comments"][0]
+    assert decode_session(encode_session(v1)) == json.loads(json.dumps(v1))
+
+@pytest.mark.parametrize("indent", [None, 4])
+def test_fragment_cache_matches_json_dumps(session, indent):
+    fragments = FragmentCache(indent=indent)
+    expected = json.dumps(session, indent=indent).encode('utf-8')
+    assert dumps_session(session, indent=indent, fragments=fragments) == expected
+    assert dumps_session(dict(session, annotations=[]), fragments=fragments) == \
+        json.dumps(dict(session, annotations=[]), indent=indent).encode('utf-8')
+
+def test_fragment_cache_reserializes_only_changed_records():
+    store = AnnotationStore([TimelineAnnotation(start_time=i, end_time=i + 1) for i in range(3)])
+    fragments = FragmentCache()
+    first = fragments.fragments(store.snapshot())
+    store[1].update_comment_body(posture="Sitting")
+    second = fragments.fragments(store.snapshot())
+    assert second[0] is first[0] and second[2] is first[2]
+    assert second[1] is not first[1] and "Sitting" in second[1]
@@ -103,4 +103,165 @@ def test_autosave_decorator():
     instance = DummyClass(mock_app)
     
     instance.mock_method()
-    mock_app.autosave.assert_called_once()
\ No newline at end of file
+    mock_app.autosave.assert_called_once()
+
+def test_save_annotations_async_writes_latest_snapshot(manager, video_file):
+    from src.annotation_store import AnnotationStore
+    from src.models import TimelineAnnotation
+    store = AnnotationStore([TimelineAnnotation(start_time=0, end_time=10)])
+    manager.save_annotations_async(video_file, store, video_hash=1)
+    store.append(TimelineAnnotation(start_time=10, end_time=20))
+    manager.save_annotations_async(video_file, store, video_hash=2)
+    # Changes after the call are not part of the queued snapshot
+    store[0].end_time = 5
+    assert manager.flush(timeout=5)
+
+    data, hash_matches = manager.check_for_autosave(video_file, 2)
+    assert hash_matches is True
+    assert [ann['range'] for ann in data['annotations']] == [
+        {"start": 0, "end": 10}, {"start": 10, "end": 20}]
+
+def test_delete_autosave_drops_queued_write(manager, video_file):
+    manager.save_annotations_async(video_file, [])
+    manager.delete_autosave(video_file)
+    assert manager.flush(timeout=5)
+    assert not os.path.exists(manager.autosave_path(video_file))
+
+def test_journal_records_edits_and_replays(manager, video_file):
+    from src.annotation_store import AnnotationStore
+    from src.models import TimelineAnnotation
+    store = AnnotationStore([TimelineAnnotation(start_time=0, end_time=10),
+                             TimelineAnnotation(start_time=10, end_time=20)])
+    manager.save_annotations_async(video_file, store)
+    manager.flush()
+    snapshot_size = os.path.getsize(manager.autosave_path(video_file))
+
+    # Split the first annotation, relabel the second
+    store[0].end_time = 5
+    store.append(TimelineAnnotation(start_time=5, end_time=10))
+    store[2].update_comment_body(posture="Sitting")
+    manager.save_annotations_async(video_file, store)
+    manager.flush()
+    assert os.path.getsize(manager.autosave_path(video_file)) == snapshot_size
+    with open(manager.journal_path(video_file)) as f:
+        ops = [json.loads(line)["op"] for line in f.readlines()[1:]]
+    assert sorted(ops) == ["create", "relabel", "resize"]
+
+    store.remove(store[1])
+    manager.save_annotations_async(video_file, store)
+    manager.flush()
+    data, _ = manager.check_for_autosave(video_file, 0)
+    assert data["annotations"] == list(store.snapshot())
+
+def test_journal_compaction(manager, video_file):
+    from src.annotation_store import AnnotationStore
+    from src.models import TimelineAnnotation
+    store = AnnotationStore([TimelineAnnotation(start_time=0, end_time=10)])
+    manager.save_annotations_async(video_file, store)
+    store[0].end_time = 8
+    manager.save_annotations_async(video_file, store, compact=True)
+    manager.flush()
+    with open(manager.journal_path(video_file)) as f:
+        assert len(f.readlines()) == 1
+    data, _ = manager.check_for_autosave(video_file, 0)
+    assert data["annotations"][0]["range"]["end"] == 8
+
+def test_stale_or_torn_journal_ignored(manager, video_file):
+    from src.models import TimelineAnnotation
+    annotation = TimelineAnnotation(start_time=0, end_time=10)
+    manager.save_annotations(video_file, [annotation])
+    with open(manager.journal_path(video_file), 'a') as f:
+        f.write(json.dumps({"op": "resize", "id": annotation.id, "range": {"start": 0, "end": 4}}) + "\n")
+        f.write('{"op": "delete", "id"')
+    data, _ = manager.check_for_autosave(video_file, 0)
+    assert data["annotations"][0]["range"]["end"] == 4
+
+    with open(manager.journal_path(video_file), 'w') as f:
+        f.write(json.dumps({"journal": "older"}) + "\n")
+        f.write(json.dumps({"op": "delete", "id": annotation.id}) + "\n")
+    data, _ = manager.check_for_autosave(video_file, 0)
+    assert len(data["annotations"]) == 1
+
+def test_fingerprint_and_legacy_hash_matching(manager, video_file):
+    fingerprint = manager.calculate_video_fingerprint(video_file)
+    assert manager.cached_video_fingerprint(video_file) == fingerprint
+    assert manager.hash_matches(fingerprint, fingerprint, video_file)
+    # Files saved with the old size hash are still recognised
+    legacy_hash = manager.calculate_video_hash(video_file)
+    assert manager.hash_matches(legacy_hash, fingerprint, video_file)
+    assert not manager.hash_matches(legacy_hash + 1, fingerprint, video_file)
+
+    manager.save_annotations(video_file, [], video_hash=legacy_hash)
+    _, hash_matches = manager.check_for_autosave(video_file, fingerprint)
+    assert hash_matches is True
+
+def test_fingerprint_computed_in_background(manager, video_file):
+    import threading
+    done = threading.Event()
+    results = []
+    def callback(path, fingerprint):
+        results.append((path, fingerprint, threading.current_thread() is threading.main_thread()))
+        done.set()
+    manager.calculate_video_fingerprint_async(video_file, callback)
+    assert done.wait(5)
+    assert results == [(video_file, manager.calculate_video_fingerprint(video_file), False)]
+
+def test_snapshots_kept_as_versions(manager, video_file):
+    from src.models import TimelineAnnotation
+    manager.save_annotations(video_file, [TimelineAnnotation(start_time=0, end_time=10)])
+    manager.save_annotations(video_file, [])
+    data, _ = manager.check_for_autosave(video_file, 0)
+    assert data["annotations"] == []
+    assert [version["count"] for version in data["versions"]] == [0, 1]
+
+    older = manager.load_autosave_version(data["versions"][1]["digest"])
+    assert older["annotations"][0]["range"] == {"start": 0, "end": 10}
+
+    # A damaged autosave falls back to the newest version
+    with open(manager.autosave_path(video_file), 'w') as f:
+        f.write("{")
+    data, _ = manager.check_for_autosave(video_file, 0)
+    assert data is not None and data["annotations"] == []
+
+def test_binary_autosave_round_trip(manager, video_file):
+    from src.models import TimelineAnnotation
+    from src.session_format import is_binary_session
+    annotation = TimelineAnnotation(start_time=1, end_time=2)
+    annotation.update_comment_body(posture="Sitting")
+    manager.binary_sessions = True
+    manager.save_annotations(video_file, [annotation], video_hash=7)
+    with open(manager.autosave_path(video_file), 'rb') as f:
+        assert is_binary_session(f.read())
+    data, hash_matches = manager.check_for_autosave(video_file, 7)
+    assert hash_matches is True
+    assert data["annotations"] == [annotation.to_record()]
+    assert manager.load_autosave_version(data["versions"][0]["digest"])["annotations"] == data["annotations"]
+
+def test_database_autosave(manager, video_file):
+    from src.annotation_store import AnnotationStore
+    from src.models import TimelineAnnotation
+    manager.use_database(True)
+    store = AnnotationStore([TimelineAnnotation(start_time=0, end_time=10)])
+    manager.save_annotations_async(video_file, store, video_hash=3)
+    store[0].update_comment_body(posture="Sitting")
+    store.append(TimelineAnnotation(start_time=10, end_time=12))
+    manager.save_annotations_async(video_file, store, video_hash=3)
+    manager.flush()
+    assert not os.path.exists(manager.autosave_path(video_file))
+
+    data, hash_matches = manager.check_for_autosave(video_file, 3)
+    assert hash_matches is True
+    assert [TimelineAnnotation.from_record(record).labels for record in data["annotations"]] == [a.labels for a in store]
+    manager.delete_autosave(video_file)
+    assert manager.check_for_autosave(video_file, 3) == (None, False)
+    manager.use_database(False)
+
+def test_save_annotations_reports_failed_database_write(manager, video_file, monkeypatch):
+    from src.models import TimelineAnnotation
+    manager.use_database(True)
+    annotations = [TimelineAnnotation(start_time=0, end_time=10)]
+    assert manager.save_annotations(video_file, annotations, video_hash=3) is True
+    monkeypatch.setattr(manager.database, "write", MagicMock(side_effect=OSError("disk full")))
+    annotations.append(TimelineAnnotation(start_time=10, end_time=12))
+    assert manager.save_annotations(video_file, annotations, video_hash=3) is False
+    manager.use_database(False)
@@ -1,8 +1,12 @@
+import json
 import pytest
 from unittest.mock import MagicMock
+from zipfile import ZipFile
 
 from PyQt6.QtCore import QUrl
 from PyQt6.QtWidgets import QWidget
+import src.video_player
+from src.models import TimelineAnnotation
 from src.video_player import VideoPlayerApp
 
 @pytest.fixture
@@ -118,4 +122,65 @@ def test_delegation_to_annotation_manager(app):
     app.annotation_manager.deleteCurrentLabel.assert_called_once()
     
     app.mergeWithNext()
-    app.annotation_manager.mergeWithNext.assert_called_once()
\ No newline at end of file
+    app.annotation_manager.mergeWithNext.assert_called_once()
+
+
+def test_autosave_coalesces_and_skips_unchanged_state(app):
+    app.current_video_path = "/fake/path/video.mp4"
+    app.annotations = [TimelineAnnotation(start_time=0, end_time=5)]
+
+    app.autosave()
+    app.autosave()
+    assert app.autosave_debounce_timer.isActive()
+    app.autosave_manager.save_annotations_async.assert_not_called()
+
+    app._write_autosave()
+    assert app.autosave_manager.save_annotations_async.call_count == 1
+    app.autosave()
+    assert not app.autosave_debounce_timer.isActive()
+
+    app.annotations[0].end_time = 4
+    app.autosave()
+    assert app.autosave_debounce_timer.isActive()
+    app.close()
+    assert app.autosave_manager.save_annotations_async.call_count == 2
+    app.autosave_manager.flush.assert_called()
+
+
+def test_load_annotations_runs_in_background_and_reports_skipped(app, qtbot, monkeypatch, tmp_path):
+    path = tmp_path / "labels.json"
+    path.write_text(json.dumps({"annotations": [
+        {"id": "a", "range": {"start": 0, "end": 1}, "comments": []},
+        {"id": "b"}
+    ], "videoHash": 0}))
+    app.current_video_path = None
+    message_box = MagicMock()
+    monkeypatch.setattr("src.video_player.QMessageBox", message_box)
+    src.video_player.QFileDialog.getOpenFileName.return_value = (str(path), "")
+
+    with qtbot.waitSignal(app.annotationsLoaded, timeout=5000):
+        app.loadAnnotations()
+    assert [a.id for a in app.annotations] == ["a"]
+    message_box.warning.assert_called_once()
+    assert "1 record(s)" in message_box.warning.call_args[0][2]
+
+
+@pytest.mark.parametrize("saved, pending", [(False, None), (True, "/fake/path/video.mp4")])
+def test_sqlite_export_falls_back_to_memory(app, monkeypatch, tmp_path, saved, pending):
+    path = tmp_path / "export.zip"
+    src.video_player.QFileDialog.getSaveFileName.return_value = (str(path), "")
+    monkeypatch.setattr("src.video_player.QMessageBox", MagicMock())
+    app.current_video_path = "/fake/path/video.mp4"
+    app._fingerprint_pending = pending
+    app.annotations = [TimelineAnnotation(start_time=0, end_time=5)]
+    app.autosave_manager.save_annotations.return_value = saved
+    for action in (app.sqlite_storage_action, app.legacy_labels_action, app.binary_sessions_action):
+        action.blockSignals(True)
+        action.setChecked(action is app.sqlite_storage_action)
+
+    app.saveAnnotations()
+    assert (app.autosave_manager.save_annotations.called) == (pending is None)
+    app.autosave_manager.database.write_labels_json.assert_not_called()
+    with ZipFile(path) as zipf:
+        records = json.loads(zipf.read("labels.json"))["annotations"]
+    assert [record["id"] for record in records] == [app.annotations[0].id]
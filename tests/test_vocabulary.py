@@ -0,0 +1,27 @@
+from src.vocabulary import LabelVocabulary, get_vocabulary
+
+def test_encode_decode_round_trip():
+    vocabulary = LabelVocabulary({"POSTURE": ["Sitting", "Standing"]})
+    assert vocabulary.encode("POSTURE", "") == 0
+    assert vocabulary.encode("POSTURE", "Sitting") == 1
+    assert vocabulary.encode("POSTURE", "Standing") == 2
+    assert vocabulary.decode("POSTURE", 2) == "Standing"
+    assert vocabulary.decode("POSTURE", 0) == ""
+
+def test_unknown_values_are_appended():
+    vocabulary = LabelVocabulary({"POSTURE": ["Sitting"]})
+    code = vocabulary.encode("POSTURE", "Kneeling")
+    assert code == 2
+    assert vocabulary.encode("POSTURE", "Kneeling") == code
+    assert vocabulary.encode_many("Special Notes", ["a", "b", "a"]) == (1, 2, 1)
+
+def test_is_unlabeled():
+    vocabulary = LabelVocabulary({"PA TYPE": ["Walking", "PA_Type_Unlabeled"]})
+    assert vocabulary.is_unlabeled("PA TYPE", 0)
+    assert vocabulary.is_unlabeled("PA TYPE", vocabulary.encode("PA TYPE", "PA_Type_Unlabeled"))
+    assert not vocabulary.is_unlabeled("PA TYPE", vocabulary.encode("PA TYPE", "Walking"))
+
+def test_shared_vocabulary_loads_categories_csv():
+    vocabulary = get_vocabulary()
+    assert vocabulary is get_vocabulary()
+    assert "In_Position_Sitting" in vocabulary.values("POSTURE")
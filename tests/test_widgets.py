@@ -4,6 +4,8 @@ from unittest.mock import MagicMock
 
 from PyQt6.QtCore import Qt, QPoint
 from PyQt6.QtWidgets import QWidget
+from src.annotation_store import AnnotationStore
+from src.models import TimelineAnnotation
 from src.widgets import TimelineWidget
 
 class MockAnnotation:
@@ -78,3 +80,77 @@ def test_drag_zoom_handle(qtbot, main_timeline, mock_app):
     qtbot.mouseMove(main_timeline, pos=QPoint(drag_to_x, 30))
     qtbot.mouseRelease(main_timeline, Qt.MouseButton.LeftButton, pos=QPoint(drag_to_x, 30))
     assert mock_app.zoom_end == pytest.approx(0.5)
+
+def _count_layer_draws(widget, monkeypatch):
+    calls = []
+    draw = widget._draw_annotations
+
+    def counting(painter, annotations, duration):
+        calls.append(duration)
+        draw(painter, annotations, duration)
+    monkeypatch.setattr(widget, '_draw_annotations', counting)
+    return calls
+
+def test_annotation_layer_cached_across_position_updates(main_timeline, mock_app, monkeypatch):
+    mock_app.annotations = AnnotationStore([TimelineAnnotation(10, 20), TimelineAnnotation(30, 45)])
+    calls = _count_layer_draws(main_timeline, monkeypatch)
+    main_timeline.grab()
+    for position in range(0, 60000, 1000):
+        mock_app.media_player['_position'] = position
+        main_timeline.grab()
+    assert len(calls) == 1
+
+    mock_app.zoom_start, mock_app.zoom_end = 0.2, 0.4
+    main_timeline.grab()
+    assert len(calls) == 1
+
+    mock_app.annotations.append(TimelineAnnotation(50, 55))
+    main_timeline.grab()
+    assert len(calls) == 2
+
+    mock_app.annotations[0].end_time = 25
+    main_timeline.grab()
+    assert len(calls) == 3
+
+    main_timeline.resize(400, 60)
+    main_timeline.grab()
+    assert len(calls) == 4
+
+def test_zoomed_layer_redrawn_when_window_moves(zoomed_timeline, mock_app, monkeypatch):
+    mock_app.annotations = AnnotationStore([TimelineAnnotation(10, 20)])
+    mock_app.zoom_start, mock_app.zoom_end = 0.0, 0.1
+    calls = _count_layer_draws(zoomed_timeline, monkeypatch)
+    zoomed_timeline.grab()
+    mock_app.media_player['_position'] = 5000
+    zoomed_timeline.grab()
+    assert len(calls) == 1
+
+    # 60 s over 800 px: a shift well under a pixel reuses the layer
+    mock_app.zoom_start, mock_app.zoom_end = 0.00001, 0.10001
+    zoomed_timeline.grab()
+    assert len(calls) == 1
+
+    mock_app.zoom_start, mock_app.zoom_end = 0.05, 0.15
+    zoomed_timeline.grab()
+    assert len(calls) == 2
+
+def test_plain_annotation_lists_drawn_every_paint(main_timeline, mock_app, monkeypatch):
+    mock_app.annotations = [TimelineAnnotation(10, 20)]
+    calls = _count_layer_draws(main_timeline, monkeypatch)
+    main_timeline.grab()
+    main_timeline.grab()
+    assert len(calls) == 2
+
+def test_zoomed_timeline_draws_only_visible_annotations(zoomed_timeline, mock_app, monkeypatch):
+    mock_app.annotations = AnnotationStore([TimelineAnnotation(i * 10, i * 10 + 8) for i in range(60)])
+    mock_app.zoom_start, mock_app.zoom_end = 0.1, 0.2
+    coords = []
+    screen_coords = zoomed_timeline._get_annotation_screen_coords
+
+    def recording(annotation, duration):
+        coords.append(annotation.start_time)
+        return screen_coords(annotation, duration)
+    monkeypatch.setattr(zoomed_timeline, '_get_annotation_screen_coords', recording)
+    zoomed_timeline.grab()
+    # 60 s to 120 s: the annotation from 50 s to 58 s ends before the window
+    assert coords == [i * 10 for i in range(6, 13)]